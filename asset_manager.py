@@ -0,0 +1,120 @@
+import os
+import threading
+
+import pygame
+
+# Images and sounds are decoded once per path, ahead of time on a worker thread when
+# they are queued with preload(). Surfaces are converted to the display format on first
+# use, on the main thread (convert needs the display). Images found in an asset pack
+# (asset_pack.AssetPack) are read from it instead of decoded.
+
+QUEUED = 0
+LOADING = 1
+DONE = 2
+
+SOUND_EXTENSIONS = (".wav", ".ogg", ".mp3")
+
+
+def decode(path):
+    """Image or sound of a file, by extension"""
+    if os.path.splitext(path)[1].lower() in SOUND_EXTENSIONS:
+        return pygame.mixer.Sound(path)
+    return pygame.image.load(path)
+
+
+class AssetManager:
+    """Load each asset file once, optionally in the background"""
+    def __init__(self, pack=None):
+        self.pack = pack  # asset_pack.AssetPack or None
+        self.images = {}  # (path, alpha) -> converted Surface
+        self.sounds = {}  # path -> Sound
+        self.decoded = {}  # path -> Surface or Sound decoded by the worker, not taken yet
+        self.states = {}  # path -> QUEUED, LOADING or DONE
+        self.condition = threading.Condition()
+        self.queue = []  # Paths for the worker, in order
+        self.worker = None
+
+    def preload(self, paths):
+        """Decode files in the background, in the given order, after the ones already queued"""
+        with self.condition:
+            for path in paths:
+                if path not in self.states:
+                    self.states[path] = QUEUED
+                    self.queue.append(path)
+            if self.worker is None and self.queue:
+                self.worker = threading.Thread(target=self.work)
+                self.worker.daemon = True
+                self.worker.start()
+
+    def work(self):
+        """Worker thread: decode the queued files"""
+        while True:
+            with self.condition:
+                if not self.queue:
+                    self.worker = None
+                    return
+                path = self.queue.pop(0)
+                if self.states[path] != QUEUED:
+                    continue  # Already loaded on demand
+                self.states[path] = LOADING
+            asset = None
+            try:
+                asset = self.decode(path)
+            except Exception as e:
+                # Reported when the asset is used, load() decodes it again and raises
+                print(f"Error preloading {path}: {e}")
+            with self.condition:
+                if asset is not None:
+                    self.decoded[path] = asset
+                self.states[path] = DONE
+                self.condition.notify_all()
+
+    def decode(self, path):
+        """Image or sound of a file, or image of the asset pack"""
+        if self.pack is not None and path in self.pack:
+            return self.pack.image(path)
+        return decode(path)
+
+    def is_loaded(self, path):
+        """True once a file can be used without decoding it"""
+        with self.condition:
+            return self.states.get(path) == DONE
+
+    def progress(self, paths):
+        """Fraction of the files decoded"""
+        with self.condition:
+            done = sum(1 for path in paths if self.states.get(path) == DONE)
+        return done / len(paths) if paths else 1.0
+
+    def load(self, path):
+        """Decoded asset, from the worker or decoded now if the worker has not started it"""
+        with self.condition:
+            while self.states.get(path) == LOADING:
+                self.condition.wait()
+            if path in self.decoded:
+                return self.decoded.pop(path)
+            self.states[path] = LOADING  # The worker skips it
+        try:
+            return self.decode(path)
+        finally:
+            with self.condition:
+                self.states[path] = DONE
+                self.condition.notify_all()
+
+    def image(self, path, alpha=True):
+        """Surface of an image file in the display format (with per-pixel alpha unless alpha is False)"""
+        surface = self.images.get((path, alpha))
+        if surface is None:
+            # The other variant may already hold the decoded file
+            other = self.images.get((path, not alpha))
+            raw = other if other is not None else self.load(path)
+            surface = raw.convert_alpha() if alpha else raw.convert()
+            self.images[(path, alpha)] = surface
+        return surface
+
+    def sound(self, path):
+        """Sound of a file, one object shared by every user"""
+        sound = self.sounds.get(path)
+        if sound is None:
+            sound = self.sounds[path] = self.load(path)
+        return sound
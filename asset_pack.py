@@ -0,0 +1,197 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+import pygame
+
+import characters
+import fighter
+from framebuffer import LOW_RES_SCALE
+
+# Pre-baked images. `python asset_pack.py` decodes the images the client uses, cuts and
+# scales the animation frames of every character once, and writes their raw pixels to one
+# file. The client maps that file and builds surfaces straight from it, without decoding
+# or scaling anything. Pixels are stored cropped to their visible area, once per content
+# (sha1), so identical images share one copy.
+#
+# Layout: HEADER, JSON index, pixel data. The index maps each image name to its size,
+# pixel format, the area its stored pixels cover, and its blob (offset and length in the
+# pixel data).
+
+PACK_PATH = "assets/assets.pack"
+MAGIC = b"BRAWLPK1"
+HEADER = struct.Struct("!8sI")  # magic, length of the index
+IMAGES = ["assets/images/background/background.jpg", "assets/images/icons/victory.png"]
+RENDER_SCALES = (1, LOW_RES_SCALE)  # Frames for the window and for the low-res framebuffer
+
+
+def frame_name(sheet, size, image_scale, action, index):
+    """Name of an animation frame of a sprite sheet, as cut by fighter.load_frames"""
+    return f"{sheet}#{size}x{image_scale:g}/{action}/{index}"
+
+
+def portrait_name(sheet):
+    """Name of the first cell of a sprite sheet, unscaled (character selection screen)"""
+    return f"{sheet}#portrait"
+
+
+class PackBuilder:
+    """Images of a pack being built, see build_pack"""
+    def __init__(self):
+        self.images = {}  # name -> index entry
+        self.blobs = {}  # sha1 -> pixels
+        self.sources = {}  # file -> [size, mtime] when read
+
+    def add_source(self, path):
+        stat = os.stat(path)
+        self.sources[path] = [stat.st_size, stat.st_mtime_ns]
+
+    def add(self, name, surface, source):
+        """Store a surface, only the area of its visible pixels if it has alpha"""
+        alpha = surface.get_flags() & pygame.SRCALPHA
+        pixel_format = "RGBA" if alpha else "RGB"
+        rect = surface.get_bounding_rect() if alpha else surface.get_rect()
+        pixels = pygame.image.tobytes(surface.subsurface(rect), pixel_format) if rect.width and rect.height else b""
+        digest = hashlib.sha1(pixels).hexdigest()
+        self.blobs.setdefault(digest, pixels)
+        self.images[name] = {"size": surface.get_size(), "format": pixel_format, "rect": tuple(rect),
+                             "blob": digest, "source": source}
+
+    def write(self, path):
+        blobs = {}
+        offset = 0
+        for digest, pixels in self.blobs.items():
+            blobs[digest] = [offset, len(pixels)]
+            offset += len(pixels)
+        index = json.dumps({"images": self.images, "blobs": blobs, "sources": self.sources}).encode()
+        with open(path, "wb") as pack_file:
+            pack_file.write(HEADER.pack(MAGIC, len(index)))
+            pack_file.write(index)
+            for pixels in self.blobs.values():
+                pack_file.write(pixels)
+        return offset
+
+
+def build_pack(path=PACK_PATH):
+    """Write the pack of the images used by the client, returns (images, blobs, pixel bytes)"""
+    builder = PackBuilder()
+    for image_path in IMAGES:
+        builder.add_source(image_path)
+        builder.add(image_path, pygame.image.load(image_path), image_path)
+
+    for char in characters.CHARACTERS:
+        sheet_path = char["sheet"]
+        size, image_scale = char["data"][0], char["data"][1]
+        builder.add_source(sheet_path)
+        sheet = pygame.image.load(sheet_path)
+        builder.add(portrait_name(sheet_path), sheet.subsurface(0, 0, size, size), sheet_path)
+        # The frames the game cuts itself, so both ways give the same pixels
+        for render_scale in RENDER_SCALES:
+            frame_scale = image_scale / render_scale
+            for action, frames in enumerate(fighter.load_frames(sheet, size, frame_scale, char["steps"])):
+                for index, frame in enumerate(frames):
+                    builder.add(frame_name(sheet_path, size, frame_scale, action, index), frame, sheet_path)
+
+    pixel_bytes = builder.write(path)
+    return len(builder.images), len(builder.blobs), pixel_bytes
+
+
+class AssetPack:
+    """Images of a pack file, mapped in memory
+
+    Images whose source file changed since the pack was built are left out, the
+    caller loads those from their files.
+    """
+    def __init__(self, path=PACK_PATH):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, index_length = HEADER.unpack_from(self.data)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an asset pack")
+            index = json.loads(self.data[HEADER.size:HEADER.size + index_length])
+        except Exception:
+            self.file.close()
+            raise
+        self.pixels = memoryview(self.data)[HEADER.size + index_length:]
+        self.blobs = index["blobs"]
+        stale = set()
+        for source, (size, mtime) in index["sources"].items():
+            try:
+                stat = os.stat(source)
+                if stat.st_size != size or stat.st_mtime_ns != mtime:
+                    stale.add(source)
+            except OSError:
+                stale.add(source)
+        if stale:
+            print(f"Asset pack out of date for {', '.join(sorted(stale))}, rebuild it with asset_pack.py")
+        self.images = {name: entry for name, entry in index["images"].items() if entry["source"] not in stale}
+
+    def __contains__(self, name):
+        return name in self.images
+
+    def image(self, name, mirrored=False):
+        """Surface of an image (mirrored horizontally if asked), in the pack's pixel format
+
+        Convert it for the display, or draw it as is if it has alpha (a SRCALPHA surface).
+        """
+        entry = self.images[name]
+        size = tuple(entry["size"])
+        x, y, width, height = entry["rect"]
+        offset, length = self.blobs[entry["blob"]]
+        pixels = self.pixels[offset:offset + length]
+        if (x, y, width, height) == (0, 0) + size and not mirrored:
+            return pygame.image.frombuffer(pixels, size, entry["format"])  # No copy, reads the mapping
+        surface = pygame.Surface(size, pygame.SRCALPHA)
+        if width and height:
+            visible = pygame.image.frombuffer(pixels, (width, height), entry["format"])
+            if mirrored:
+                # Flip only the stored area, and mirror where it goes
+                visible = pygame.transform.flip(visible, True, False)
+                x = size[0] - x - width
+            surface.blit(visible, (x, y))
+        return surface
+
+    def bounds(self, name):
+        """Area of the visible pixels of an image (Surface.get_bounding_rect)"""
+        return pygame.Rect(self.images[name]["rect"])
+
+    def has_frames(self, sheet, size, image_scale, animation_steps):
+        """True if every frame of a character is in the pack"""
+        return all(frame_name(sheet, size, image_scale, action, index) in self.images
+                   for action, steps in enumerate(animation_steps) for index in range(steps))
+
+    def frames(self, sheet, size, image_scale, animation_steps):
+        """Animation frames of a character like fighter.load_frames, their mirrored frames
+        and their visible areas, arguments for fighter.add_frames"""
+        names = [[frame_name(sheet, size, image_scale, action, index) for index in range(steps)]
+                 for action, steps in enumerate(animation_steps)]
+        frames = [[self.image(name) for name in action] for action in names]
+        mirrored = [[self.image(name, mirrored=True) for name in action] for action in names]
+        bounds = [[self.bounds(name) for name in action] for action in names]
+        return frames, mirrored, bounds
+
+    def close(self):
+        self.pixels.release()
+        self.data.close()
+        self.file.close()
+
+
+def open_pack(path=PACK_PATH):
+    """AssetPack of a file, None if there is none or it cannot be read"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return AssetPack(path)
+    except Exception as e:
+        print(f"Error opening asset pack {path}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else PACK_PATH
+    images, blobs, pixel_bytes = build_pack(path)
+    print(f"Wrote {path}: {images} images, {blobs} distinct, {pixel_bytes / 1e6:.1f} MB of pixels")
@@ -0,0 +1,166 @@
+import asyncio # For the event loop
+import contextlib # For the no-op room locks
+import socket # For socket options
+import time # For time handling
+
+import protocol # Binary message format
+import simulation # Fixed tick rate
+from framing import HEADER, FrameReader, pack_frame
+from server import Lobby
+
+class AsyncConnection:
+    """Wrap a StreamWriter so Room can broadcast to it like to a socket"""
+    def __init__(self, writer, max_buffer=64 * 1024):
+        self.writer = writer
+        self.max_buffer = max_buffer # Bytes queued for a slow client before snapshots are dropped
+
+    def sendall(self, data):
+        """Queue data without blocking the event loop"""
+        if self.writer.is_closing():
+            raise ConnectionResetError("connection closed")
+        if self.writer.transport.get_write_buffer_size() > self.max_buffer:
+            # A client that does not read fast enough skips snapshots, the next one replaces
+            # them (deltas are taken against the snapshot it acked). Other messages cannot be
+            # lost, a client that falls this far behind on them is disconnected.
+            if protocol.opcode(data[HEADER.size:]) == protocol.OP_SNAPSHOT:
+                return 0
+            self.writer.transport.abort()
+            raise ConnectionResetError("client is not reading, connection closed")
+        self.writer.write(data)
+        return len(data)
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncGameServer:
+    """Same protocol and game rules as GameServer, with coroutines instead of threads"""
+    def __init__(self, host='0.0.0.0', port=5555, udp=False):
+        self.host = host
+        self.port = port
+        self.udp = udp # Also accept clients on a UDP socket of the same port
+        self.SCREEN_WIDTH = 1300
+        self.SCREEN_HEIGHT = 800
+
+        # Everything runs on the event loop thread, so the room locks are no-ops
+        self.lobby = Lobby(self.SCREEN_WIDTH, self.SCREEN_HEIGHT, lock_factory=contextlib.nullcontext)
+        self.JOIN_TIMEOUT = 5.0 # Seconds a new client has to send its join request
+        self.TICK_INTERVAL = 1 / simulation.TICK_RATE # Seconds between two simulation ticks
+        self.MAX_LAG = 0.25 # Seconds of missed ticks caught up before they are dropped
+
+    async def handle_client(self, reader, writer):
+        """Handle connection from a specific client"""
+        addr = writer.get_extra_info("peername")
+        print(f"Connection from {addr}")
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        client = AsyncConnection(writer)
+        frames = FrameReader() # Reassembles the frames sent by this client
+        room = None
+        player_id = None
+        try:
+            # Wait for the OP_JOIN request
+            try:
+                request = await asyncio.wait_for(self.read_frame(reader, frames), self.JOIN_TIMEOUT)
+                if protocol.opcode(request) != protocol.OP_JOIN:
+                    raise ValueError(f"Expected a join request, got opcode {protocol.opcode(request)}")
+                room_id = protocol.decode_join(request)
+            except asyncio.TimeoutError:
+                room_id = None  # No request, join any open room
+            room, player_id = self.lobby.join_room(client, room_id)
+            if room is None:
+                client.sendall(pack_frame(protocol.encode_error(player_id)))
+                return
+
+            # Send ID and initial game state to client
+            client.sendall(pack_frame(protocol.encode_welcome(player_id, room.room_id)))
+            print(f"{addr} joined room {room.room_id} as {player_id}. Players in room: {len(room.clients)}")
+            room.broadcast_game_state() # Full snapshot for the new client
+
+            while True:  # Loop to receive data from client
+                try:
+                    data = await reader.read(65536)
+                except ConnectionResetError:
+                    print(f"Connection reset by {player_id}")
+                    break
+                if not data:
+                    print(f"No data received from {player_id}, client disconnected")
+                    break
+
+                # Handle every complete message received so far
+                frames.feed(data)
+                for payload in frames.frames():
+                    try:
+                        room.handle_message(player_id, payload)
+                    except Exception as e:
+                        print(f"Error processing data from {player_id}: {e}")
+
+        except Exception as e:
+            print(f"Error handling client {player_id}: {e}")
+        finally:
+            # Clean up when client disconnects
+            if room is not None:
+                print(f"{player_id} has disconnected from room {room.room_id}")
+                self.lobby.leave_room(room, client)
+
+                # Broadcast to remaining clients
+                room.broadcast_game_state()
+            client.close()
+
+    async def read_frame(self, reader, frames):
+        """Read until one whole frame has arrived"""
+        payload = frames.next_frame()
+        while payload is None:
+            data = await reader.read(65536)
+            if not data:
+                raise ConnectionResetError("client closed before joining")
+            frames.feed(data)
+            payload = frames.next_frame()
+        return payload
+
+    async def game_loop(self):
+        """Tick every room on a fixed schedule"""
+        next_tick = time.monotonic()
+        while True:
+            try:
+                self.lobby.tick()
+            except Exception as e:
+                print(f"Error in game loop: {e}")
+
+            # Sleep until the next tick, late ticks run back to back to catch up
+            next_tick += self.TICK_INTERVAL
+            delay = next_tick - time.monotonic()
+            if delay < -self.MAX_LAG:
+                next_tick = time.monotonic() # Too far behind, drop the missed ticks
+            await asyncio.sleep(max(delay, 0))
+
+    async def serve(self):
+        """Accept connections and run the game loop as a task"""
+        server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                            reuse_address=True, backlog=1024)
+        print(f"Async server running and listening on {self.host}:{self.port}")
+        tasks = [asyncio.create_task(self.game_loop())]
+        if self.udp:
+            from udp_server import serve_udp_async
+            tasks.append(asyncio.create_task(serve_udp_async(self.lobby, self.host, self.port)))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def run(self):
+        """Run server until interrupted"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Server shutting down...")
+        finally:
+            print("Server closed")
+
+if __name__ == "__main__":
+    server = AsyncGameServer()
+    server.run()
@@ -0,0 +1,283 @@
+import sys
+import time
+
+import numpy as np
+
+import characters
+import hitboxes
+from simulation import (TICK_RATE, SPEED, GRAVITY, JUMP_VELOCITY, FLOOR_MARGIN, ATTACK_COOLDOWN,
+                        ANIMATION_COOLDOWN, ATTACK_DAMAGE, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP,
+                        INPUT_ATTACK1, INPUT_ATTACK2, INPUT_ATTACK3, INPUT_ATTACKS,
+                        IDLE, RUN, JUMP, ATTACK1, ATTACK2, HIT, DEATH, start_position)
+
+# The rules of simulation.FighterSim for many matches at once (balance tests, load
+# generation). Each field of the fighters is one NumPy array of shape (matches, 2), player
+# 1 in column 0, and one step() runs a server tick of every match with array operations
+# instead of Python code per fighter. Same inputs, same results as FighterSim driven by
+# server.Room.step: player 1 moves first and player 2 sees where it went.
+#
+# A match is one round: it is over when a fighter dies, the fighters then only fall and
+# animate (like the server between two rounds). reset() starts matches again.
+
+WIDTH = 80  # Fighter rect
+HEIGHT = 180
+STEPS = np.array([char["steps"] for char in characters.CHARACTERS], dtype=np.int32)  # [character, action] -> frames
+
+
+def box_arrays(which):
+    """hitboxes.BOXES as arrays [character, action, frame, flip] -> (dx, dy, width, height), and
+    where there is a box; which is 0 for the hurtboxes, 1 for the hitboxes"""
+    boxes = np.zeros(STEPS.shape + (STEPS.max(), 2, 4), np.int32)
+    present = np.zeros(boxes.shape[:-1], bool)
+    for index in np.ndindex(present.shape):
+        char, action, frame, flip = index
+        if frame < STEPS[char, action]:
+            box = hitboxes.BOXES[char][action][frame][flip][which]
+            if box is not None:
+                boxes[index] = box
+                present[index] = True
+    return boxes, present
+
+
+HURTBOXES, HAS_HURTBOX = box_arrays(0)
+HITBOXES, HAS_HITBOX = box_arrays(1)
+
+
+class BatchSimulation:
+    """Fighters of many matches in structure-of-arrays form"""
+    def __init__(self, matches, screen_width=1000, screen_height=600, selections=None):
+        self.SCREEN_WIDTH = screen_width
+        self.SCREEN_HEIGHT = screen_height
+        self.matches = matches
+        shape = (matches, 2)
+        # Character of each fighter, random when not given
+        if selections is None:
+            selections = np.random.randint(len(STEPS), size=shape)
+        self.character = np.broadcast_to(np.asarray(selections, dtype=np.int32), shape).copy()
+        self.x = np.zeros(shape, np.int32)
+        self.y = np.zeros(shape, np.int32)
+        self.vel_y = np.zeros(shape, np.int32)
+        self.action = np.zeros(shape, np.int32)
+        self.frame_index = np.zeros(shape, np.int32)
+        self.update_tick = np.zeros(shape, np.int64)
+        self.attack_type = np.zeros(shape, np.int32)
+        self.attack_cooldown = np.zeros(shape, np.int32)
+        self.attack_landed = np.zeros(shape, bool)
+        self.health = np.zeros(shape, np.int32)
+        self.flip = np.zeros(shape, bool)
+        self.running = np.zeros(shape, bool)
+        self.jump = np.zeros(shape, bool)
+        self.attacking = np.zeros(shape, bool)
+        self.hit = np.zeros(shape, bool)
+        self.alive = np.zeros(shape, bool)
+        self.round_over = np.zeros(matches, bool)
+        self.winner = np.full(matches, -1, np.int32)  # 0 or 1 once the match is over
+        self.ticks = np.zeros(matches, np.int32)  # Ticks played by each match, until it was over
+        self.tick = 0
+        self.reset()
+
+    def reset(self, mask=None):
+        """Start matches again (all of them, or where mask is True) at the server's start positions"""
+        if mask is None:
+            mask = np.ones(self.matches, bool)
+        start = [start_position(player, self.SCREEN_WIDTH, self.SCREEN_HEIGHT) for player in (1, 2)]
+        self.x[mask] = [x for x, _, _ in start]
+        self.y[mask] = [y for _, y, _ in start]
+        self.flip[mask] = [flip for _, _, flip in start]
+        self.health[mask] = 100
+        self.alive[mask] = True
+        # update_tick starts at 0 like a new FighterSim, whatever the tick
+        for array in (self.vel_y, self.action, self.frame_index, self.update_tick, self.attack_type,
+                      self.attack_cooldown, self.attack_landed, self.running, self.jump, self.attacking, self.hit):
+            array[mask] = 0
+        self.round_over[mask] = False
+        self.winner[mask] = -1
+        self.ticks[mask] = 0
+
+    def step(self, inputs):
+        """Run one tick of every match, inputs: buttons (simulation.INPUT_*) of shape (matches, 2)"""
+        inputs = np.asarray(inputs)
+        self.tick += 1
+        self.move(0, 1, inputs[:, 0])
+        self.move(1, 0, inputs[:, 1])
+        self.update(0)
+        self.update(1)
+
+        #check for player defeat, player 1 first like the server
+        playing = ~self.round_over
+        self.ticks += playing
+        lost_1 = playing & ~self.alive[:, 0]
+        lost_2 = playing & ~lost_1 & ~self.alive[:, 1]
+        self.winner[lost_1] = 1
+        self.winner[lost_2] = 0
+        self.round_over |= lost_1 | lost_2
+
+    def move(self, p, t, inputs):
+        """FighterSim.move of fighter p of every match, against fighter t"""
+        x = self.x[:, p]
+        y = self.y[:, p]
+        vel_y = self.vel_y[:, p]
+        target_x = self.x[:, t]
+        target_y = self.y[:, t]
+
+        #can only perform other actions if not currently attacking
+        can_act = ~self.attacking[:, p] & self.alive[:, p] & ~self.round_over
+        left = can_act & (inputs & INPUT_LEFT != 0)
+        right = can_act & (inputs & INPUT_RIGHT != 0)
+        dx = np.where(right, SPEED, np.where(left, -SPEED, 0)).astype(np.int32)
+        self.running[:, p] = left | right
+
+        #jump
+        jumping = can_act & (inputs & INPUT_JUMP != 0) & ~self.jump[:, p]
+        vel_y[jumping] = JUMP_VELOCITY
+        self.jump[:, p] |= jumping
+
+        #attack, it hits later, on the frames that reach the target
+        attack = can_act & (inputs & INPUT_ATTACKS != 0)
+        start = attack & (self.attack_cooldown[:, p] == 0)
+        self.attacking[:, p] |= start
+        self.attack_landed[start, p] = False
+        #the attack type is chosen even during the cooldown, the last button wins
+        attack_type = np.zeros(self.matches, np.int32)
+        attack_type[attack & (inputs & INPUT_ATTACK1 != 0)] = 1
+        attack_type[attack & (inputs & INPUT_ATTACK2 != 0)] = 2
+        attack_type[attack & (inputs & INPUT_ATTACK3 != 0)] = 3
+        self.attack_type[:, p] = attack_type
+
+        #apply gravity
+        vel_y += GRAVITY
+        dy = vel_y.copy()
+
+        #ensure player stays on screen
+        dx = np.where(x + dx < 0, -x, dx)
+        dx = np.where(x + WIDTH + dx > self.SCREEN_WIDTH, self.SCREEN_WIDTH - x - WIDTH, dx)
+        floor = self.SCREEN_HEIGHT - FLOOR_MARGIN
+        landed = y + HEIGHT + dy > floor
+        vel_y[landed] = 0
+        self.jump[:, p] &= ~landed
+        dy = np.where(landed, floor - y - HEIGHT, dy)
+
+        #ensure players face each other
+        self.flip[:, p] = ~(target_x > x)
+
+        #apply attack cooldown
+        cooldown = self.attack_cooldown[:, p]
+        cooldown -= cooldown > 0
+
+        #update player position
+        x += dx
+        y += dy
+
+        #check the frame of the attack against the target, the hitbox tables of FighterSim.strike
+        action = self.action[:, p]
+        striking = self.attacking[:, p] & ~self.attack_landed[:, p] & ((action == ATTACK1) | (action == ATTACK2))
+        index = (self.character[:, p], action, self.frame_index[:, p], self.flip[:, p].astype(np.int32))
+        target_index = (self.character[:, t], self.action[:, t], self.frame_index[:, t], self.flip[:, t].astype(np.int32))
+        hit_x, hit_y, hit_w, hit_h = HITBOXES[index].T
+        hurt_x, hurt_y, hurt_w, hurt_h = HURTBOXES[target_index].T
+        hit_x = x + hit_x
+        hit_y = y + hit_y
+        hurt_x = target_x + hurt_x
+        hurt_y = target_y + hurt_y
+        touched = striking & HAS_HITBOX[index] & HAS_HURTBOX[target_index] \
+            & (hit_x < hurt_x + hurt_w) & (hurt_x < hit_x + hit_w) & (hit_y < hurt_y + hurt_h) & (hurt_y < hit_y + hit_h)
+        self.health[:, t] -= ATTACK_DAMAGE * touched
+        self.hit[:, t] |= touched
+        self.attack_landed[:, p] |= touched
+
+    def update(self, p):
+        """FighterSim.update of fighter p of every match"""
+        tick = self.tick
+        action = self.action[:, p]
+        frame_index = self.frame_index[:, p]
+        update_tick = self.update_tick[:, p]
+        attacking = self.attacking[:, p]
+        hit = self.hit[:, p]
+
+        #check what action the player is performing, an attack of type 0 keeps the current one
+        dead = self.health[:, p] <= 0
+        self.health[dead, p] = 0
+        self.alive[dead, p] = False
+        attack_type = self.attack_type[:, p]
+        attack_action = np.where(attack_type == 1, ATTACK1, np.where(attack_type == 0, action, ATTACK2))
+        new_action = np.select(
+            [dead, hit, attacking, self.jump[:, p], self.running[:, p]],
+            [DEATH, HIT, attack_action, JUMP, RUN], IDLE)
+        changed = new_action != action
+        action[changed] = new_action[changed]
+        frame_index[changed] = 0
+        update_tick[changed] = tick
+
+        #check if enough time has passed since the last update
+        advance = (tick - update_tick) * 1000 > ANIMATION_COOLDOWN * TICK_RATE
+        frame_index += advance
+        update_tick[advance] = tick
+
+        #check if the animation has finished
+        frame_count = STEPS[self.character[:, p], action]
+        finished = frame_index >= frame_count
+        alive = self.alive[:, p]
+        frame_index[finished & ~alive] = frame_count[finished & ~alive] - 1
+        restart = finished & alive
+        frame_index[restart] = 0
+        #an attack or a hit that ended stops the attack
+        ended = restart & ((action == ATTACK1) | (action == ATTACK2) | (action == HIT))
+        attacking[ended] = False
+        self.attack_cooldown[ended, p] = ATTACK_COOLDOWN
+        hit[restart & (action == HIT)] = False
+
+    def state(self, match, player):
+        """Player state dict of one fighter, like FighterSim.state()"""
+        index = (match, player)
+        return {
+            "x": int(self.x[index]),
+            "y": int(self.y[index]),
+            "health": int(self.health[index]),
+            "action": int(self.action[index]),
+            "frame_index": int(self.frame_index[index]),
+            "flip": bool(self.flip[index]),
+            "attacking": bool(self.attacking[index]),
+            "hit": bool(self.hit[index]),
+            "vel_y": int(self.vel_y[index]),
+            "jump": bool(self.jump[index]),
+            "attack_cooldown": int(self.attack_cooldown[index]),
+            "attack_type": int(self.attack_type[index]),
+            "attack_landed": bool(self.attack_landed[index]),
+            "update_tick": int(self.update_tick[index])
+        }
+
+
+def random_inputs(inputs, rng, change=1 / 8):
+    """Buttons mashed at random: each fighter presses new ones with a probability per tick"""
+    new = rng.integers(0, 64, size=inputs.shape, dtype=np.uint8)
+    return np.where(rng.random(inputs.shape) < change, new, inputs)
+
+
+if __name__ == "__main__":
+    # Balance test: random inputs, finished matches start again with new characters,
+    # win rate of each character against each other one
+    matches = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    rng = np.random.default_rng()
+    batch = BatchSimulation(matches)
+    inputs = np.zeros((matches, 2), np.uint8)
+    wins = np.zeros((len(STEPS), len(STEPS), 2), np.int64)  # [character 1, character 2, winner]
+    start = time.perf_counter()
+    for _ in range(seconds * TICK_RATE):
+        inputs = random_inputs(inputs, rng)
+        batch.step(inputs)
+        over = batch.round_over
+        if over.any():
+            np.add.at(wins, (batch.character[over, 0], batch.character[over, 1], batch.winner[over]), 1)
+            batch.character[over] = rng.integers(len(STEPS), size=(over.sum(), 2))
+            batch.reset(over)
+    elapsed = time.perf_counter() - start
+    print(f"{matches} matches x {seconds * TICK_RATE} ticks in {elapsed:.2f} s, "
+          f"{matches * seconds / elapsed:.0f} matches at {TICK_RATE} ticks/s")
+
+    names = [char["name"] for char in characters.CHARACTERS]
+    print(f"{wins.sum()} matches over")
+    for first, second in np.ndindex(wins.shape[:2]):
+        played = wins[first, second].sum()
+        if played:
+            print(f"{names[first]:>16} vs {names[second]:<16} {wins[first, second, 0] / played:6.1%} of {played}")
@@ -0,0 +1,21 @@
+# Playable characters, shared by the client, the server and the simulation.
+# data: [frame size in the sprite sheet, image scale, offset of the fighter rect in the frame]
+# steps: number of frames of each animation (idle, run, jump, attack1, attack2, hit, death)
+
+CHARACTERS = [
+    {"name": "WARRIOR", "data": [162, 4, [72, 56]], "steps": [10, 8, 1, 7, 7, 3, 7],
+     "sheet": "assets/images/warrior/Sprites/warrior.png", "sound": "assets/audio/sword.wav", "color": (255, 0, 0)},
+    {"name": "WIZARD", "data": [250, 3, [112, 107]], "steps": [8, 8, 1, 8, 8, 3, 7],
+     "sheet": "assets/images/wizard/Sprites/wizard.png", "sound": "assets/audio/magic.wav", "color": (0, 0, 255)},
+    {"name": "HUNTRESS", "data": [250, 3, [112, 107]], "steps": [8, 8, 2, 5, 5, 3, 7],
+     "sheet": "assets/images/Huntress/Sprites/Huntress.png", "sound": "assets/audio/sword.wav", "color": (0, 255, 0)},
+    {"name": "MEDIEVAL WARRIOR", "data": [200, 3, [86, 68]], "steps": [10, 6, 2, 4, 4, 3, 9],
+     "sheet": "assets/images/MedievalWarriorPack3/Sprites/MedievalWarriorPack3.png", "sound": "assets/audio/sword.wav", "color": (255, 165, 0)}
+]
+
+
+def character(index):
+    """Character of a selection index, falling back to the first one"""
+    if 0 <= index < len(CHARACTERS):
+        return CHARACTERS[index]
+    return CHARACTERS[0]
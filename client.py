@@ -1,22 +1,56 @@
 import socket
-import pickle
 import threading
 import pygame
 from pygame import mixer
 import sys
 import time
+import collections
 
-from fighter import Fighter
+from fighter import Fighter, read_input, add_frames
+import characters
+import simulation
+from simulation import FighterSim
+from interpolation import SnapshotBuffer
+from rollback import RollbackSession
+import protocol
+from transport import TcpTransport, UdpTransport
+from text_cache import TextCache, get_font
+from dirty_rects import DirtyRects
+from framebuffer import Framebuffer, LOW_RES_SCALE
+from frame_governor import FrameGovernor, NO_EFFECTS, LOW_RES
+from asset_manager import AssetManager
+import asset_pack
 
 class GameClient:
-    def __init__(self, host='localhost', port=5555):
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    def __init__(self, host='localhost', port=5555, room_id=None, predict=True, interpolation_delay=0.1, udp=False, dirty_rects=False, low_res=False, adaptive=True, rollback=False):
+        self.udp = udp # Datagrams instead of a TCP stream, a lost snapshot does not hold back the next ones
+        self.client = self.create_transport()
         self.server = host # Server address
         self.port = port # Server port
         self.addr = (self.server, self.port) # Server address tuple
         self.player_id = None # Player ID (player1 or player2)
+        self.room_id = room_id # Room to join (None joins any open room)
         self.game_state = None # Game state received from server
+        self.snapshots = {} # Snapshot seq -> game state, bases for the server's deltas
+        self.snapshot_seq = 0 # Newest snapshot applied, older ones arriving late are dropped
+        self.early_payloads = [] # Messages received with the welcome, handled by the receive thread
+        self.awaiting_resync = False # Full snapshot requested after losing a delta base
+        self.server_tick = 0 # Simulation tick of the last snapshot
+
+        # Client-side prediction: our own fighter moves as soon as a key is pressed,
+        # then the server state is corrected by replaying the inputs it has not applied yet
+        self.predict = predict # False renders our fighter from the snapshots only
+        self.input_history = collections.deque(maxlen=simulation.TICK_RATE * 2) # (seq, buttons) sent, not yet applied by the server
+        self.predicted = None # FighterSim of our fighter, server state plus the pending inputs
+        self.predicted_tick = 0 # Simulation tick of self.predicted
+        self.prediction_target = None # FighterSim of the opponent our predicted fighter is stepped against
+        self.prediction_lock = threading.Lock() # Shared by the receive thread and the game loop
+        # The opponent is drawn interpolation_delay seconds in the past, between two snapshots
+        self.remote_states = SnapshotBuffer(delay=interpolation_delay)
+        # Rollback fight (both players asked for it): both fighters are simulated here from
+        # the inputs exchanged with the opponent, see rollback.py
+        self.rollback = rollback
+        self.session = None # RollbackSession of the fight in progress, guarded by prediction_lock
         self.running = True  # Main game loop flag
         self.connection_established = False  # Connection status flag
         self.connection_error = None # Connection error message
@@ -24,10 +58,11 @@ class GameClient:
         self.max_retries = 3  # Maximum number of connection attempts
 
         ## Chat variables
-        self.chat_messages = []  # Danh sách tin nhắn nhận từ server
+        self.max_chat_messages = 3 # Số tin nhắn tối đa hiển thị trên màn hình
+        self.chat_messages = collections.deque(maxlen=self.max_chat_messages)  # Tin nhắn gần nhất nhận từ server
+        self.last_chat_seq = 0  # Sequence number of the last chat line received
         self.chat_input = ""  # lưu trữ tin nhắn đang nhập
         self.chat_active = False  # Trạng thái nhập tin nhắn
-        self.max_chat_messages = 3 # Số tin nhắn tối đa hiển thị trên màn hình
 
             ## Chat message display control
         self.show_chat_messages = False      # Control chat messages visibility
@@ -48,6 +83,12 @@ class GameClient:
         pygame.display.set_caption("Brawler Game - Network Edition")
         self.clock = pygame.time.Clock()
         self.FPS = 60
+        self.framebuffer = Framebuffer(LOW_RES_SCALE if low_res else 1) # The fight is drawn on framebuffer.scene()
+        self.dirty_rects = dirty_rects
+        self.dirty = DirtyRects(dirty_rects and not low_res) # Redraw and update only what changed during the fight (low-res scales up the whole window)
+        self.low_res = low_res
+        self.governor = FrameGovernor(self.FPS, simulation.TICK_RATE, adaptive) # Frame pacing and quality, see apply_quality
+        self.effects = True # Translucent overlays, chat bubble and gradients, off when frames are over budget
         
         # Colors
         self.RED = (255, 0, 0)
@@ -70,6 +111,8 @@ class GameClient:
         self.CHAT_MARGIN = 25  # cách mép màn hình
         self.CHAT_BG_ALPHA = 110  # độ mờ
         self.CHAT_BG_RADIUS = 8  # bo góc
+        self.chat_view_start = 0  # Index of the first character shown in the chat input box
+        self.chat_surfaces = {}  # Chat box backgrounds by size, drawn once
         
         
         # Game variables
@@ -115,92 +158,137 @@ class GameClient:
         self.fighter_2 = None
         # Initialize CHARACTER_DATA
         self.CHARACTER_DATA = [
-            {"name": "WARRIOR", "data": [162, 4, [72, 56]], "sheet": None, "steps": [10, 8, 1, 7, 7, 3, 7], "sound": None, "color": self.RED},
-            {"name": "WIZARD", "data": [250, 3, [112, 107]], "sheet": None, "steps": [8, 8, 1, 8, 8, 3, 7], "sound": None, "color": self.BLUE},
-            {"name": "HUNTRESS", "data": [250, 3, [112, 107]], "sheet": None, "steps": [8, 8, 2, 5, 5, 3, 7], "sound": None, "color": self.GREEN},
-            {"name": "MEDIEVAL WARRIOR", "data": [200, 3, [86, 68]], "sheet": None, "steps": [10, 6, 2, 4, 4, 3, 9], "sound": None, "color": self.ORANGE}
+            {"name": char["name"], "data": char["data"], "sheet": None, "steps": char["steps"], "sound": None, "color": char["color"]}
+            for char in characters.CHARACTERS
         ]
+        self.assets = AssetManager(asset_pack.open_pack()) # Every image and sound file, loaded once
         self.load_resources() # Load game resources
         # Create fighters
     def create_fighters(self):
         """Tạo Fighter dựa trên lựa chọn nhân vật"""
-        p1_char = self.CHARACTER_DATA[self.player_selection[0]]
-        p2_char = self.CHARACTER_DATA[self.player_selection[1]]
+        p1_char = self.load_character(self.player_selection[0])
+        p2_char = self.load_character(self.player_selection[1])
         self.fighter_1 = Fighter(1, self.fighter_1_initial_x, self.fighter_1_initial_y, False,
-                                p1_char["data"], p1_char["sheet"], p1_char["steps"], p1_char["sound"])
+                                p1_char["data"], p1_char["sheet"], p1_char["steps"], p1_char["sound"], self.framebuffer.scale,
+                                self.player_selection[0])
         self.fighter_2 = Fighter(2, self.fighter_2_initial_x, self.fighter_2_initial_y, True,
-                                p2_char["data"], p2_char["sheet"], p2_char["steps"], p2_char["sound"])
+                                p2_char["data"], p2_char["sheet"], p2_char["steps"], p2_char["sound"], self.framebuffer.scale,
+                                self.player_selection[1])
         
-        # Store initial positions for resetting
-        
-
-        # Network update rate (to prevent flooding the server)
-        self.last_update_time = 0
-        self.update_interval = 1000 / 30  # 30 updates per second
+        # Inputs sent to the server, one per frame
+        self.input_seq = 0
+        with self.prediction_lock:
+            self.input_history.clear()
+            self.predicted = None
+            self.prediction_target = None
+        self.remote_states.clear()
         
     def load_resources(self):
-        """Load game resources"""
+        """Load the fonts and music, queue the images and sounds for the asset worker
+
+        The run loop shows a loading screen until ESSENTIAL_ASSETS are decoded (see
+        wait_for_assets). Character sheets are decoded afterwards in the background,
+        or on demand when a character is picked before its turn.
+        """
         try:
-            # Load music and sounds
+            # Load music
             pygame.mixer.music.load("assets/audio/ok.mp3") # Load background music
             pygame.mixer.music.set_volume(1) # Set volume
             pygame.mixer.music.play(-1, 0.0, 5000) # Loop music indefinitely
-            self.CHARACTER_DATA[0]["sheet"] = pygame.image.load("assets/images/warrior/Sprites/warrior.png").convert_alpha()
-            self.CHARACTER_DATA[0]["sound"] = pygame.mixer.Sound("assets/audio/sword.wav")
-            self.CHARACTER_DATA[1]["sheet"] = pygame.image.load("assets/images/wizard/Sprites/wizard.png").convert_alpha()
-            self.CHARACTER_DATA[1]["sound"] = pygame.mixer.Sound("assets/audio/magic.wav")
-            self.CHARACTER_DATA[2]["sheet"] = pygame.image.load("assets/images/Huntress/Sprites/Huntress.png").convert_alpha()
-            self.CHARACTER_DATA[2]["sound"] = pygame.mixer.Sound("assets/audio/sword.wav")
-            self.CHARACTER_DATA[3]["sheet"] = pygame.image.load("assets/images/MedievalWarriorPack3/Sprites/MedievalWarriorPack3.png").convert_alpha()
-            self.CHARACTER_DATA[3]["sound"] = pygame.mixer.Sound("assets/audio/sword.wav")
 
+            self.BACKGROUND_PATH = "assets/images/background/background.jpg"
+            self.VICTORY_PATH = "assets/images/icons/victory.png"
+            self.ESSENTIAL_ASSETS = [self.BACKGROUND_PATH, self.VICTORY_PATH] + sorted({char["sound"] for char in characters.CHARACTERS})
+            self.assets.preload(self.ESSENTIAL_ASSETS)
+            # With a current asset pack, a character needs only its portrait, its frames are in the pack
+            pack = self.assets.pack
+            self.SHEET_ASSETS = [asset_pack.portrait_name(char["sheet"])
+                                 if pack is not None and asset_pack.portrait_name(char["sheet"]) in pack
+                                 and all(pack.has_frames(char["sheet"], char["data"][0], char["data"][1] / scale, char["steps"])
+                                         for scale in asset_pack.RENDER_SCALES)
+                                 else char["sheet"]
+                                 for char in characters.CHARACTERS]
+            self.assets.preload(self.SHEET_ASSETS)
+            self.packed_frames = set() # (character, render scale) of the frames added from the pack
+            self.scaled_bg = None # bg_image scaled to the window, see draw_bg
+            self.screen_layers = {} # Static menu screens drawn once, see draw_cached_layer
             
-            # Load background image
-            self.bg_image = pygame.image.load("assets/images/background/background.jpg").convert_alpha()
-            
-            # Load spritesheets
-            self.warrior_sheet = pygame.image.load("assets/images/warrior/Sprites/warrior.png").convert_alpha()
-            self.wizard_sheet = pygame.image.load("assets/images/wizard/Sprites/wizard.png").convert_alpha()
-            
+            # Define fonts (the file is read once for every size)
+            self.count_font = get_font("assets/fonts/transMutation.ttf", 80)
+            self.score_font = get_font("assets/fonts/transMutation.ttf", 30)
+            self.game_over_font = get_font("assets/fonts/transMutation.ttf", 50)
+            self.controls_font = get_font("assets/fonts/transMutation.ttf", 25)
+            self.title_font = get_font("assets/fonts/transMutation.ttf", 40)
+            self.chat_font = get_font(None, 30) # Chat bubble
+            self.chat_input_font = get_font(None, 32) # Chat input box
+            self.text_cache = TextCache() # Rendered labels, see draw_text
+        except Exception as e:
+            print(f"Error loading resources: {e}")
+            pygame.quit()
+            sys.exit()
 
-            self.huntress_sheet = pygame.image.load( "assets/images/Huntress/Sprites/Huntress.png").convert_alpha()
-                                                
-            self.medievalwarriorpack3_sheet = pygame.image.load(  "assets/images/MedievalWarriorPack3/Sprites/MedievalWarriorPack3.png").convert_alpha()
-  
-            
-            # Load victory image
-            self.victory_img = pygame.image.load("assets/images/icons/victory.png").convert_alpha()
-            
-            # Define fonts
-            self.count_font = pygame.font.Font("assets/fonts/transMutation.ttf", 80)
-            self.score_font = pygame.font.Font("assets/fonts/transMutation.ttf", 30)
-            self.game_over_font = pygame.font.Font("assets/fonts/transMutation.ttf", 50)
-            self.controls_font = pygame.font.Font("assets/fonts/transMutation.ttf", 25)
-            self.title_font = pygame.font.Font("assets/fonts/transMutation.ttf", 40)
+    def wait_for_assets(self):
+        """Show a loading screen until the assets of the first screens are decoded"""
+        while self.assets.progress(self.ESSENTIAL_ASSETS) < 1:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    sys.exit()
+            self.loading_screen(self.assets.progress(self.ESSENTIAL_ASSETS))
+            self.dirty.invalidate() # Full-screen
+            self.dirty.present(self.screen)
+            self.clock.tick(self.FPS)
+
+        try:
+            self.bg_image = self.assets.image(self.BACKGROUND_PATH, alpha=False) # Opaque, no per-pixel alpha
+            self.victory_img = self.assets.image(self.VICTORY_PATH)
+        except Exception as e:
+            print(f"Error loading resources: {e}")
+            pygame.quit()
+            sys.exit()
+
+    def loading_screen(self, progress):
+        """Draw the loading screen with a progress bar"""
+        self.screen.fill(self.BLACK)
+        self.draw_text("LOADING", self.title_font, self.YELLOW, self.SCREEN_WIDTH // 2, self.SCREEN_HEIGHT // 2 - 50)
+        bar = pygame.Rect(0, 0, 400, 20)
+        bar.center = (self.SCREEN_WIDTH // 2, self.SCREEN_HEIGHT // 2 + 20)
+        pygame.draw.rect(self.screen, self.WHITE, bar.inflate(4, 4), 2)
+        pygame.draw.rect(self.screen, self.YELLOW, (bar.x, bar.y, int(bar.width * progress), bar.height))
+
+    def load_character(self, index):
+        """Sheet, sound and frames at the current render scale of a character, decoded the first time they are needed"""
+        if not 0 <= index < len(self.CHARACTER_DATA):
+            index = 0 # Unknown selection from the server, the first character like characters.character
+        char = self.CHARACTER_DATA[index]
+        try:
+            if char["sheet"] is None:
+                char["sheet"] = self.assets.image(self.SHEET_ASSETS[index])
+                char["sound"] = self.assets.sound(characters.CHARACTERS[index]["sound"])
+            source = characters.CHARACTERS[index]
+            if self.SHEET_ASSETS[index] != source["sheet"] and (index, self.framebuffer.scale) not in self.packed_frames:
+                # Frames from the asset pack, Fighter finds them instead of cutting the portrait
+                size, image_scale = char["data"][0], char["data"][1] / self.framebuffer.scale
+                add_frames(char["sheet"], size, image_scale, char["steps"],
+                           *self.assets.pack.frames(source["sheet"], size, image_scale, char["steps"]))
+                self.packed_frames.add((index, self.framebuffer.scale))
         except Exception as e:
             print(f"Error loading resources: {e}")
             pygame.quit()
             sys.exit()
+        return char
+
+    def loaded_characters(self):
+        """Take the character sheets decoded in the background, returns how many are ready"""
+        for index, sheet in enumerate(self.SHEET_ASSETS):
+            if self.CHARACTER_DATA[index]["sheet"] is None and self.assets.is_loaded(sheet):
+                self.load_character(index)
+        return sum(1 for char in self.CHARACTER_DATA if char["sheet"] is not None)
     
     def reset_fighter_state(self, fighter, initial_x, initial_y):
         """Reset a fighter to initial state for a new round"""
-        fighter.rect.x = initial_x
-        fighter.rect.y = initial_y
-        fighter.health = 100
-        fighter.alive = True
-        fighter.attacking = False
-        fighter.attack_type = 0
-        fighter.attack_cooldown = 0
-        fighter.hit = False
-        fighter.action = 0  # Idle action
-        fighter.frame_index = 0
-        fighter.velocity_y = 0
-        fighter.jump = False
-        fighter.in_air = False
-        fighter.attack_sound_played = False
-        
-        # Ensure fighter stops attacking
-        fighter.update_action(0)  # Set to idle
+        fighter.sim = FighterSim(fighter.player, initial_x, initial_y, fighter.flip, fighter.animation_steps,
+                                 fighter.sim.character) # Idle, full health
     
     def connect(self):
         """Connect to the server with retry mechanism"""
@@ -220,24 +308,36 @@ class GameClient:
                 
                 print(f"Connected to server at {self.addr}")
                 
+                # Ask the server for a room
+                self.snapshots = {}  # A new connection starts from a full snapshot
+                self.snapshot_seq = 0
+                self.early_payloads = []
+                self.client.send(protocol.encode_join(self.room_id))
+                
                 # Receive player ID from server
-                data = self.client.recv(4096)
-                if not data:
-                    raise Exception("No data received from server")
+                data = None
+                while data is None:
+                    for payload in self.client.receive():
+                        if data is not None:
+                            self.early_payloads.append(payload)
+                        elif protocol.opcode(payload) in (protocol.OP_WELCOME, protocol.OP_ERROR):
+                            data = payload
+                        # Over UDP a snapshot may overtake the welcome, the server sends a full one again
                     
-                response = pickle.loads(data)  # Unpickle the response
-                
-                if "error" in response:
-                    raise Exception(f"Server error: {response['error']}")
-                
-                self.player_id = response["player_id"]
-                print(f"You are {self.player_id}")
+                if protocol.opcode(data) == protocol.OP_ERROR:
+                    raise Exception(f"Server error: {protocol.decode_string(data)}")
                 
-                # Send initial confirmation to server
-                self.send_data({"player_id": self.player_id, "status": "connected"})
+                previous_room = self.room_id
+                self.player_id, self.room_id = protocol.decode_welcome(data)
+                if self.room_id != previous_room:
+                    self.last_chat_seq = 0  # Chat seqs are per room
+                print(f"You are {self.player_id} in room {self.room_id}")
+                pygame.display.set_caption(f"Brawler Game - Network Edition - Room {self.room_id}")
                 
                 # Start receiving data from server
                 self.connection_established = True
+                # Catch up on the chat lines sent while we were away
+                self.send_data(protocol.encode_chat_sync(self.last_chat_seq))
                 receive_thread = threading.Thread(target=self.receive_data)
                 receive_thread.daemon = True
                 receive_thread.start()
@@ -256,77 +356,27 @@ class GameClient:
                 except:
                     pass
                     
-                self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.client = self.create_transport()
                 time.sleep(1)  # Wait before retrying connection
         
         # If we've exhausted our retries
         if not self.connection_established:
             print("Failed to connect to server after multiple attempts")
             return False
+
+    def create_transport(self):
+        """New TCP or UDP connection object, see transport.py"""
+        return UdpTransport() if self.udp else TcpTransport()
+
     def receive_data(self):
         """Continuously receive data from server"""
         self.client.settimeout(5)  # Set timeout to detect disconnection
+        self.handle_payloads(self.early_payloads)
 
         while self.running:  # Keep receiving data until the game is over or connection is lost
             try:
-                data = self.client.recv(4096)  # Receive data from server
-                if not data:
-                    print("Server disconnected (no data)")
-                    break
-
-                self.game_state = pickle.loads(data)  # Unpickle the received data
-                if self.game_state is None:
-                    print("Received None data from server")
-                    break
-
-                # Update local game state based on server data
-                if self.game_state and "game_active" in self.game_state:
-                    # Sync player selection with server's state
-                    if "player_selections" in self.game_state:
-                        old_selection = self.player_selection.copy()
-                        self.player_selection = self.game_state["player_selections"]
-                        if old_selection != self.player_selection:
-                            print(f"Player selection updated: {old_selection} -> {self.player_selection}")
-
-                        # Create fighters if they don't exist yet
-                        if self.fighter_1 is None and self.fighter_2 is None and self.game_state.get("game_active", False):
-                            self.create_fighters()
-
-                    # Update chat messages
-                    if "chat_messages" in self.game_state:
-                        if self.chat_messages != self.game_state["chat_messages"]:
-                            self.chat_messages = self.game_state["chat_messages"]
-                            self.show_chat_messages = True
-                            self.chat_display_timer = pygame.time.get_ticks()
-
-                    # Handle round state changes
-                    new_round_over = self.game_state["round_over"]
-                    if self.was_round_over and not new_round_over:
-                        print("New round starting - resetting local fighter state")
-                        if self.player_id == "player1":
-                            self.reset_fighter_state(self.fighter_1, self.fighter_1_initial_x, self.fighter_1_initial_y)
-                        elif self.player_id == "player2":
-                            self.reset_fighter_state(self.fighter_2, self.fighter_2_initial_x, self.fighter_2_initial_y)
-
-                    self.was_round_over = new_round_over
-                    self.round_over = new_round_over
-                    self.game_over = self.game_state["game_over"]
-                    self.winner = self.game_state["winner"]
-
-                    # Update fighter states
-                    if self.game_state["game_active"] and self.fighter_1 and self.fighter_2:
-                        if self.player_id == "player1":
-                            self.fighter_1.health = self.game_state["player1"]["health"]
-                            self.fighter_1.hit = self.game_state["player1"]["hit"]
-
-                            if "player2" in self.game_state:
-                                self.update_fighter_state(self.fighter_2, self.game_state["player2"])
-                        elif self.player_id == "player2":
-                            self.fighter_2.health = self.game_state["player2"]["health"]
-                            self.fighter_2.hit = self.game_state["player2"]["hit"]
-
-                            if "player1" in self.game_state:
-                                self.update_fighter_state(self.fighter_1, self.game_state["player1"])
+                # Apply every complete message received so far, in order
+                self.handle_payloads(self.client.receive())
 
             except socket.timeout:
                 # Just a timeout, continue the loop
@@ -335,37 +385,226 @@ class GameClient:
                 print(f"Connection lost: {e}")
                 break
             except Exception as e:
+                # The stream itself is broken (e.g. oversized frame), stop reading
                 print(f"Error receiving data: {e}")
-                # Try to continue instead of breaking immediately
-                if not self.running:
-                    break
-                time.sleep(0.5)  # Brief pause before trying again
-                continue
+                break
         
         print("Disconnected from server")
         self.connection_established = False
         self.running = False
 
+    def handle_payloads(self, payloads):
+        """Apply messages received from the server"""
+        for payload in payloads:
+            try:
+                op = protocol.opcode(payload)
+                if op == protocol.OP_SNAPSHOT:
+                    self.receive_snapshot(payload)
+                elif op == protocol.OP_CHAT_EVENT:
+                    self.receive_chat(payload)
+                elif op == protocol.OP_INPUT_FRAMES:
+                    self.receive_input_frames(payload)
+                else:
+                    print(f"Unexpected message from server, opcode {op}")
+            except Exception as e:
+                # One bad message does not desync a framed stream, skip it
+                print(f"Error processing data from server: {e}")
+
+    def receive_snapshot(self, payload):
+        """Rebuild the game state from a full or delta snapshot and acknowledge it"""
+        seq, base_seq, server_tick = protocol.snapshot_ids(payload)
+        if seq <= self.snapshot_seq:
+            if seq == self.snapshot_seq:
+                self.send_data(protocol.encode_ack(seq)) # Sent again, our ack was lost
+            return # Reordered datagram, a newer snapshot was already applied
+        base_state = None
+        if base_seq:
+            base_state = self.snapshots.get(base_seq)
+            if base_state is None:
+                # Delta against a snapshot we do not have, ask once for a full one
+                if not self.awaiting_resync:
+                    self.awaiting_resync = True
+                    self.send_data(protocol.encode_resync())
+                return
+        else:
+            self.awaiting_resync = False
+
+        self.game_state = protocol.decode_snapshot(payload, base_state)
+        self.snapshot_seq = seq
+        self.server_tick = server_tick
+        self.snapshots[seq] = self.game_state
+        if len(self.snapshots) > protocol.SNAPSHOT_HISTORY:
+            del self.snapshots[next(iter(self.snapshots))] # Drop the oldest snapshot
+        self.send_data(protocol.encode_ack(seq))
+        self.apply_game_state()
+
+    def receive_chat(self, payload):
+        """Show a chat line received on the chat channel"""
+        seq, text = protocol.decode_chat_event(payload)
+        if seq <= self.last_chat_seq:
+            return  # Already shown
+        self.last_chat_seq = seq
+        self.chat_messages.append(text)
+        self.show_chat_messages = True
+        self.chat_display_timer = pygame.time.get_ticks()
+
+    def apply_game_state(self):
+        """Update local game state based on server data"""
+        if self.game_state and "game_active" in self.game_state:
+            # Sync player selection with server's state
+            if "player_selections" in self.game_state:
+                old_selection = self.player_selection.copy()
+                self.player_selection = list(self.game_state["player_selections"]) # Copy, stored snapshots stay untouched
+                if old_selection != self.player_selection:
+                    print(f"Player selection updated: {old_selection} -> {self.player_selection}")
+
+                # Create fighters if they don't exist yet
+                if self.fighter_1 is None and self.fighter_2 is None and self.game_state.get("game_active", False):
+                    self.create_fighters()
+
+            # Handle round state changes
+            new_round_over = self.game_state["round_over"]
+            if self.was_round_over and not new_round_over:
+                print("New round starting - resetting local fighter state")
+                self.remote_states.clear() # Do not slide the opponent back to its start position
+                if self.player_id == "player1":
+                    self.reset_fighter_state(self.fighter_1, self.fighter_1_initial_x, self.fighter_1_initial_y)
+                elif self.player_id == "player2":
+                    self.reset_fighter_state(self.fighter_2, self.fighter_2_initial_x, self.fighter_2_initial_y)
+
+            self.was_round_over = new_round_over
+            self.round_over = new_round_over
+            self.game_over = self.game_state["game_over"]
+            self.winner = self.game_state["winner"]
+            self.update_session()
+
+            # Update fighter states, the server simulates both fighters (we do in a rollback fight)
+            if self.game_state["game_active"] and self.fighter_1 and self.fighter_2 and self.session is None:
+                if self.player_id in protocol.PLAYER_SLOTS:
+                    # The opponent is drawn from the interpolation buffer, see update_remote_fighter
+                    opponent_id = protocol.PLAYER_IDS[1 - protocol.player_index(self.player_id)]
+                    self.remote_states.add(self.server_tick, self.game_state[opponent_id])
+                    if self.predict:
+                        self.reconcile()
+                    else:
+                        self.update_fighter_state(self.local_fighter(self.player_id), self.game_state[self.player_id])
+                else:
+                    self.update_fighter_state(self.fighter_1, self.game_state["player1"])
+                    self.update_fighter_state(self.fighter_2, self.game_state["player2"])
+
+    def update_session(self):
+        """Start our copy of a rollback fight when the countdown ends, drop it with the round"""
+        state = self.game_state
+        fighting = (state["rollback"] and state["game_active"] and not state["game_over"]
+                    and state["intro_count"] <= 0 and self.player_id in protocol.PLAYER_SLOTS)
+        with self.prediction_lock:
+            if not fighting:
+                if self.session is not None:
+                    print(f"Rollback fight ended: {self.session.rollbacks} rollbacks, {self.session.replayed_ticks} ticks replayed, "
+                          f"{self.session.desyncs} ticks out of sync")
+                self.session = None
+            elif self.session is None and not state["round_over"]:
+                self.session = RollbackSession(protocol.player_index(self.player_id), state["player_selections"],
+                                               self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+            if self.session is not None and state["checksum"][0]:
+                self.session.verify(*state["checksum"]) # The server's fighters instead of their states
+
+    def receive_input_frames(self, payload):
+        """Give the opponent's inputs to our copy of the fight"""
+        with self.prediction_lock:
+            if self.session is not None:
+                self.session.add_remote_inputs(*protocol.decode_input_frames(payload))
+
+    def advance_session(self, buttons, ticks):
+        """Replay the mispredicted ticks of the rollback fight, simulate the new ones and send our inputs"""
+        with self.prediction_lock:
+            session = self.session
+            if session is None:
+                return False
+            session.rollback()
+            for _ in range(ticks):
+                # Skip the tick when we run ahead of the opponent or its inputs are too late
+                if session.should_wait() or not session.can_advance():
+                    continue
+                session.advance(buttons)
+            message = session.outgoing(all_unacked=self.udp) # Datagrams may be lost, repeat what was not acked
+            states = [fighter.state() for fighter in session.fighters]
+        if message is not None:
+            self.send_data(protocol.encode_input_frames(*message))
+        self.update_fighter_state(self.fighter_1, states[0])
+        self.update_fighter_state(self.fighter_2, states[1])
+        return True
+
+    def update_remote_fighter(self):
+        """Move the opponent to its interpolated state for this frame"""
+        if self.player_id not in protocol.PLAYER_SLOTS or self.session is not None:
+            return
+        state = self.remote_states.sample()
+        if state is not None:
+            opponent_id = protocol.PLAYER_IDS[1 - protocol.player_index(self.player_id)]
+            self.update_fighter_state(self.local_fighter(opponent_id), state)
+
+    def local_fighter(self, player_id):
+        """Fighter drawn for a player ID"""
+        return self.fighter_1 if player_id == "player1" else self.fighter_2
+
+    def reconcile(self):
+        """Restart the prediction from the server state and replay the inputs it has not applied yet"""
+        index = protocol.player_index(self.player_id)
+        acked_seq = self.game_state["input_seqs"][index]
+        with self.prediction_lock:
+            while self.input_history and self.input_history[0][0] <= acked_seq:
+                self.input_history.popleft()
+
+            selection = self.player_selection[index]
+            state = self.game_state[self.player_id]
+            self.predicted = FighterSim(index + 1, state["x"], state["y"], state["flip"],
+                                        characters.character(selection)["steps"], selection)
+            self.predicted.set_state(state)
+            self.predicted_tick = self.server_tick
+            for _, buttons in self.input_history:
+                self.predict_tick(buttons)
+            self.update_fighter_state(self.local_fighter(self.player_id), self.predicted.state())
+
+    def predict_tick(self, buttons):
+        """Step our predicted fighter by one input, caller must hold prediction_lock
+
+        The opponent is its last server state (its frame decides where it can be hit),
+        loaded into one reused FighterSim every tick: damage is decided by the server
+        only, so predicted hits never change the health bars.
+        """
+        opponent_index = 1 - protocol.player_index(self.player_id)
+        opponent_state = self.game_state[protocol.PLAYER_IDS[opponent_index]]
+        selection = self.player_selection[opponent_index]
+        if self.prediction_target is None or self.prediction_target.character != selection:
+            self.prediction_target = FighterSim(0, opponent_state["x"], opponent_state["y"], opponent_state["flip"],
+                                                characters.character(selection)["steps"], selection)
+        self.prediction_target.set_state(opponent_state)
+        self.predicted_tick += 1
+        self.predicted.move(buttons, self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.prediction_target, self.game_state["round_over"])
+        self.predicted.update(self.predicted_tick)
+
     def update_fighter_state(self, fighter, state):
         """Update a fighter's state based on server data"""
+        if state["attacking"] and not fighter.attacking:
+            fighter.attack_sound.play() # The server started an attack
         fighter.rect.x = state["x"]
         fighter.rect.y = state["y"]
         fighter.health = state["health"]
+        fighter.alive = state["health"] > 0
         fighter.action = state["action"]
-        fighter.frame_index = state["frame_index"]
+        fighter.frame_index = min(state["frame_index"], len(fighter.animation_list[fighter.action]) - 1)
         fighter.flip = state["flip"]
         fighter.attacking = state["attacking"]
         fighter.hit = state["hit"]
         
     def send_data(self, data):
-        """Send data to server with error handling"""
-        """Send data to server with error handling"""
+        """Send an encoded protocol message to server with error handling"""
         if not self.connection_established:
             return
             
         try:
-            serialized_data = pickle.dumps(data)
-            self.client.send(serialized_data)
+            self.client.send(data)
         except ConnectionResetError:
             print("Connection reset by server while sending data")
             self.connection_established = False
@@ -378,12 +617,50 @@ class GameClient:
     
     def draw_text(self, text, font, text_col, x, y):
         """Draw text on screen"""
-        img = font.render(text, True, text_col) # Render text
+        img = self.text_cache.render(font, text, text_col) # Rendered once while it stays in use
         text_rect = img.get_rect(center=(x, y)) # Get text rectangle
-        self.screen.blit(img, text_rect) # Blit text on screen
+        self.dirty.add(self.screen.blit(img, text_rect)) # Blit text on screen
+
+    def draw_cached_layer(self, name, render):
+        """Draw a static screen from its cached copy
+
+        The first time, render() draws it over the background and the result is kept,
+        later frames cost one blit. Rebuilt if the window size changes, and after the
+        effects are switched (apply_quality clears the cache).
+        """
+        self.dirty.invalidate() # Full-screen, no dirty rect tracking
+        layer = self.screen_layers.get(name)
+        if layer is not None and layer.get_size() == self.screen.get_size():
+            self.screen.blit(layer, (0, 0))
+            return
+        render()
+        self.screen_layers[name] = self.screen.copy()
 
     def draw_character_selection(self):
-            """Draw character selection screen using self.player_selection"""
+        """Draw character selection screen using self.player_selection"""
+        # Portraits appear as their sheets finish loading, each one rebuilds the cached screen
+        self.draw_cached_layer(("character_selection", self.loaded_characters()), self.render_character_selection)
+
+        # Only the P1/P2 markers change from frame to frame
+        character_width, spacing, start_x = self.character_box_layout()
+        for i in range(4):
+            if self.player_selection[0] == i:
+                self.draw_text("P1", self.title_font, self.WHITE,
+                            start_x + i * (character_width + spacing) + character_width // 2, 200)
+            if self.player_selection[1] == i:
+                self.draw_text("P2", self.title_font, self.WHITE,
+                            start_x + i * (character_width + spacing) + character_width // 2, 250)
+
+    def character_box_layout(self):
+        """(box width, spacing, x of the first box) of the character selection screen"""
+        character_width = 250 #kích thuoc
+        spacing = 40 # khoảng cách các ô
+        # Tọa độ x bắt đầu, căn giữa bằng cách trừ tổng chiều rộng (4 ô + 3 khoảng cách) khỏi chiều rộng màn hình.
+        start_x = (self.SCREEN_WIDTH - (character_width * 4 + spacing * 3)) // 2
+        return character_width, spacing, start_x
+
+    def render_character_selection(self):
+            """Draw the static part of the character selection screen (see draw_cached_layer)"""
             s = pygame.Surface((self.SCREEN_WIDTH,self.SCREEN_HEIGHT))
             s.set_alpha(220)
             s.fill(self.BLACK)
@@ -393,15 +670,11 @@ class GameClient:
             self.draw_text("CHARACTER SELECTION", self.title_font, self.YELLOW, self.SCREEN_WIDTH // 2, 50)
 
             # Các ô nhân vật
-            character_width = 250 #kích thuoc
+            character_width, spacing, start_x = self.character_box_layout()
             character_height = 350
-            spacing = 40 # khoảng cách các ô
-            # Tọa độ x bắt đầu, căn giữa bằng cách trừ tổng chiều rộng (4 ô + 3 khoảng cách) khỏi chiều rộng màn hình.
-            start_x = (self.SCREEN_WIDTH - (character_width * 4 + spacing * 3)) // 2
 
             for i in range(4):
                
-                box_color = self.CHARACTER_DATA[i]["color"]
                 sprite_sheet = self.CHARACTER_DATA[i]["sheet"]
              
                 shadow_rect = pygame.Rect(start_x + i * (character_width + spacing) + 5, 125, character_width, character_height)
@@ -409,11 +682,12 @@ class GameClient:
 
               
                 rect = pygame.Rect(start_x + i * (character_width + spacing), 120, character_width, character_height)
-                gradient_surface = pygame.Surface((character_width, character_height), pygame.SRCALPHA)
-                for y in range(character_height):
-                    alpha = int(255 * (1 - y / character_height))  # Gradient effect
-                    pygame.draw.line(gradient_surface, (0, 0, 0, alpha), (0, y), (character_width, y))
-                self.screen.blit(gradient_surface, rect.topleft)
+                if self.effects:
+                    gradient_surface = pygame.Surface((character_width, character_height), pygame.SRCALPHA)
+                    for y in range(character_height):
+                        alpha = int(255 * (1 - y / character_height))  # Gradient effect
+                        pygame.draw.line(gradient_surface, (0, 0, 0, alpha), (0, y), (character_width, y))
+                    self.screen.blit(gradient_surface, rect.topleft)
 
                 # Draw the border for the character box
                 pygame.draw.rect(self.screen, self.WHITE, rect, 3)
@@ -426,11 +700,9 @@ class GameClient:
                     frame_width = self.CHARACTER_DATA[i]["data"][0]  # Kích thước frame (ví dụ: WARRIOR_SIZE)
                     frame_height = frame_width  # Giả sử chiều cao bằng chiều rộng, điều chỉnh nếu cần
                     scale_factor=2.2
-                    scale = self.CHARACTER_DATA[i]["data"][1]  # Scale factor
                     scaled_width = int(frame_width * scale_factor)  # Phóng to chiều rộng
                     scaled_height = int(frame_height * scale_factor)
 
-            #
                     character_image = sprite_sheet.subsurface(pygame.Rect(0, 0, frame_width, frame_height))
                     
                     character_image = pygame.transform.scale(character_image, (scaled_width, scaled_height))
@@ -439,40 +711,57 @@ class GameClient:
                     image_y = 140  # Đặt cách tên 50 pixel
 
             # Vẽ hình ảnh lên màn hình
-                self.screen.blit(character_image, (image_x, image_y-50))
+                    self.screen.blit(character_image, (image_x, image_y-50))
 
-               
-                if self.player_selection[0] == i:
-                    self.draw_text("P1", self.title_font, self.WHITE, 
-                                start_x + i * (character_width + spacing) + character_width // 2, 200)
-                if self.player_selection[1] == i:
-                    self.draw_text("P2", self.title_font, self.WHITE, 
-                                start_x + i * (character_width + spacing) + character_width // 2, 250)
-                                                # Vẽ instruction text
-                self.draw_text("PLAYER 1: 1-4 KEYS TO SELECT", self.controls_font, self.GREEN, self.SCREEN_WIDTH // 2, 550)
-                self.draw_text("PLAYER 2: 6-9 KEYS TO SELECT", self.controls_font, self.GREEN, self.SCREEN_WIDTH // 2, 600)
-                self.draw_text("PRESS ENTER TO START", self.controls_font, self.GREEN, self.SCREEN_WIDTH // 2, 750)
+            # Vẽ instruction text
+            self.draw_text("PLAYER 1: 1-4 KEYS TO SELECT", self.controls_font, self.GREEN, self.SCREEN_WIDTH // 2, 550)
+            self.draw_text("PLAYER 2: 6-9 KEYS TO SELECT", self.controls_font, self.GREEN, self.SCREEN_WIDTH // 2, 600)
+            self.draw_text("PRESS ENTER TO START", self.controls_font, self.GREEN, self.SCREEN_WIDTH // 2, 750)
 
         
     def draw_left_aligned_text(self, text, font, text_col, x, y): # x, y are top-left corner coordinates
         """Draw left-aligned text"""
-        img = font.render(text, True, text_col) # Render text
-        self.screen.blit(img, (x, y)) # Blit text on screen
+        img = self.text_cache.render(font, text, text_col) # Rendered once while it stays in use
+        self.dirty.add(self.screen.blit(img, (x, y))) # Blit text on screen
      
-    def draw_bg(self):
-        """Draw background"""
-        scaled_bg = pygame.transform.scale(self.bg_image, (self.SCREEN_WIDTH, self.SCREEN_HEIGHT)) # Scale background image
-        self.screen.blit(scaled_bg, (0, 0)) # Blit background on screen
+    def visible_chat_input(self, font, text, max_width):
+        """End of the chat input that fits max_width
+
+        Starts from the previous frame's first visible character, so typing or deleting
+        one character costs a couple of font.size calls instead of one per hidden character.
+        """
+        start = min(self.chat_view_start, len(text))
+        # Characters deleted: show earlier ones again while they fit
+        while start > 0 and font.size(text[start - 1:])[0] <= max_width:
+            start -= 1
+        # Characters typed: hide leading ones until the rest fits
+        while start < len(text) and font.size(text[start:])[0] > max_width:
+            start += 1
+        self.chat_view_start = start
+        return text[start:]
+
+    def draw_bg(self, surface=None):
+        """Draw background on the window, or on surface (the low-res scene)"""
+        surface = surface or self.screen
+        size = surface.get_size()
+        if self.scaled_bg is None or self.scaled_bg.get_size() != size:
+            self.scaled_bg = pygame.transform.scale(self.bg_image, size).convert() # Scale once per window size
+            self.dirty.invalidate()
+        self.dirty.erase(surface, self.scaled_bg) # Blit background on screen (only where the last frame drew in dirty-rect mode)
     
     def draw_health_bar(self, health, x, y):
         """Draw health bar"""
         ratio = health / 100 # Calculate health ratio
-        pygame.draw.rect(self.screen, self.WHITE, (x - 2, y - 2, 404, 34)) # Draw border
+        self.dirty.add(pygame.draw.rect(self.screen, self.WHITE, (x - 2, y - 2, 404, 34))) # Draw border
         pygame.draw.rect(self.screen, self.RED, (x, y, 400, 30)) # Draw red background
         pygame.draw.rect(self.screen, self.YELLOW, (x, y, 400 * ratio, 30)) # Draw yellow foreground based on health ratio
     
     def draw_controls_screen(self):
         """Draw controls screen"""
+        self.draw_cached_layer("controls", self.render_controls_screen)
+
+    def render_controls_screen(self):
+        """Draw the controls screen over the background (see draw_cached_layer)"""
         
         s = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT)) 
         s.set_alpha(220) # Set alpha for transparency
@@ -541,6 +830,10 @@ class GameClient:
     
     def waiting_screen(self):
         """Show waiting for other player screen"""
+        self.draw_cached_layer("waiting", self.render_waiting_screen)
+
+    def render_waiting_screen(self):
+        """Draw the waiting screen over the background (see draw_cached_layer)"""
         # Draw dark translucent background
         s = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
         s.set_alpha(220)
@@ -553,6 +846,7 @@ class GameClient:
     
     def connection_error_screen(self):
         """Show connection error screen"""
+        self.dirty.invalidate()
         # Draw dark background
         s = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT)) # Create a surface for the background
         s.set_alpha(255) # Set alpha for transparency
@@ -583,10 +877,12 @@ class GameClient:
         winner = self.game_state["winner"]
         
         # Create a semi-transparent overlay
-        overlay = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
-        overlay.set_alpha(180)
-        overlay.fill(self.BLACK)
-        self.screen.blit(overlay, (0, 0))
+        if self.effects:
+            overlay = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
+            overlay.set_alpha(180)
+            overlay.fill(self.BLACK)
+            self.screen.blit(overlay, (0, 0))
+            self.dirty.invalidate()
         
         # Check if this client is the winner
         if (self.player_id == "player1" and winner == 1) or (self.player_id == "player2" and winner == 2):
@@ -603,10 +899,12 @@ class GameClient:
             return
     
     # Create a semi-transparent overlay
-        overlay = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
-        overlay.set_alpha(180)
-        overlay.fill(self.BLACK)
-        self.screen.blit(overlay, (0, 0))
+        if self.effects:
+            overlay = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
+            overlay.set_alpha(180)
+            overlay.fill(self.BLACK)
+            self.screen.blit(overlay, (0, 0))
+            self.dirty.invalidate()
         
        
         # The server should be sending this information
@@ -633,7 +931,7 @@ class GameClient:
             self.draw_text("ROUND OVER", self.game_over_font, self.YELLOW, 
                   self.SCREEN_WIDTH // 2, self.SCREEN_HEIGHT // 2 - 100)
             
-    def process_input(self):
+    def process_input(self, ticks=1):
         """Process player input during gameplay"""
         if (not self.game_state or
             self.game_state["round_over"] or
@@ -655,7 +953,7 @@ class GameClient:
                 if self.chat_active:
                     if event.key == pygame.K_RETURN:
                         if self.chat_input:
-                            self.send_data({"chat": f"{self.player_id}: {self.chat_input}"})
+                            self.send_data(protocol.encode_chat(f"{self.player_id}: {self.chat_input}"))
                             self.chat_input = ""
                         self.chat_active = False
                     elif event.key == pygame.K_BACKSPACE:
@@ -666,50 +964,55 @@ class GameClient:
                     elif event.key < 128:
                         self.chat_input += event.unicode
 
-        if not self.chat_active and self.fighter_1 and self.fighter_2:
-            if self.player_id == "player1":
-                self.fighter_1.move(self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.screen, self.fighter_2, False)
-            elif self.player_id == "player2":
-                self.fighter_2.move(self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.screen, self.fighter_1, False)
-            self.send_player_state()
+        if self.fighter_1 and self.fighter_2:
+            self.send_input(ticks)
 
-    def send_player_state(self):
-        """Send current player state to server with rate limiting"""
-        current_time = pygame.time.get_ticks()
-        
-        # Only send updates at specified interval
-        if current_time - self.last_update_time < self.update_interval: #Xác định khoảng thời gian tối thiểu giữa hai lần gửi dữ liệu, giúp giảm tải cho server và tiết kiệm băng thông.
-            return
-            
-        self.last_update_time = current_time
-        
-        if self.player_id == "player1":
-            self.send_data({
-                "player_id": self.player_id,
-                "x": self.fighter_1.rect.x,
-                "y": self.fighter_1.rect.y,
-                "health": self.fighter_1.health,
-                "action": self.fighter_1.action,
-                "frame_index": self.fighter_1.frame_index,
-                "flip": self.fighter_1.flip,
-                "attacking": self.fighter_1.attacking,
-                "hit": self.fighter_1.hit
-            })
-        elif self.player_id == "player2":
-            self.send_data({
-                "player_id": self.player_id,
-                "x": self.fighter_2.rect.x,
-                "y": self.fighter_2.rect.y,
-                "health": self.fighter_2.health,
-                "action": self.fighter_2.action,
-                "frame_index": self.fighter_2.frame_index,
-                "flip": self.fighter_2.flip,
-                "attacking": self.fighter_2.attacking,
-                "hit": self.fighter_2.hit
-            })
+    def send_input(self, ticks=1):
+        """Send the buttons held this frame once per simulation tick, the server moves the fighter"""
+        buttons = 0
+        if not self.chat_active:
+            buttons = read_input(1 if self.player_id == "player1" else 2)
+        if self.advance_session(buttons, ticks):
+            return # Rollback fight, only the inputs are sent
+        for _ in range(ticks):
+            self.input_seq += 1
+            self.send_data(protocol.encode_input(self.input_seq, buttons))
+
+            # Apply it locally right away, the next snapshot confirms or corrects it
+            if self.predict:
+                with self.prediction_lock:
+                    self.input_history.append((self.input_seq, buttons))
+                    if self.predicted is not None:
+                        self.predict_tick(buttons)
+        if self.predict and ticks:
+            with self.prediction_lock:
+                if self.predicted is not None:
+                    self.update_fighter_state(self.local_fighter(self.player_id), self.predicted.state())
     
+    def apply_quality(self):
+        """Effects and render scale of the governor's quality level"""
+        effects = self.governor.level < NO_EFFECTS
+        if effects != self.effects:
+            self.screen_layers.clear() # Their gradients were drawn with the other setting
+        self.effects = effects
+        scale = LOW_RES_SCALE if self.low_res or self.governor.level >= LOW_RES else 1
+        if scale != self.framebuffer.scale:
+            self.set_render_scale(scale)
+        print(f"Render quality level {self.governor.level}")
+
+    def set_render_scale(self, scale):
+        """Draw the fight at another framebuffer scale, the fighters' frames are loaded for it"""
+        self.framebuffer.scale = scale
+        self.dirty.enabled = self.dirty_rects and scale == 1
+        self.dirty.invalidate()
+        for fighter, index in ((self.fighter_1, self.player_selection[0]), (self.fighter_2, self.player_selection[1])):
+            if fighter is not None:
+                self.load_character(index)
+                fighter.set_render_scale(scale)
+
     def run(self):
         """Main game loop"""
+        self.wait_for_assets() # First interactive frame as soon as the menus can be drawn
         while True:
             # Attempt to connect if not connected
             if not self.connection_established and self.connection_retry_count == 0:
@@ -719,7 +1022,7 @@ class GameClient:
             
             # Game loop
             while self.running:
-                self.clock.tick(self.FPS)
+                ticks = self.governor.begin_frame() # Simulation ticks to send inputs for this frame
                 
                 # Check connection status
                 if not self.connection_established:
@@ -734,8 +1037,11 @@ class GameClient:
                         self.client.close()
                         sys.exit()
                 else:
-                    # Draw background
-                    self.draw_bg()
+                    # Draw background (the fight is drawn on the scene, the window itself unless low-res)
+                    in_game = (not self.show_controls and not self.character_selection and self.game_state
+                               and self.game_state.get("game_active", False))
+                    scene = self.framebuffer.scene(self.screen) if in_game else self.screen
+                    self.draw_bg(scene)
                     
                     # Check if we're in control screen
                     if self.show_controls:
@@ -782,11 +1088,7 @@ class GameClient:
                                         selection_changed = True
                                 if event.key == pygame.K_RETURN:
                                     selected_index = self.player_selection[0] if self.player_id == "player1" else self.player_selection[1]
-                                    self.send_data({
-                                            "status": "ready",
-                                            "player_id": self.player_id,
-                                            "selection": selected_index
-                                        })
+                                    self.send_data(protocol.encode_ready(selected_index, self.rollback))
                                     print(f"Sent ready signal with selection: {selected_index}")
                                                                     
                             if selection_changed:
@@ -794,11 +1096,7 @@ class GameClient:
                                     if self.player_id == "player1"
                                     else self.player_selection[1])
 
-                                self.send_data({
-                                    "status": "selection_update",     # thống nhất tên
-                                    "player_id": self.player_id,
-                                    "selection": selected_index       # chỉ 1 số duy nhất
-                                    })
+                                self.send_data(protocol.encode_selection(selected_index))  # chỉ 1 số duy nhất
 
                         
                         # Exit character selection only when server confirms game_active
@@ -815,35 +1113,49 @@ class GameClient:
                                 if not self.fighter_1 and not self.fighter_2:
                                     self.create_fighters()
                             
+                                if not in_game: # The match started after the background was drawn
+                                    scene = self.framebuffer.scene(self.screen)
+                                    self.draw_bg(scene)
+                                round_result = ("round_over" in self.game_state and self.game_state["round_over"]
+                                                and not self.game_state["game_over"])
+                                counting = "intro_count" in self.game_state and self.game_state["intro_count"] > 0
+                                if not round_result and not counting:
+                                    # Process player input
+                                    self.process_input(ticks)
+                                elif self.session is not None:
+                                    self.send_input(ticks) # A rollback fight goes on until the server starts the next round
+                                
+                                # Fighters are animated by the server, see update_fighter_state
+                                self.update_remote_fighter()
+                                
+                                # Draw fighters, then scale the scene up to the window (low-res) before the HUD
+                                self.dirty.add(self.fighter_1.draw(scene))
+                                self.dirty.add(self.fighter_2.draw(scene))
+                                self.framebuffer.upscale(self.screen)
+                            
                                 # Update health bars
-                                if "player1" in self.game_state and "health" in self.game_state["player1"]:
-                                    self.draw_health_bar(self.game_state["player1"]["health"], 20, 20)
-                                if "player2" in self.game_state and "health" in self.game_state["player2"]:
-                                    self.draw_health_bar(self.game_state["player2"]["health"], self.SCREEN_WIDTH - 420, 20)
+                                if self.session is not None:
+                                    # Rollback fight, our simulation is ahead of the server's
+                                    self.draw_health_bar(self.fighter_1.health, 20, 20)
+                                    self.draw_health_bar(self.fighter_2.health, self.SCREEN_WIDTH - 420, 20)
+                                else:
+                                    if "player1" in self.game_state and "health" in self.game_state["player1"]:
+                                        self.draw_health_bar(self.game_state["player1"]["health"], 20, 20)
+                                    if "player2" in self.game_state and "health" in self.game_state["player2"]:
+                                        self.draw_health_bar(self.game_state["player2"]["health"], self.SCREEN_WIDTH - 420, 20)
                                 
                                 # Update scores
                                 if "scores" in self.game_state:
                                     self.draw_left_aligned_text("P1: " + str(self.game_state["scores"][0]), self.score_font, self.RED, 20, 60)
-                                    self.draw_left_aligned_text("P2: " + str(self.game_state["scores"][1]), self.score_font, self.RED, self.SCREEN_WIDTH - 20 - self.score_font.size("P2: " + str(self.game_state["scores"][1]))[0], 60)
+                                    self.draw_left_aligned_text("P2: " + str(self.game_state["scores"][1]), self.score_font, self.RED, self.SCREEN_WIDTH - 20 - self.text_cache.render(self.score_font, "P2: " + str(self.game_state["scores"][1]), self.RED).get_width(), 60)
                                 
                                 # Check if round is over
-                                if "round_over" in self.game_state and self.game_state["round_over"] and not self.game_state["game_over"]:
+                                if round_result:
                                     self.display_round_result()
-                                elif "intro_count" in self.game_state and self.game_state["intro_count"] > 0:
+                                elif counting:
                                     # Display count timer
                                     self.draw_text(str(self.game_state["intro_count"]), self.count_font, self.RED, 
                                                  self.SCREEN_WIDTH / 2, self.SCREEN_HEIGHT / 3)
-                                else:
-                                    # Process player input
-                                    self.process_input()
-                                
-                                # Update fighters
-                                self.fighter_1.update()
-                                self.fighter_2.update()
-                                
-                                # Draw fighters
-                                self.fighter_1.draw(self.screen)
-                                self.fighter_2.draw(self.screen)
                                 
                                 # Check for game over
                                 if "game_over" in self.game_state and self.game_state["game_over"]:
@@ -857,33 +1169,37 @@ class GameClient:
 
                                 # --------- New compact chat bubble ---------
                                 if self.chat_messages and self.show_chat_messages:
-                                    font = pygame.font.Font(None, 30)
-                                    recent_messages = self.chat_messages[-self.max_chat_messages:]
+                                    font = self.chat_font
+                                    recent_messages = [self.text_cache.render(font, msg, self.WHITE) for msg in self.chat_messages]
 
                                    
-                                    max_width = max(font.size(msg)[0] for msg in recent_messages)
+                                    max_width = max(txt_surf.get_width() for txt_surf in recent_messages)
                                     line_height = font.get_height()
                                     box_w = min(max_width + 40, int(self.SCREEN_WIDTH * 0.5))
                                     box_h = line_height * len(recent_messages) + 20
 
                                     
-                                    chat_bg = pygame.Surface((box_w, box_h), pygame.SRCALPHA)
-                                    pygame.draw.rect(
-                                        chat_bg,
-                                        (0, 0, 0, self.CHAT_BG_ALPHA),  
-                                        chat_bg.get_rect(),
-                                        border_radius=self.CHAT_BG_RADIUS
-                                    )
-
-                                   
                                     pos_x = 20
                                     pos_y = 90
-                                    self.screen.blit(chat_bg, (pos_x, pos_y))
+                                    if self.effects:
+                                        chat_bg = self.chat_surfaces.get(("bubble", box_w, box_h))
+                                        if chat_bg is None:
+                                            chat_bg = self.chat_surfaces[("bubble", box_w, box_h)] = pygame.Surface((box_w, box_h), pygame.SRCALPHA)
+                                            pygame.draw.rect(
+                                                chat_bg,
+                                                (0, 0, 0, self.CHAT_BG_ALPHA),  
+                                                chat_bg.get_rect(),
+                                                border_radius=self.CHAT_BG_RADIUS
+                                            )
+                                        self.dirty.add(self.screen.blit(chat_bg, (pos_x, pos_y)))
+                                    else:
+                                        # Opaque, no blending
+                                        self.dirty.add(pygame.draw.rect(self.screen, self.BLACK, (pos_x, pos_y, box_w, box_h),
+                                                                        border_radius=self.CHAT_BG_RADIUS))
 
                                     
-                                    for i, msg in enumerate(recent_messages):
-                                        txt_surf = font.render(msg, True, self.WHITE)
-                                        self.screen.blit(txt_surf, (pos_x + 20, pos_y + 10 + i * line_height))
+                                    for i, txt_surf in enumerate(recent_messages):
+                                        self.dirty.add(self.screen.blit(txt_surf, (pos_x + 20, pos_y + 10 + i * line_height)))
                                 
                                 
                                 
@@ -895,35 +1211,38 @@ class GameClient:
                                     box_y = self.SCREEN_HEIGHT - self.CHAT_H - self.CHAT_MARGIN
 
                             
-                                    bg = pygame.Surface((box_w, self.CHAT_H), pygame.SRCALPHA)
-                                    bg.fill(self.LIGHT_GRAY)
-                                    pygame.draw.rect(bg, self.GRAY, bg.get_rect(), 2, border_radius=10)
-                                    self.screen.blit(bg, (box_x, box_y))
+                                    bg = self.chat_surfaces.get(("input", box_w))
+                                    if bg is None:
+                                        bg = self.chat_surfaces[("input", box_w)] = pygame.Surface((box_w, self.CHAT_H), pygame.SRCALPHA)
+                                        bg.fill(self.LIGHT_GRAY)
+                                        pygame.draw.rect(bg, self.GRAY, bg.get_rect(), 2, border_radius=10)
+                                    self.dirty.add(self.screen.blit(bg, (box_x, box_y)))
 
-                                    font = pygame.font.Font(None, 32)
+                                    font = self.chat_input_font
                                     raw_text    = self.chat_input
                                     placeholder = "Chat:"
 
                                     text = raw_text if raw_text else placeholder
                                     max_text_w = box_w - 2*self.CHAT_PAD_X
                                     
-                                    while font.size(text)[0] > max_text_w:
-                                        text = text[1:]
+                                    text = self.visible_chat_input(font, text, max_text_w)
 
-                                    text_surf = font.render(text, True, self.BLACK)
+                                    text_surf = self.text_cache.render(font, text, self.BLACK)
                                     text_pos  = (box_x + self.CHAT_PAD_X, box_y + self.CHAT_PAD_Y)
-                                    self.screen.blit(text_surf, text_pos)
+                                    self.dirty.add(self.screen.blit(text_surf, text_pos))
 
                                     
                                     if self.chat_active and pygame.time.get_ticks() % 1000 < 500:
                                         cur_x = text_pos[0] + text_surf.get_width() + 2
                                         top_y = text_pos[1]
                                         bot_y = top_y + text_surf.get_height()
-                                        pygame.draw.line(self.screen, self.GREEN,
-                                                (cur_x, top_y), (cur_x, bot_y), 2)
+                                        self.dirty.add(pygame.draw.line(self.screen, self.GREEN,
+                                                (cur_x, top_y), (cur_x, bot_y), 2))
 
                 # Update display
-                pygame.display.update()
+                self.dirty.present(self.screen)
+                if self.governor.end_frame():
+                    self.apply_quality()
                 
                 # Handle events
                 for event in pygame.event.get():
@@ -961,17 +1280,27 @@ def main():
     # Try to read server address from command line arguments
     server_host = 'localhost'
     server_port = 5555
+    room_id = None
+    predict = "--no-predict" not in sys.argv # Show our fighter from the server state only
+    udp = "--udp" in sys.argv # The server must be started with --udp too
+    dirty_rects = "--dirty-rects" in sys.argv # Faster on machines without GPU acceleration
+    low_res = "--low-res" in sys.argv # Draw the fight at a lower resolution, scaled up to the window
+    adaptive = "--fixed-quality" not in sys.argv # Keep the effects and resolution even when frames are late
+    rollback = "--rollback" in sys.argv # Exchange inputs only and simulate the fight here, if the opponent asks too
+    args = [arg for arg in sys.argv if not arg.startswith("--")]
     
-    if len(sys.argv) > 1:
-        server_host = sys.argv[1]
-    if len(sys.argv) > 2:
+    if len(args) > 1:
+        server_host = args[1]
+    if len(args) > 2:
         try:
-            server_port = int(sys.argv[2])
+            server_port = int(args[2])
         except ValueError:
-            print(f"Invalid port number: {sys.argv[2]}. Using default port 5555.")
+            print(f"Invalid port number: {args[2]}. Using default port 5555.")
+    if len(args) > 3:
+        room_id = args[3]
     
     # Create and run game client
-    game = GameClient(host=server_host, port=server_port)
+    game = GameClient(host=server_host, port=server_port, room_id=room_id, predict=predict, udp=udp, dirty_rects=dirty_rects, low_res=low_res, adaptive=adaptive, rollback=rollback)
     game.run()
 
 if __name__ == "__main__":
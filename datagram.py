@@ -0,0 +1,110 @@
+import struct
+import threading
+import time
+
+import protocol
+
+# UDP transport: every datagram carries one protocol message behind a small header.
+# Snapshots, inputs, input frames and snapshot acks are sent once (a newer one replaces a
+# lost one), every other message is numbered, resent until acknowledged and delivered in order.
+
+KIND_UNRELIABLE = 1  # payload may be lost or arrive out of order
+KIND_RELIABLE = 2    # payload numbered with seq
+KIND_ACK = 3         # no payload, acknowledges reliable messages and keeps the peer alive
+KIND_CLOSE = 4       # peer is leaving
+
+# kind, reliable seq (0 if none), last reliable seq received in order
+HEADER = struct.Struct("!BII")
+
+UNRELIABLE_OPS = frozenset((protocol.OP_SNAPSHOT, protocol.OP_INPUT, protocol.OP_ACK, protocol.OP_INPUT_FRAMES))
+MAX_DATAGRAM_SIZE = 65507
+
+
+class ReliableChannel:
+    """Reliability state of one UDP peer, the socket is behind send_datagram(bytes)
+
+    Used from two threads (game loop sending, network thread receiving and polling),
+    so every method takes the channel lock.
+    """
+    def __init__(self, send_datagram, resend_interval=0.1, keepalive_interval=1.0, clock=time.monotonic):
+        self.send_datagram = send_datagram
+        self.resend_interval = resend_interval  # Seconds before an unacknowledged message is sent again
+        self.keepalive_interval = keepalive_interval  # Seconds of silence before an empty ack is sent
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.next_seq = 1  # seq of the next reliable message
+        self.unacked = {}  # seq -> [payload, last send time], oldest first
+        self.received_seq = 0  # Last reliable seq delivered in order
+        self.out_of_order = {}  # seq -> payload received before the ones preceding it
+        self.last_sent = 0
+        self.last_received = clock()
+        self.closed = False  # Peer sent KIND_CLOSE
+
+    def send(self, payload):
+        """Send one protocol message, reliably unless its opcode is in UNRELIABLE_OPS"""
+        with self.lock:
+            if protocol.opcode(payload) in UNRELIABLE_OPS:
+                self.send_packet(KIND_UNRELIABLE, 0, payload)
+            else:
+                seq = self.next_seq
+                self.next_seq += 1
+                self.unacked[seq] = [payload, self.clock()]
+                self.send_packet(KIND_RELIABLE, seq, payload)
+
+    def receive(self, datagram):
+        """Handle one datagram, returns the payloads now ready for the application, in order"""
+        kind, seq, ack = HEADER.unpack_from(datagram)
+        payload = bytes(datagram[HEADER.size:])
+        with self.lock:
+            self.last_received = self.clock()
+            # Every datagram acknowledges the reliable messages the peer received
+            for acked in [acked for acked in self.unacked if acked <= ack]:
+                del self.unacked[acked]
+
+            if kind == KIND_UNRELIABLE:
+                return [payload]
+            if kind == KIND_CLOSE:
+                self.closed = True
+                return []
+            if kind != KIND_RELIABLE:
+                return []
+
+            if seq > self.received_seq:
+                self.out_of_order[seq] = payload
+            ready = []
+            while self.received_seq + 1 in self.out_of_order:
+                self.received_seq += 1
+                ready.append(self.out_of_order.pop(self.received_seq))
+            # Ack duplicates too, the previous ack may be the one that was lost
+            self.send_packet(KIND_ACK, 0)
+            return ready
+
+    def poll(self):
+        """Resend the overdue reliable messages and keep the peer alive, call it often"""
+        with self.lock:
+            now = self.clock()
+            for seq, entry in self.unacked.items():
+                if now - entry[1] >= self.resend_interval:
+                    entry[1] = now
+                    self.send_packet(KIND_RELIABLE, seq, entry[0])
+            if now - self.last_sent >= self.keepalive_interval:
+                self.send_packet(KIND_ACK, 0)
+
+    def idle_time(self):
+        """Seconds since the last datagram from the peer"""
+        return self.clock() - self.last_received
+
+    def close(self):
+        """Tell the peer we are leaving (best effort, not resent)"""
+        with self.lock:
+            self.send_packet(KIND_CLOSE, 0)
+
+    def send_packet(self, kind, seq, payload=b""):
+        """Send one datagram, caller must hold the lock"""
+        self.last_sent = self.clock()
+        try:
+            self.send_datagram(HEADER.pack(kind, seq, self.received_seq) + payload)
+        except OSError as e:
+            # Datagrams may be lost anyway, reliable ones are resent by poll
+            print(f"Error sending datagram: {e}")
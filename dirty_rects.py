@@ -0,0 +1,49 @@
+import pygame
+
+# Dirty-rectangle rendering: instead of redrawing and pushing the whole window every
+# frame, the background is restored only where the last frame drew, and only the areas
+# drawn in the last and the current frame are sent to the display.
+
+
+class DirtyRects:
+    """Areas of the window drawn this frame and the previous one
+
+    Every in-game draw must go through add(). Screens that draw everywhere (menus,
+    full-screen overlays) call invalidate(), which also redraws the frame after them.
+    With enabled False every frame is a full redraw, as without this class.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.rects = []  # Drawn this frame
+        self.previous = []  # Drawn last frame: erased, then updated once more
+        self.full = True  # This frame redraws and updates the whole window
+
+    def add(self, rect):
+        """Record an area drawn this frame, returns it (blit and pygame.draw results can be passed directly)"""
+        if rect:
+            self.rects.append(rect)
+        return rect
+
+    def invalidate(self):
+        """Redraw and update the whole window this frame and the next one"""
+        self.full = True
+
+    def erase(self, surface, background):
+        """Draw the background over what the previous frame drew (everything after invalidate)"""
+        if not self.enabled or self.full:
+            surface.blit(background, (0, 0))
+        else:
+            for rect in self.previous:
+                surface.blit(background, rect, rect)
+
+    def present(self, surface):
+        """Send the changed areas to the display and start a new frame"""
+        if not self.enabled or self.full:
+            pygame.display.update()
+            # The next frame does not know what this one drew, it erases everything
+            self.previous = [surface.get_rect()]
+        else:
+            pygame.display.update(self.previous + self.rects)
+            self.previous = self.rects
+        self.rects = []
+        self.full = False
@@ -1,202 +1,137 @@
 import pygame
+import simulation
+
+#keys of each player, as simulation.INPUT_* bits
+KEY_BINDINGS = {
+  1: ((pygame.K_a, simulation.INPUT_LEFT), (pygame.K_d, simulation.INPUT_RIGHT), (pygame.K_w, simulation.INPUT_JUMP),
+      (pygame.K_r, simulation.INPUT_ATTACK1), (pygame.K_t, simulation.INPUT_ATTACK2), (pygame.K_y, simulation.INPUT_ATTACK3)),
+  2: ((pygame.K_LEFT, simulation.INPUT_LEFT), (pygame.K_RIGHT, simulation.INPUT_RIGHT), (pygame.K_UP, simulation.INPUT_JUMP),
+      (pygame.K_j, simulation.INPUT_ATTACK1), (pygame.K_k, simulation.INPUT_ATTACK2), (pygame.K_l, simulation.INPUT_ATTACK3)),
+}
+
+def read_input(player):
+  #buttons currently held by a player, packed as simulation.INPUT_* bits
+  key = pygame.key.get_pressed()
+  buttons = 0
+  for key_code, bit in KEY_BINDINGS[player]:
+    if key[key_code]:
+      buttons |= bit
+  return buttons
+
+#animation frames cut and scaled from a sprite sheet, built once per process and shared
+#by every Fighter of that character (both players of a mirror match, every round)
+FRAME_CACHE = {}
+#frame -> the same frame mirrored horizontally, built with the frames so draw never flips
+MIRRORED_FRAMES = {}
+#frame -> area of its visible (non transparent) pixels, what a draw really changes on screen
+FRAME_BOUNDS = {}
+
+def load_frames(sprite_sheet, size, image_scale, animation_steps):
+  #frames of each action, keyed by (sheet, size, scale, animation_steps)
+  key = (sprite_sheet, size, image_scale, tuple(animation_steps))
+  animation_list = FRAME_CACHE.get(key)
+  if animation_list is None:
+    animation_list = []
+    for y, animation in enumerate(animation_steps):
+      temp_img_list = []
+      for x in range(animation):
+        temp_img = sprite_sheet.subsurface(x * size, y * size, size, size)
+        temp_img = pygame.transform.scale(temp_img, (round(size * image_scale), round(size * image_scale)))
+        add_frame(temp_img)
+        temp_img_list.append(temp_img)
+      animation_list.append(temp_img_list)
+    FRAME_CACHE[key] = animation_list
+  return animation_list
+
+def add_frames(sprite_sheet, size, image_scale, animation_steps, animation_list, mirrored_list, bounds_list):
+  #frames built elsewhere (asset_pack) with their mirrored frames and visible areas,
+  #load_frames of the same arguments returns them
+  for temp_img_list, mirrored_imgs, bounds in zip(animation_list, mirrored_list, bounds_list):
+    for temp_img, mirrored, rect in zip(temp_img_list, mirrored_imgs, bounds):
+      add_frame(temp_img, mirrored, rect)
+  FRAME_CACHE[(sprite_sheet, size, image_scale, tuple(animation_steps))] = animation_list
+
+def add_frame(img, mirrored=None, bounds=None):
+  #mirrored frame and visible areas of a new frame, computed unless given
+  if mirrored is None:
+    mirrored = pygame.transform.flip(img, True, False)
+  if bounds is None:
+    bounds = img.get_bounding_rect()
+  MIRRORED_FRAMES[img] = mirrored
+  FRAME_BOUNDS[img] = bounds
+  FRAME_BOUNDS[mirrored] = pygame.Rect(img.get_width() - bounds.right, bounds.y, bounds.width, bounds.height)
+
+def sim_attribute(name):
+  #Fighter attribute kept in its FighterSim
+  return property(lambda self: getattr(self.sim, name), lambda self, value: setattr(self.sim, name, value))
 
 class Fighter():
-  def __init__(self, player, x, y, flip, data, sprite_sheet, animation_steps, sound):
+  #draws a fighter and plays its sounds, the state and the rules are in simulation.FighterSim
+  rect = sim_attribute("rect")
+  flip = sim_attribute("flip")
+  action = sim_attribute("action")#0:idle #1:run #2:jump #3:attack1 #4: attack2 #5:hit #6:death
+  frame_index = sim_attribute("frame_index")
+  vel_y = sim_attribute("vel_y")
+  running = sim_attribute("running")
+  jump = sim_attribute("jump")
+  attacking = sim_attribute("attacking")
+  attack_type = sim_attribute("attack_type")
+  attack_cooldown = sim_attribute("attack_cooldown")
+  hit = sim_attribute("hit")
+  health = sim_attribute("health")
+  alive = sim_attribute("alive")
+
+  def __init__(self, player, x, y, flip, data, sprite_sheet, animation_steps, sound, render_scale=1, character=0):
+    #character: index in characters.CHARACTERS, for the hitboxes of the frames
     self.player = player
+    self.sim = simulation.FighterSim(player, x, y, flip, animation_steps, character)
     self.size = data[0]
     self.image_scale = data[1]
     self.offset = data[2]
-    self.flip = flip
+    #draw on a surface this many times smaller than the window (framebuffer.Framebuffer),
+    #the frames are scaled by image_scale / render_scale
+    self.render_scale = render_scale
+    self.sprite_sheet = sprite_sheet
+    self.animation_steps = animation_steps
     self.animation_list = self.load_images(sprite_sheet, animation_steps)
-    self.action = 0#0:idle #1:run #2:jump #3:attack1 #4: attack2 #5:hit #6:death
-    self.frame_index = 0
-    self.image = self.animation_list[self.action][self.frame_index]
-    self.update_time = pygame.time.get_ticks()
-    self.rect = pygame.Rect((x, y, 80, 180))
-    self.vel_y = 0
-    self.running = False
-    self.jump = False
-    self.attacking = False
-    self.attack_type = 0
-    self.attack_cooldown = 0
     self.attack_sound = sound
-    self.hit = False
-    self.health = 100
-    self.alive = True
 
 
   def load_images(self, sprite_sheet, animation_steps):
-    #extract images from spritesheet
-    animation_list = []
-    for y, animation in enumerate(animation_steps):
-      temp_img_list = []
-      for x in range(animation):
-        temp_img = sprite_sheet.subsurface(x * self.size, y * self.size, self.size, self.size)
-        temp_img_list.append(pygame.transform.scale(temp_img, (self.size * self.image_scale, self.size * self.image_scale)))
-      animation_list.append(temp_img_list)
-    return animation_list
-
-
-  def move(self, screen_width, screen_height, surface, target, round_over):
-    SPEED = 10
-    GRAVITY = 2
-    dx = 0
-    dy = 0
-    self.running = False
-    self.attack_type = 0
-
-    #get keypresses
-    key = pygame.key.get_pressed()
-
-    #can only perform other actions if not currently attacking
-    if self.attacking == False and self.alive == True and round_over == False:
-      #check player 1 controls
-      if self.player == 1:
-        #movement
-        if key[pygame.K_a]:
-          dx = -SPEED
-          self.running = True
-        if key[pygame.K_d]:
-          dx = SPEED
-          self.running = True
-        #jump
-        if key[pygame.K_w] and self.jump == False:
-          self.vel_y = -30
-          self.jump = True
-        #attack
-        if key[pygame.K_r] or key[pygame.K_t] or key[pygame.K_y]:
-          self.attack(target)
-          #determine which attack type was used
-          if key[pygame.K_r]:
-            self.attack_type = 1
-          if key[pygame.K_t]:
-            self.attack_type = 2
-          if key[pygame.K_y]:
-            self.attack_type = 3
-
-
-      #check player 2 controls
-      if self.player == 2:
-        #movement
-        if key[pygame.K_LEFT]:
-          dx = -SPEED
-          self.running = True
-        if key[pygame.K_RIGHT]:
-          dx = SPEED
-          self.running = True
-        #jump
-        if key[pygame.K_UP] and self.jump == False:
-          self.vel_y = -30
-          self.jump = True
-        #attack
-        if key[pygame.K_j] or key[pygame.K_k] or key[pygame.K_l]:
-          self.attack(target)
-          #determine which attack type was used
-          if key[pygame.K_j]:
-            self.attack_type = 1
-          if key[pygame.K_k]:
-            self.attack_type = 2
-          if key[pygame.K_l]:
-            self.attack_type = 3
-
-
-    #apply gravity
-    self.vel_y += GRAVITY
-    dy += self.vel_y
-
-    #ensure player stays on screen
-    if self.rect.left + dx < 0:
-      dx = -self.rect.left
-    if self.rect.right + dx > screen_width:
-      dx = screen_width - self.rect.right
-    if self.rect.bottom + dy > screen_height - 110:
-      self.vel_y = 0
-      self.jump = False
-      dy = screen_height - 110 - self.rect.bottom
-
-    #ensure players face each other
-    if target.rect.centerx > self.rect.centerx:
-      self.flip = False
-    else:
-      self.flip = True
-
-    #apply attack cooldown
-    if self.attack_cooldown > 0:
-      self.attack_cooldown -= 1
-
-    #update player position
-    self.rect.x += dx
-    self.rect.y += dy
+    #extract images from spritesheet (shared, see load_frames)
+    return load_frames(sprite_sheet, self.size, self.image_scale / self.render_scale, animation_steps)
 
 
-  #handle animation updates
-  def update(self):
-    #check what action the player is performing
-    if self.health <= 0:
-      self.health = 0
-      self.alive = False
-      self.update_action(6)#6:death
-    elif self.hit == True:
-      self.update_action(5)#5:hit
-    elif self.attacking == True:
-      if self.attack_type == 1:
-        self.update_action(3)#3:attack1
-      elif self.attack_type == 2:
-        self.update_action(4)#4:attack2
-      elif self.attack_type == 3:
-        self.update_action(4)#Tạm thời dùng animation attack2 cho attack3
-    elif self.jump == True:
-      self.update_action(2)#2:jump
-    elif self.running == True:
-      self.update_action(1)#1:run
-    else:
-      self.update_action(0)#0:idle
-
-    animation_cooldown = 50
-    #update image
-    self.image = self.animation_list[self.action][self.frame_index]
-    #check if enough time has passed since the last update
-    if pygame.time.get_ticks() - self.update_time > animation_cooldown:
-      self.frame_index += 1
-      self.update_time = pygame.time.get_ticks()
-    #check if the animation has finished
-    if self.frame_index >= len(self.animation_list[self.action]):
-      #if the player is dead then end the animation
-      if self.alive == False:
-        self.frame_index = len(self.animation_list[self.action]) - 1
-      else:
-        self.frame_index = 0
-        #check if an attack was executed
-        if self.action == 3 or self.action == 4:
-          self.attacking = False
-          self.attack_cooldown = 20
-        #check if damage was taken
-        if self.action == 5:
-          self.hit = False
-          #if the player was in the middle of an attack, then the attack is stopped
-          self.attacking = False
-          self.attack_cooldown = 20
-
-
-  def attack(self, target):
-    if self.attack_cooldown == 0:
-      #execute attack
-      self.attacking = True
+  def set_render_scale(self, render_scale):
+    #draw on a framebuffer of another scale from now on
+    self.render_scale = render_scale
+    self.animation_list = self.load_images(self.sprite_sheet, self.animation_steps)
+
+
+  def move(self, inputs, screen_width, screen_height, target, round_over):
+    #one simulation tick of the buttons held (simulation.INPUT_* bits, see read_input)
+    attacking = self.attacking
+    self.sim.move(inputs, screen_width, screen_height, target.sim, round_over)
+    if self.attacking and not attacking:
       self.attack_sound.play()
-      attacking_rect = pygame.Rect(self.rect.centerx - (2 * self.rect.width * self.flip), self.rect.y, 2 * self.rect.width, self.rect.height)
-      if attacking_rect.colliderect(target.rect):
-        target.health -= 10
-        target.hit = True
 
 
-  def update_action(self, new_action):
-    #check if the new action is different to the previous one
-    if new_action != self.action:
-      self.action = new_action
-      #update the animation settings
-      self.frame_index = 0
-      self.update_time = pygame.time.get_ticks()
+  #handle animation updates
+  def update(self, tick):
+    #advance the animation to a simulation tick
+    self.sim.update(tick)
+
+
+  @property
+  def image(self):
+    #frame of the current action
+    frames = self.animation_list[self.action]
+    return frames[min(self.frame_index, len(frames) - 1)]
 
   def draw(self, surface):
-    img = pygame.transform.flip(self.image, self.flip, False)
-    surface.blit(img, (self.rect.x - (self.offset[0] * self.image_scale), self.rect.y - (self.offset[1] * self.image_scale)))
\ No newline at end of file
+    img = MIRRORED_FRAMES[self.image] if self.flip else self.image
+    x = (self.rect.x - (self.offset[0] * self.image_scale)) // self.render_scale
+    y = (self.rect.y - (self.offset[1] * self.image_scale)) // self.render_scale
+    surface.blit(img, (x, y))
+    #return the screen area that changed, for dirty-rect rendering
+    return FRAME_BOUNDS[img].move(x, y).clip(surface.get_rect())
@@ -0,0 +1,88 @@
+import time
+
+# Frame pacing. The game advances in fixed simulation ticks (1 / simulation.TICK_RATE)
+# whatever the frame rate: begin_frame() waits for the next frame and says how many ticks
+# to run, so a slow machine shows fewer frames of a game running at the same speed. When updating and drawing a
+# frame take longer than the frame budget, the quality is lowered one level at a time,
+# and raised again after a while under budget.
+
+FULL_QUALITY = 0
+NO_EFFECTS = 1  # No translucent overlays, chat bubble or gradients
+LOW_RES = 2  # And the fight drawn at framebuffer.LOW_RES_SCALE
+
+
+class FrameGovernor:
+    """Frame pacing, fixed-step tick counter and frame time budget of a render loop
+
+    Call begin_frame() instead of clock.tick() (it waits whole frame intervals, not
+    whole milliseconds, clock.tick(60) runs at 62.5 FPS) and end_frame() after the
+    display update.
+    """
+    def __init__(self, fps, tick_rate, adaptive=True, max_ticks=5):
+        self.BUDGET = 1 / fps  # Seconds per frame
+        self.TICK_INTERVAL = 1 / tick_rate
+        self.MAX_TICKS = max_ticks  # Ticks run in one frame at most, the game slows down rather than spiral
+        self.SLOW_FRAMES = 60  # Frames over budget before the quality is lowered
+        self.adaptive = adaptive  # False: the quality stays FULL_QUALITY
+        self.level = FULL_QUALITY
+        self.fast_frames_needed = 300  # Frames well under budget before the quality is raised, doubled on every drop
+        self.accumulator = 0.0  # Seconds not simulated yet
+        self.last_time = None
+        self.next_frame = 0.0  # When the next frame starts
+        self.frame_start = 0.0
+        self.work_time = 0.0  # Moving average of the seconds spent per frame, sleeping excluded
+        self.slow_frames = 0
+        self.fast_frames = 0
+
+    def begin_frame(self):
+        """Wait for the next frame, returns the number of simulation ticks to run in it"""
+        now = time.perf_counter()
+        if now < self.next_frame:
+            time.sleep(self.next_frame - now)
+            now = time.perf_counter()
+        # Frames late by more than one interval start a new schedule instead of catching up
+        self.next_frame = max(self.next_frame + self.BUDGET, now)
+        self.frame_start = now
+        if self.last_time is None:
+            self.last_time = now
+            # Half a tick ahead: frame times jittering around the tick interval still run one tick each
+            self.accumulator = self.TICK_INTERVAL / 2
+            return 1
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        ticks = int(self.accumulator / self.TICK_INTERVAL)
+        if ticks > self.MAX_TICKS:
+            ticks = self.MAX_TICKS
+            self.accumulator = 0.0  # Drop the time that cannot be caught up
+        else:
+            self.accumulator -= ticks * self.TICK_INTERVAL
+        return ticks
+
+    def end_frame(self):
+        """End a frame, returns True if the quality level changed"""
+        self.work_time += (time.perf_counter() - self.frame_start - self.work_time) * 0.1
+        if not self.adaptive:
+            return False
+        if self.work_time > self.BUDGET * 0.9:
+            self.slow_frames += 1
+            self.fast_frames = 0
+        elif self.work_time < self.BUDGET * 0.5:
+            self.fast_frames += 1
+            self.slow_frames = 0
+        else:
+            self.slow_frames = self.fast_frames = 0
+
+        if self.slow_frames >= self.SLOW_FRAMES and self.level < LOW_RES:
+            self.set_level(self.level + 1)
+            self.fast_frames_needed = min(self.fast_frames_needed * 2, 3600)  # Raise it back later each time
+            return True
+        if self.fast_frames >= self.fast_frames_needed and self.level > FULL_QUALITY:
+            self.set_level(self.level - 1)
+            return True
+        return False
+
+    def set_level(self, level):
+        """Change the quality level, the frame time is measured again from there"""
+        self.level = level
+        self.work_time = self.BUDGET * 0.7
+        self.slow_frames = self.fast_frames = 0
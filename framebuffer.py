@@ -0,0 +1,30 @@
+import pygame
+
+# Low-resolution rendering: the world (background and fighters) is drawn on a surface
+# `scale` times smaller than the window, with the sprites near their native size instead
+# of pre-scaled 3-4x, then scaled up to the window once per frame. The HUD (health bars,
+# text, chat) is drawn on the window afterwards, at full resolution.
+
+LOW_RES_SCALE = 3  # The characters scaled 3x are drawn at native size, the warrior (4x) at 4/3
+
+
+class Framebuffer:
+    """Surface the world is drawn on: the window itself, or a smaller one with scale > 1"""
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.surface = None
+
+    def scene(self, window):
+        """Surface to draw the world on this frame, in window coordinates // scale"""
+        if self.scale == 1:
+            return window
+        width, height = window.get_size()
+        size = (-(-width // self.scale), -(-height // self.scale))  # Rounded up, covers the window
+        if self.surface is None or self.surface.get_size() != size:
+            self.surface = pygame.Surface(size).convert()
+        return self.surface
+
+    def upscale(self, window):
+        """Scale the world up to the window (nothing to do at full resolution)"""
+        if self.scale != 1:
+            pygame.transform.scale(self.surface, window.get_size(), window)
@@ -0,0 +1,68 @@
+import struct
+
+# Every message on a TCP socket is sent as a frame: 4-byte big-endian payload size, then the payload
+HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1024 * 1024  # Refuse frames bigger than 1 MB (corrupt or hostile stream)
+
+
+def pack_frame(payload):
+    """Prefix a payload with its size"""
+    return HEADER.pack(len(payload)) + payload
+
+
+def iter_frames(data):
+    """Payloads of a buffer that holds whole frames only (e.g. what pack_frame returned)"""
+    offset = 0
+    while offset < len(data):
+        (size,) = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        yield data[offset:offset + size]
+        offset += size
+
+
+class FrameReader:
+    """Split a byte stream back into the payloads written with pack_frame
+
+    TCP may merge several frames in one recv or split one frame over several,
+    so received bytes are kept until a whole frame is available.
+    """
+    def __init__(self, chunk_size=65536):
+        self.buffer = bytearray()  # Received bytes not yet returned as frames
+        self.start = 0  # Offset of the first unread byte in buffer
+        self.chunk = memoryview(bytearray(chunk_size))  # Reused for every recv_into
+
+    def feed(self, data):
+        """Append received bytes"""
+        if self.start:
+            # Drop the frames already returned, once per read instead of once per frame
+            del self.buffer[:self.start]
+            self.start = 0
+        self.buffer += data
+
+    def recv_from(self, sock):
+        """Read once from a socket into the buffer, returns the number of bytes read (0 on EOF)"""
+        size = sock.recv_into(self.chunk)
+        if size:
+            self.feed(self.chunk[:size])
+        return size
+
+    def next_frame(self):
+        """Return the next complete payload, or None if it has not fully arrived yet"""
+        if len(self.buffer) - self.start < HEADER.size:
+            return None
+        (size,) = HEADER.unpack_from(self.buffer, self.start)
+        if size > MAX_FRAME_SIZE:
+            raise ValueError(f"Frame of {size} bytes exceeds the {MAX_FRAME_SIZE} bytes limit")
+        end = self.start + HEADER.size + size
+        if len(self.buffer) < end:
+            return None
+        payload = bytes(self.buffer[self.start + HEADER.size:end])
+        self.start = end
+        return payload
+
+    def frames(self):
+        """Iterate over every complete payload in the buffer"""
+        payload = self.next_frame()
+        while payload is not None:
+            yield payload
+            payload = self.next_frame()
@@ -0,0 +1,139 @@
+import json
+import os
+import sys
+
+import characters
+
+# Hitboxes and hurtboxes of every animation frame, measured once from the sprite sheets.
+# `python hitboxes.py` writes the table (it needs pygame, the game reads the table
+# without it): for each character, action and frame, the area that can be hit (the body:
+# the visible pixels within the width of the idle pose) and, in attack frames, the area
+# that hits (the visible pixels in front of the idle pose: the blade, the spell). Boxes
+# are relative to the fighter rect facing right, the ones facing left are mirrored when
+# the table is loaded. A hit check is then two lookups and one rectangle overlap.
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "hitboxes.json")  # Whatever the working directory
+ATTACK_ACTIONS = (3, 4)  # simulation.ATTACK1, ATTACK2
+MIN_HIT_PIXELS = 8  # Fewer visible pixels in front of the body are not a hit (a stray sword tip)
+
+
+def mask_box(mask):
+    """(x, y, width, height) around the set bits of a pygame mask, None if there are none"""
+    rects = mask.get_bounding_rects()
+    if not rects:
+        return None
+    box = rects[0].unionall(rects[1:])
+    return box.x, box.y, box.width, box.height
+
+
+def character_table(sheet, char):
+    """Boxes of one character: [action][frame] -> [hurtbox, hitbox], facing right"""
+    import pygame
+    size, image_scale, offset = char["data"]
+
+    def relative(box):
+        # Sheet pixels of a frame -> game pixels from the top-left corner of the fighter rect
+        if box is None:
+            return None
+        x, y, width, height = box
+        return [round((x - offset[0]) * image_scale), round((y - offset[1]) * image_scale),
+                round(width * image_scale), round(height * image_scale)]
+
+    def area(left, right):
+        # Mask of the columns left <= x < right of a frame
+        mask = pygame.mask.Mask((size, size))
+        if right > left:
+            mask.draw(pygame.mask.Mask((right - left, size), fill=True), (left, 0))
+        return mask
+
+    masks = [[pygame.mask.from_surface(sheet.subsurface(index * size, action * size, size, size))
+              for index in range(steps)] for action, steps in enumerate(char["steps"])]
+    idle = pygame.mask.Mask((size, size))
+    for mask in masks[0]:
+        idle.draw(mask, (0, 0))
+    body_x, _, body_width, _ = mask_box(idle)
+    body = area(body_x, body_x + body_width)
+    front = area(body_x + body_width, size)
+
+    table = []
+    for action, frames in enumerate(masks):
+        boxes = []
+        for mask in frames:
+            hurtbox = mask_box(mask.overlap_mask(body, (0, 0)))
+            hitbox = None
+            if action in ATTACK_ACTIONS:
+                blade = mask.overlap_mask(front, (0, 0))
+                if blade.count() >= MIN_HIT_PIXELS:
+                    hitbox = mask_box(blade)
+            boxes.append([relative(hurtbox), relative(hitbox)])
+        table.append(boxes)
+    return table
+
+
+def build_table(path=TABLE_PATH):
+    """Measure the boxes of every character and write the table"""
+    import pygame
+    table = []
+    for char in characters.CHARACTERS:
+        size, image_scale, offset = char["data"]
+        sheet = pygame.image.load(char["sheet"])
+        table.append({"name": char["name"], "mirror_x": round(size * image_scale) - 2 * round(offset[0] * image_scale),
+                      "boxes": character_table(sheet, char)})
+    with open(path, "w") as table_file:
+        json.dump({"characters": table}, table_file, separators=(",", ":"))
+    return table
+
+
+def load_table(path=TABLE_PATH):
+    """[character][action][frame][flip] -> (hurtbox, hitbox), each (dx, dy, width, height) or None"""
+    try:
+        with open(path) as table_file:
+            table = json.load(table_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Hitbox table {path} not found, build it with `python hitboxes.py`") from None
+    characters_boxes = []
+    for char in table["characters"]:
+        mirror_x = char["mirror_x"]
+
+        def mirrored(box):
+            # The frame is drawn flipped around its own middle, the rect is not
+            return None if box is None else (mirror_x - box[0] - box[2], box[1], box[2], box[3])
+
+        characters_boxes.append(tuple(
+            tuple(((tuple(hurtbox) if hurtbox else None, tuple(hitbox) if hitbox else None),
+                   (mirrored(hurtbox), mirrored(hitbox)))
+                  for hurtbox, hitbox in frames)
+            for frames in char["boxes"]))
+    return characters_boxes
+
+
+if __name__ != "__main__":  # `python hitboxes.py` builds the table instead of reading it
+    # Read at import: without the table the game and the server stop at startup, not mid-match
+    BOXES = load_table()
+
+
+def character_boxes(index):
+    """Boxes of a selection index, falling back to the first character like characters.character"""
+    if 0 <= index < len(BOXES):
+        return BOXES[index]
+    return BOXES[0]
+
+
+def overlap(box, x, y, other, other_x, other_y):
+    """True if two boxes placed at fighter rects (x, y) and (other_x, other_y) overlap"""
+    if box is None or other is None:
+        return False
+    left = x + box[0]
+    top = y + box[1]
+    other_left = other_x + other[0]
+    other_top = other_y + other[1]
+    return (left < other_left + other[2] and other_left < left + box[2]
+            and top < other_top + other[3] and other_top < top + box[3])
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else TABLE_PATH
+    for char in build_table(path):
+        hits = sum(hitbox is not None for frames in char["boxes"] for _, hitbox in frames)
+        print(f"{char['name']}: {hits} attack frames that hit")
+    print(f"Wrote {path}")
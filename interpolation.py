@@ -0,0 +1,77 @@
+import collections
+import time
+
+import simulation
+
+# Remote fighters are drawn a little in the past, between the two snapshots around
+# that moment, so they move smoothly at the render rate whatever the snapshot rate.
+
+
+class SnapshotBuffer:
+    """Player states received with their server tick, sampled at render time
+
+    delay: seconds the remote fighter is drawn behind the newest snapshot, must cover
+           the snapshot interval plus the network jitter
+    max_extrapolation: seconds the motion is continued past the newest snapshot when
+           packets are late or lost, the fighter stops there until the next one arrives
+    """
+    def __init__(self, delay=0.1, max_extrapolation=0.05, size=32, clock=time.monotonic):
+        self.delay = delay
+        self.max_extrapolation = max_extrapolation
+        self.clock = clock
+        self.states = collections.deque(maxlen=size)  # (tick, state), oldest first
+        # Server clock estimate: server time minus local arrival time, the largest
+        # recent sample is the packet that spent the least time on the way
+        self.offsets = collections.deque(maxlen=size)
+        self.offset = None
+
+    def clear(self):
+        """Forget the buffered states (new round, fighters teleported)"""
+        self.states.clear()
+
+    def add(self, tick, state, now=None):
+        """Buffer the state of a snapshot, older or repeated ticks are ignored"""
+        if now is None:
+            now = self.clock()
+        self.offsets.append(tick / simulation.TICK_RATE - now)
+        self.offset = max(self.offsets)
+        if self.states and tick <= self.states[-1][0]:
+            return
+        self.states.append((tick, state))
+
+    def sample(self, now=None):
+        """State to draw now, None before the first snapshot"""
+        states = list(self.states)  # add() runs on the network thread
+        if not states:
+            return None
+        if now is None:
+            now = self.clock()
+        render_tick = (now + self.offset - self.delay) * simulation.TICK_RATE
+
+        newest_tick, newest = states[-1]
+        if render_tick >= newest_tick:
+            # No snapshot for that moment yet, continue the last motion for a short while
+            if len(states) < 2:
+                return newest
+            extra_ticks = render_tick - newest_tick
+            if extra_ticks > self.max_extrapolation * simulation.TICK_RATE:
+                return newest
+            previous_tick, previous = states[-2]
+            return self.blend(previous, newest, 1 + extra_ticks / (newest_tick - previous_tick))
+
+        # Find the two snapshots around the render tick
+        older_tick, older = states[0]
+        if render_tick <= older_tick:
+            return older
+        for tick, state in states:
+            if tick >= render_tick:
+                return self.blend(older, state, (render_tick - older_tick) / (tick - older_tick))
+            older_tick, older = tick, state
+        return newest
+
+    def blend(self, start, end, fraction):
+        """Position moved fraction of the way from start to end, the other fields of the nearest state"""
+        state = dict(start if fraction < 0.5 else end)
+        state["x"] = round(start["x"] + (end["x"] - start["x"]) * fraction)
+        state["y"] = round(start["y"] + (end["y"] - start["y"]) * fraction)
+        return state
@@ -1,6 +1,12 @@
+import sys
 import pygame
 from pygame import mixer
-from fighter import Fighter
+from fighter import Fighter, read_input
+from dirty_rects import DirtyRects
+from framebuffer import Framebuffer, LOW_RES_SCALE
+from frame_governor import FrameGovernor, LOW_RES
+import simulation
+from text_cache import TextCache, get_font
 
 mixer.init()
 pygame.init()
@@ -15,9 +21,19 @@ screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 #Title and icon
 pygame.display.set_caption("Brawler")
 
+#--low-res: draw the fight on a 3x smaller surface with native size sprites, scaled up once per frame
+framebuffer = Framebuffer(LOW_RES_SCALE if "--low-res" in sys.argv else 1)
+
+#--dirty-rects: only redraw and update what changed, faster without GPU acceleration
+#(not with --low-res, scaling up redraws the whole window)
+dirty = DirtyRects("--dirty-rects" in sys.argv and framebuffer.scale == 1)
+
 #set framerate
 clock = pygame.time.Clock()
 FPS = 60
+#frame pacing: fighters move once per simulation tick, whatever the frame rate, and the fight
+#falls back to --low-res when frames take too long (not with --fixed-quality)
+governor = FrameGovernor(FPS, simulation.TICK_RATE, "--fixed-quality" not in sys.argv)
 
 #define colours
 RED = (255, 0, 0)
@@ -30,12 +46,12 @@ GREEN = (0, 255, 0)
 #define game variables
 #dem nguoc trươc khi choi vao game
 intro_count = 5
-last_count_update = pygame.time.get_ticks()
+last_count_update = 0 #sim_tick of the last count (timers count simulation ticks, not milliseconds)
 score = [0, 0]#player scores. [P1, P2]
 #kiem tra vòng chơi đã kết thúc hay chưa
 round_over = False
 #chờ 2s để bắt đầu vòng chơi mới
-ROUND_OVER_COOLDOWN = 2000
+ROUND_OVER_COOLDOWN = 2 * simulation.TICK_RATE
 #Thêm biến để theo dõi khi trò chơi kết thúc
 game_over = False
 #Số điểm để thắng trò chơi
@@ -44,6 +60,8 @@ WIN_SCORE = 5
 winner = 0
 #Thêm biến cho màn hình hướng dẫn
 show_controls = True
+#simulation ticks since the start, the clock of the fighters' animations
+sim_tick = 0
 
 #define fighter variables
 WARRIOR_SIZE = 162
@@ -54,6 +72,9 @@ WIZARD_SIZE = 250
 WIZARD_SCALE = 3
 WIZARD_OFFSET = [112, 107]
 WIZARD_DATA = [WIZARD_SIZE, WIZARD_SCALE, WIZARD_OFFSET]
+#characters.CHARACTERS indices, for the hitboxes of their frames
+WARRIOR = 0
+WIZARD = 1
 
 #load music and sounds
 pygame.mixer.music.load("assets/audio/ok.mp3")
@@ -65,8 +86,10 @@ sword_fx.set_volume(0.5)
 magic_fx = pygame.mixer.Sound("assets/audio/magic.wav")
 magic_fx.set_volume(0.75)
 
-#load background image
-bg_image = pygame.image.load("assets/images/background/background.jpg").convert_alpha()
+#load background image (opaque JPEG: display format without alpha blits fastest)
+bg_image = pygame.image.load("assets/images/background/background.jpg").convert()
+#background scaled to the window, rebuilt only when the window size changes
+scaled_bg = None
 
 #load spritesheets
 warrior_sheet = pygame.image.load("assets/images/warrior/Sprites/warrior.png").convert_alpha()
@@ -80,31 +103,48 @@ WARRIOR_ANIMATION_STEPS = [10, 8, 1, 7, 7, 3, 7]
 WIZARD_ANIMATION_STEPS = [8, 8, 1, 8, 8, 3, 7]
 
 #define font
-count_font = pygame.font.Font("assets/fonts/turok.ttf", 80)
-score_font = pygame.font.Font("assets/fonts/turok.ttf", 30)
-game_over_font = pygame.font.Font("assets/fonts/turok.ttf", 50)
-controls_font = pygame.font.Font("assets/fonts/turok.ttf", 25)
-title_font = pygame.font.Font("assets/fonts/turok.ttf", 40)
+count_font = get_font("assets/fonts/turok.ttf", 80)
+score_font = get_font("assets/fonts/turok.ttf", 30)
+game_over_font = get_font("assets/fonts/turok.ttf", 50)
+controls_font = get_font("assets/fonts/turok.ttf", 25)
+title_font = get_font("assets/fonts/turok.ttf", 40)
+#rendered labels (scores, countdown), rendered again only when their text changes
+text_cache = TextCache()
 
 #function for drawing text
 def draw_text(text, font, text_col, x, y):
-  img = font.render(text, True, text_col)
-  screen.blit(img, (x, y))
+  img = text_cache.render(font, text, text_col)
+  dirty.add(screen.blit(img, (x, y)))
 
-#function for drawing background
-def draw_bg():
-  scaled_bg = pygame.transform.scale(bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT))
-  screen.blit(scaled_bg, (0, 0))
+#function for drawing background (on the window, or on the low-res scene)
+def draw_bg(surface):
+  global scaled_bg
+  if scaled_bg is None or scaled_bg.get_size() != surface.get_size():
+    scaled_bg = pygame.transform.scale(bg_image, surface.get_size()).convert()
+    dirty.invalidate()
+  dirty.erase(surface, scaled_bg)
 
 #function for drawing fighter health bars
 def draw_health_bar(health, x, y):
   ratio = health / 100
-  pygame.draw.rect(screen, WHITE, (x - 2, y - 2, 404, 34))
+  dirty.add(pygame.draw.rect(screen, WHITE, (x - 2, y - 2, 404, 34)))
   pygame.draw.rect(screen, RED, (x, y, 400, 30))
   pygame.draw.rect(screen, YELLOW, (x, y, 400 * ratio, 30))
 
+#controls screen is static: drawn once over the background, then blitted from this copy
+controls_layer = None
+
 #function to draw controls screen
 def draw_controls_screen():
+  global controls_layer
+  dirty.invalidate()
+  if controls_layer is not None and controls_layer.get_size() == screen.get_size():
+    screen.blit(controls_layer, (0, 0))
+    return
+  render_controls_screen()
+  controls_layer = screen.copy()
+
+def render_controls_screen():
   # Vẽ nền tối mờ
   s = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
   s.set_alpha(220)
@@ -151,20 +191,25 @@ def reset_game():
   intro_count = 5
   score = [0, 0]
   winner = 0
-  return Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS, sword_fx), Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS, magic_fx)
+  return create_fighters()
+
+#function to create the two fighters at their start positions
+def create_fighters():
+  return (Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS, sword_fx, framebuffer.scale, WARRIOR),
+          Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS, magic_fx, framebuffer.scale, WIZARD))
 
 #create two instances of fighters
-fighter_1 = Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS, sword_fx)
-fighter_2 = Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS, magic_fx)
+fighter_1, fighter_2 = create_fighters()
 
 #game loop
 run = True
 while run:
 
-  clock.tick(FPS)
+  ticks = governor.begin_frame()
 
-  #draw background
-  draw_bg()
+  #draw background (the fight is drawn on the scene, the window itself unless --low-res)
+  scene = screen if show_controls else framebuffer.scene(screen)
+  draw_bg(scene)
 
   if show_controls:
     # Hiển thị màn hình hướng dẫn
@@ -174,6 +219,24 @@ while run:
     if key[pygame.K_SPACE]:
       show_controls = False
   else:
+    #the world first: fighters on the scene, scaled up to the window with --low-res
+    buttons = (read_input(1), read_input(2))
+    for _ in range(ticks):
+      sim_tick += 1
+      if intro_count <= 0 and not game_over:
+        #move fighters if game is not over
+        fighter_1.move(buttons[0], SCREEN_WIDTH, SCREEN_HEIGHT, fighter_2, round_over)
+        fighter_2.move(buttons[1], SCREEN_WIDTH, SCREEN_HEIGHT, fighter_1, round_over)
+
+      #update fighters
+      fighter_1.update(sim_tick)
+      fighter_2.update(sim_tick)
+
+    #draw fighters
+    dirty.add(fighter_1.draw(scene))
+    dirty.add(fighter_2.draw(scene))
+    framebuffer.upscale(screen)
+
     #show player stats
     draw_health_bar(fighter_1.health, 20, 20)
     draw_health_bar(fighter_2.health, 580, 20)
@@ -191,25 +254,13 @@ while run:
         fighter_1, fighter_2 = reset_game()
         # Hiển thị lại màn hình hướng dẫn sau khi reset game
         show_controls = True
-    elif intro_count <= 0:
-      #move fighters if game is not over
-      fighter_1.move(SCREEN_WIDTH, SCREEN_HEIGHT, screen, fighter_2, round_over)
-      fighter_2.move(SCREEN_WIDTH, SCREEN_HEIGHT, screen, fighter_1, round_over)
-    else:
+    elif intro_count > 0:
       #display count timer
       draw_text(str(intro_count), count_font, RED, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 3)
       #update count timer
-      if (pygame.time.get_ticks() - last_count_update) >= 1000:
+      if (sim_tick - last_count_update) >= simulation.TICK_RATE:
         intro_count -= 1
-        last_count_update = pygame.time.get_ticks()
-
-    #update fighters
-    fighter_1.update()
-    fighter_2.update()
-
-    #draw fighters
-    fighter_1.draw(screen)
-    fighter_2.draw(screen)
+        last_count_update = sim_tick
 
     #check for player defeat
     if not game_over:
@@ -217,7 +268,7 @@ while run:
         if fighter_1.alive == False:
           score[1] += 1
           round_over = True
-          round_over_time = pygame.time.get_ticks()
+          round_over_time = sim_tick
           #check if player 2 has won the game
           if score[1] >= WIN_SCORE:
             game_over = True
@@ -225,19 +276,18 @@ while run:
         elif fighter_2.alive == False:
           score[0] += 1
           round_over = True
-          round_over_time = pygame.time.get_ticks()
+          round_over_time = sim_tick
           #check if player 1 has won the game
           if score[0] >= WIN_SCORE:
             game_over = True
             winner = 1
       else:
         #display victory image for the round
-        screen.blit(victory_img, (360, 150))
-        if pygame.time.get_ticks() - round_over_time > ROUND_OVER_COOLDOWN and not game_over:
+        dirty.add(screen.blit(victory_img, (360, 150)))
+        if sim_tick - round_over_time > ROUND_OVER_COOLDOWN and not game_over:
           round_over = False
           intro_count = 5
-          fighter_1 = Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS, sword_fx)
-          fighter_2 = Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS, magic_fx)
+          fighter_1, fighter_2 = create_fighters()
 
   #event handler
   for event in pygame.event.get():
@@ -245,7 +295,17 @@ while run:
       run = False
 
   #update display
-  pygame.display.update()
+  dirty.present(screen)
+
+  #lower or raise the render scale when the frame time asks for it
+  if governor.end_frame():
+    scale = LOW_RES_SCALE if "--low-res" in sys.argv or governor.level >= LOW_RES else 1
+    if scale != framebuffer.scale:
+      framebuffer.scale = scale
+      dirty.enabled = "--dirty-rects" in sys.argv and scale == 1
+      dirty.invalidate()
+      fighter_1.set_render_scale(scale)
+      fighter_2.set_render_scale(scale)
 
 #exit pygame
 pygame.quit()
\ No newline at end of file
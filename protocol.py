@@ -0,0 +1,290 @@
+import struct
+
+# Binary messages exchanged between GameServer and GameClient.
+# Every message starts with a one-byte opcode, followed by a fixed layout
+# (network byte order). Messages are sent inside framing.pack_frame frames.
+
+OP_JOIN = 1           # client -> server: room ID to join ("" for any open room)
+OP_WELCOME = 2        # server -> client: player slot and room ID
+OP_ERROR = 3          # server -> client: error text, connection is closed after it
+OP_INPUT = 4          # client -> server: buttons held during one simulation tick
+OP_SELECTION = 5      # client -> server: character picked on the selection screen
+OP_READY = 6          # client -> server: player confirmed its character
+OP_CHAT = 7           # client -> server: chat line (sent back to the room as OP_CHAT_EVENT)
+OP_SNAPSHOT = 8       # server -> client: numbered game state, full or delta against an acked snapshot
+OP_ACK = 9            # client -> server: last snapshot applied
+OP_RESYNC = 10        # client -> server: delta base is unknown, send a full snapshot
+OP_CHAT_EVENT = 11    # server -> client: chat line with its sequence number in the room
+OP_CHAT_SYNC = 12     # client -> server: send the chat lines after this sequence number
+OP_INPUT_FRAMES = 13  # client -> server -> other client: buttons of consecutive fight ticks (rollback fights)
+
+PLAYER_IDS = ("player1", "player2")  # Player slot index <-> player ID used in game_state
+PLAYER_SLOTS = {player_id: index for index, player_id in enumerate(PLAYER_IDS)}
+
+# Fighter flags packed in one byte
+FLAG_FLIP = 1
+FLAG_ATTACKING = 2
+FLAG_HIT = 4
+FLAG_JUMP = 8
+FLAG_ATTACK_LANDED = 16
+
+# Game flags packed in one byte
+FLAG_GAME_ACTIVE = 1
+FLAG_ROUND_OVER = 2
+FLAG_GAME_OVER = 4
+FLAG_ROLLBACK = 8     # The clients simulate the fight from each other's inputs, see rollback.py
+
+OPCODE = struct.Struct("!B")
+# x, y, health (signed 16-bit), action, frame_index, flags,
+# then what a client needs to predict its own fighter: vel_y, attack_cooldown, attack_type, update_tick
+PLAYER = struct.Struct("!hhhBBBhBBI")
+# opcode, input seq, buttons (simulation.INPUT_* bits)
+INPUT = struct.Struct("!BIB")
+# opcode, selection
+SELECTION = struct.Struct("!BB")
+# opcode, selection, 1 to ask for a rollback fight
+READY = struct.Struct("!BBB")
+# opcode, last tick of the receiver's inputs the sender has (without gaps), sender's frame advantage,
+# first tick, then one byte of buttons per tick
+INPUT_FRAMES = struct.Struct("!BIbI")
+# opcode, snapshot seq, base seq (0 for a full snapshot), server tick, mask of the groups that follow
+SNAPSHOT = struct.Struct("!BIIIB")
+# opcode, snapshot seq
+ACK = struct.Struct("!BI")
+# opcode, chat seq, then the text
+CHAT_EVENT = struct.Struct("!BI")
+
+# A snapshot is split in groups, a delta only carries the groups that differ from its base
+GROUP_GAME = 0        # game flags, intro_count, winner
+GROUP_SCORES = 1
+GROUP_SELECTIONS = 2
+GROUP_PLAYER1 = 3
+GROUP_PLAYER2 = 4
+GROUP_INPUT_SEQS = 5  # last input seq the server applied for each player
+GROUP_CHECKSUM = 6    # rollback fight: fight tick the server simulated and simulation.checksum of the fighters
+GROUP_COUNT = 7
+ALL_GROUPS = (1 << GROUP_COUNT) - 1
+GROUP_STRUCTS = (
+    struct.Struct("!BbB"),  # GROUP_GAME
+    struct.Struct("!HH"),   # GROUP_SCORES
+    struct.Struct("!BB"),   # GROUP_SELECTIONS
+    PLAYER,                 # GROUP_PLAYER1
+    PLAYER,                 # GROUP_PLAYER2
+    struct.Struct("!II"),   # GROUP_INPUT_SEQS
+    struct.Struct("!II")    # GROUP_CHECKSUM
+)
+SNAPSHOT_HISTORY = 64  # Snapshots kept on both sides as possible delta bases
+
+
+def player_index(player_id):
+    """Player slot index (0 or 1) of a player ID"""
+    return PLAYER_SLOTS[player_id]
+
+
+def opcode(payload):
+    """Opcode of a received message"""
+    return payload[0]
+
+
+def pack_player(state):
+    """Fighter fields of a player state dict, in PLAYER order"""
+    flags = ((FLAG_FLIP if state["flip"] else 0)
+             | (FLAG_ATTACKING if state["attacking"] else 0)
+             | (FLAG_HIT if state["hit"] else 0)
+             | (FLAG_JUMP if state["jump"] else 0)
+             | (FLAG_ATTACK_LANDED if state["attack_landed"] else 0))
+    return (int(state["x"]), int(state["y"]), int(state["health"]),
+            state["action"], state["frame_index"], flags,
+            int(state["vel_y"]), state["attack_cooldown"], state["attack_type"], state["update_tick"])
+
+
+def unpack_player(x, y, health, action, frame_index, flags, vel_y, attack_cooldown, attack_type, update_tick):
+    """Player state dict from PLAYER fields"""
+    return {
+        "x": x,
+        "y": y,
+        "health": health,
+        "action": action,
+        "frame_index": frame_index,
+        "flip": bool(flags & FLAG_FLIP),
+        "attacking": bool(flags & FLAG_ATTACKING),
+        "hit": bool(flags & FLAG_HIT),
+        "vel_y": vel_y,
+        "jump": bool(flags & FLAG_JUMP),
+        "attack_cooldown": attack_cooldown,
+        "attack_type": attack_type,
+        "attack_landed": bool(flags & FLAG_ATTACK_LANDED),
+        "update_tick": update_tick
+    }
+
+
+def encode_string(op, text):
+    return OPCODE.pack(op) + text.encode("utf-8")
+
+
+def decode_string(payload):
+    return bytes(payload[1:]).decode("utf-8", errors="replace")
+
+
+def encode_join(room_id):
+    return encode_string(OP_JOIN, "" if room_id is None else str(room_id))
+
+
+def decode_join(payload):
+    """Room ID requested by the client, None for any open room"""
+    return decode_string(payload) or None
+
+
+def encode_welcome(player_id, room_id):
+    return SELECTION.pack(OP_WELCOME, player_index(player_id)) + str(room_id).encode("utf-8")
+
+
+def decode_welcome(payload):
+    """(player_id, room_id) sent by the server"""
+    return PLAYER_IDS[payload[1]], bytes(payload[2:]).decode("utf-8")
+
+
+def encode_error(message):
+    return encode_string(OP_ERROR, message)
+
+
+def encode_chat(text):
+    return encode_string(OP_CHAT, text)
+
+
+def encode_chat_event(seq, text):
+    return CHAT_EVENT.pack(OP_CHAT_EVENT, seq) + text.encode("utf-8")
+
+
+def decode_chat_event(payload):
+    """(seq, text) of an OP_CHAT_EVENT"""
+    return CHAT_EVENT.unpack_from(payload)[1], bytes(payload[CHAT_EVENT.size:]).decode("utf-8", errors="replace")
+
+
+def encode_chat_sync(after_seq):
+    return CHAT_EVENT.pack(OP_CHAT_SYNC, after_seq)
+
+
+def decode_chat_sync(payload):
+    return CHAT_EVENT.unpack_from(payload)[1]
+
+
+def encode_selection(selection):
+    return SELECTION.pack(OP_SELECTION, selection)
+
+
+def encode_ready(selection, rollback=False):
+    return READY.pack(OP_READY, selection, 1 if rollback else 0)
+
+
+def decode_ready(payload):
+    """(selection, rollback) of an OP_READY"""
+    return payload[1], len(payload) > 2 and payload[2] == 1
+
+
+def decode_selection(payload):
+    """Selection carried by OP_SELECTION and OP_READY"""
+    return payload[1]
+
+
+def encode_input(seq, buttons):
+    return INPUT.pack(OP_INPUT, seq, buttons)
+
+
+def decode_input(payload):
+    """(seq, buttons) of an OP_INPUT"""
+    _, seq, buttons = INPUT.unpack(payload)
+    return seq, buttons
+
+
+def encode_input_frames(ack_tick, advantage, start_tick, buttons):
+    return INPUT_FRAMES.pack(OP_INPUT_FRAMES, ack_tick, max(-128, min(127, advantage)), start_tick) + bytes(buttons)
+
+
+def decode_input_frames(payload):
+    """(ack_tick, advantage, start_tick, buttons) of an OP_INPUT_FRAMES, buttons as bytes"""
+    _, ack_tick, advantage, start_tick = INPUT_FRAMES.unpack_from(payload)
+    return ack_tick, advantage, start_tick, bytes(payload[INPUT_FRAMES.size:])
+
+
+def encode_ack(seq):
+    return ACK.pack(OP_ACK, seq)
+
+
+def decode_ack(payload):
+    return ACK.unpack(payload)[1]
+
+
+def encode_resync():
+    return OPCODE.pack(OP_RESYNC)
+
+
+def snapshot_groups(game_state):
+    """Game state as a tuple of comparable groups, in GROUP_* order"""
+    flags = ((FLAG_GAME_ACTIVE if game_state["game_active"] else 0)
+             | (FLAG_ROUND_OVER if game_state["round_over"] else 0)
+             | (FLAG_GAME_OVER if game_state["game_over"] else 0)
+             | (FLAG_ROLLBACK if game_state["rollback"] else 0))
+    return ((flags, game_state["intro_count"], game_state["winner"]),
+            tuple(game_state["scores"]),
+            tuple(game_state["player_selections"]),
+            pack_player(game_state["player1"]),
+            pack_player(game_state["player2"]),
+            tuple(game_state["input_seqs"]),
+            tuple(game_state["checksum"]))
+
+
+def encode_snapshot(seq, tick, groups, base_seq=0, base_groups=None):
+    """OP_SNAPSHOT with the groups that differ from base_groups (all of them without a base)"""
+    mask = 0
+    parts = []
+    for group, values in enumerate(groups):
+        if base_groups is not None and base_groups[group] == values:
+            continue
+        mask |= 1 << group
+        parts.append(GROUP_STRUCTS[group].pack(*values))
+    return SNAPSHOT.pack(OP_SNAPSHOT, seq, base_seq if base_groups is not None else 0, tick, mask) + b"".join(parts)
+
+
+def snapshot_ids(payload):
+    """(seq, base_seq, tick) of an OP_SNAPSHOT, base_seq is 0 for a full snapshot"""
+    _, seq, base_seq, tick, _ = SNAPSHOT.unpack_from(payload)
+    return seq, base_seq, tick
+
+
+def decode_snapshot(payload, base_state=None):
+    """Game state dict of an OP_SNAPSHOT, same keys as the server's game_state
+
+    Deltas are applied on a copy of base_state, the state of their base snapshot.
+    """
+    _, seq, base_seq, _, mask = SNAPSHOT.unpack_from(payload)
+    if base_seq and base_state is None:
+        raise ValueError(f"Snapshot {seq} is a delta against unknown snapshot {base_seq}")
+    if not base_seq and mask != ALL_GROUPS:
+        raise ValueError(f"Full snapshot {seq} is missing groups")
+    state = dict(base_state) if base_seq else {}
+    offset = SNAPSHOT.size
+    for group in range(GROUP_COUNT):
+        if not mask & (1 << group):
+            continue
+        values = GROUP_STRUCTS[group].unpack_from(payload, offset)
+        offset += GROUP_STRUCTS[group].size
+        if group == GROUP_GAME:
+            flags, state["intro_count"], state["winner"] = values
+            state["game_active"] = bool(flags & FLAG_GAME_ACTIVE)
+            state["round_over"] = bool(flags & FLAG_ROUND_OVER)
+            state["game_over"] = bool(flags & FLAG_GAME_OVER)
+            state["rollback"] = bool(flags & FLAG_ROLLBACK)
+        elif group == GROUP_SCORES:
+            state["scores"] = list(values)
+        elif group == GROUP_SELECTIONS:
+            state["player_selections"] = list(values)
+        elif group == GROUP_PLAYER1:
+            state["player1"] = unpack_player(*values)
+        elif group == GROUP_PLAYER2:
+            state["player2"] = unpack_player(*values)
+        elif group == GROUP_INPUT_SEQS:
+            state["input_seqs"] = list(values)
+        elif group == GROUP_CHECKSUM:
+            state["checksum"] = list(values)
+    return state
@@ -0,0 +1,197 @@
+import characters
+import simulation
+from simulation import FighterSim
+
+# Rollback fights. The clients only exchange their buttons, one byte per tick, and each
+# one simulates both fighters: our inputs are applied at once, the opponent's are
+# predicted (the last buttons it held) until they arrive. When an input arrives that
+# differs from the prediction, the fight is rewound to the state saved before that tick
+# and simulated again up to now, within the same frame. The rules are integer-only
+# (simulation.FighterSim), so both clients and the server, which follows the fight once it
+# has both inputs of a tick, reach the same states from the same inputs. The server's
+# snapshots carry a checksum of its fighters instead of their states, each client compares
+# it with its own once the tick is final (both inputs known).
+
+MAX_ROLLBACK = 10  # Ticks simulated ahead of the opponent's inputs at most, then we wait for them
+SYNC_INTERVAL = 10  # Ticks between two waits to fall back in step with the opponent
+CHECKSUM_HISTORY = simulation.TICK_RATE * 2  # Final ticks whose checksums are kept for the server's to compare
+
+
+def start_fighters(selections, screen_width, screen_height):
+    """Fresh fighters of the selected characters at their start positions"""
+    fighters = []
+    for index, selection in enumerate(selections):
+        x, y, flip = simulation.start_position(index + 1, screen_width, screen_height)
+        fighters.append(FighterSim(index + 1, x, y, flip, characters.character(selection)["steps"], selection))
+    return fighters
+
+
+def step_fight(fighters, buttons, tick, screen_width, screen_height):
+    """One tick of a fight from the buttons of both players, in the server's order"""
+    fighter_1, fighter_2 = fighters
+    round_over = not (fighter_1.alive and fighter_2.alive)
+    fighter_1.move(buttons[0], screen_width, screen_height, fighter_2, round_over)
+    fighter_2.move(buttons[1], screen_width, screen_height, fighter_1, round_over)
+    fighter_1.update(tick)
+    fighter_2.update(tick)
+
+
+class RollbackSession:
+    """One client's copy of a fight, from tick 0 (the end of the countdown)
+
+    The game loop calls rollback(), then advance() once per tick and sends outgoing();
+    the receive thread calls add_remote_inputs(). The caller serialises them.
+    """
+    def __init__(self, player_index, selections, screen_width, screen_height, max_rollback=MAX_ROLLBACK):
+        self.index = player_index  # Our fighter, 0 or 1
+        self.SCREEN_WIDTH = screen_width
+        self.SCREEN_HEIGHT = screen_height
+        self.max_rollback = max_rollback
+        self.fighters = start_fighters(selections, screen_width, screen_height)
+        self.tick = 0  # Last tick simulated
+        self.local_inputs = {}  # tick -> our buttons, until the opponent has them and they cannot be replayed
+        self.remote_inputs = {}  # tick -> the opponent's buttons received
+        self.used_inputs = {}  # tick -> the opponent's buttons the simulation used, predicted or received
+        self.remote_tick = 0  # The opponent's buttons are known up to this tick, without gaps
+        self.remote_latest = 0  # Newest tick the opponent has simulated
+        self.remote_advantage = 0  # Ticks the opponent is ahead of our inputs, as it reported
+        self.acked_tick = 0  # The opponent has our buttons up to this tick
+        self.sent_tick = 0  # Last tick of our buttons sent
+        self.saved = {0: self.save()}  # tick -> fighter states after that tick, back to remote_tick
+        self.rollback_tick = None  # First tick simulated with a wrong prediction
+        self.kept_tick = 0  # Saved states and inputs of older ticks are dropped, see forget()
+        self.last_wait = 0
+        self.checksums = {}  # tick -> simulation.checksum of the final ticks, the last CHECKSUM_HISTORY
+        self.server_checksums = {}  # tick -> checksum of the server, for ticks not final yet
+        self.desyncs = 0  # Final ticks whose checksum differs from the server's
+        self.rollbacks = 0  # Statistics: rewinds and ticks simulated again
+        self.replayed_ticks = 0
+
+    def save(self):
+        return tuple(fighter.state() for fighter in self.fighters)
+
+    def load(self, states):
+        for fighter, state in zip(self.fighters, states):
+            fighter.set_state(state)
+
+    def advantage(self):
+        """Ticks we are ahead of the opponent's inputs received"""
+        return self.tick - self.remote_latest
+
+    def can_advance(self):
+        """False while the opponent's inputs are late by the whole rollback window"""
+        return self.tick - self.remote_tick < self.max_rollback
+
+    def should_wait(self):
+        """True for a tick to skip when we run ahead of the opponent
+
+        Each side sees the other behind by the network delay, a difference between the
+        two advantages means one clock started earlier: that one waits, a tick at a time.
+        """
+        if (self.advantage() - self.remote_advantage) // 2 >= 1 and self.tick - self.last_wait >= SYNC_INTERVAL:
+            self.last_wait = self.tick
+            return True
+        return False
+
+    def predict(self, tick):
+        """The opponent's buttons for a tick: received, or else the last ones it held"""
+        buttons = self.remote_inputs.get(tick)
+        if buttons is None:
+            buttons = self.remote_inputs.get(self.remote_tick, 0)
+        return buttons
+
+    def simulate(self, tick):
+        """Run one tick from our stored buttons and the opponent's (maybe predicted) ones"""
+        remote = self.used_inputs[tick] = self.predict(tick)
+        local = self.local_inputs[tick]
+        buttons = (local, remote) if self.index == 0 else (remote, local)
+        step_fight(self.fighters, buttons, tick, self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+        self.saved[tick] = self.save()
+
+    def advance(self, buttons):
+        """Simulate the next tick with our buttons"""
+        self.tick += 1
+        self.local_inputs[self.tick] = buttons
+        self.simulate(self.tick)
+        self.forget()
+
+    def add_remote_inputs(self, ack_tick, advantage, start_tick, buttons):
+        """Take an OP_INPUT_FRAMES of the opponent, mispredicted ticks are replayed by rollback()"""
+        self.acked_tick = max(self.acked_tick, ack_tick)
+        end_tick = start_tick + len(buttons) - 1
+        if end_tick >= self.remote_latest:
+            self.remote_latest = end_tick
+            self.remote_advantage = advantage
+        for tick in range(max(start_tick, self.remote_tick + 1), end_tick + 1):
+            if tick in self.remote_inputs:
+                continue
+            self.remote_inputs[tick] = buttons[tick - start_tick]
+            used = self.used_inputs.get(tick)
+            if used is not None and used != self.remote_inputs[tick]:
+                if self.rollback_tick is None or tick < self.rollback_tick:
+                    self.rollback_tick = tick
+        while self.remote_tick + 1 in self.remote_inputs:
+            self.remote_tick += 1
+
+    def rollback(self):
+        """Rewind to the last right state and simulate again up to now, returns the ticks replayed"""
+        if self.rollback_tick is None:
+            return 0
+        self.load(self.saved[self.rollback_tick - 1])
+        for tick in range(self.rollback_tick, self.tick + 1):
+            self.simulate(tick)
+        replayed = self.tick - self.rollback_tick + 1
+        self.rollback_tick = None
+        self.rollbacks += 1
+        self.replayed_ticks += replayed
+        self.forget()
+        return replayed
+
+    def forget(self):
+        """Drop the states and inputs no rollback can go back to
+
+        A rollback starts from the state after the last tick whose inputs are all known
+        (or before a mispredicted tick still to replay), the opponent's buttons of that
+        tick are the prediction of the next ones. Our buttons are kept until the opponent
+        has them too.
+        """
+        limit = self.remote_tick if self.rollback_tick is None else min(self.remote_tick, self.rollback_tick - 1)
+        limit = min(limit, self.tick)
+        for tick in range(self.kept_tick, limit):
+            # The tick is final, nothing can change it any more
+            self.checksums[tick] = simulation.checksum(self.saved.pop(tick))
+            self.checksums.pop(tick - CHECKSUM_HISTORY, None)
+            if tick in self.server_checksums:
+                self.compare(tick, self.server_checksums.pop(tick))
+            self.remote_inputs.pop(tick, None)
+            self.used_inputs.pop(tick, None)
+        for tick in [tick for tick in self.local_inputs if tick <= min(self.acked_tick, limit)]:
+            del self.local_inputs[tick]
+        self.kept_tick = max(self.kept_tick, limit)
+
+    def verify(self, tick, checksum):
+        """Check the server's checksum of a fight tick, now or once the tick is final"""
+        if tick in self.checksums:
+            self.compare(tick, checksum)
+        elif tick >= self.kept_tick:
+            self.server_checksums[tick] = checksum
+        # Older ticks are not kept, a later checksum will be compared instead
+
+    def compare(self, tick, checksum):
+        if self.checksums[tick] != checksum:
+            self.desyncs += 1
+            if self.desyncs == 1:  # The next ticks follow from this one
+                print(f"Rollback fight out of sync with the server at tick {tick}")
+
+    def outgoing(self, all_unacked=False):
+        """(ack_tick, advantage, start_tick, buttons) of our inputs to send, None if there are none
+
+        all_unacked repeats every tick the opponent has not acknowledged (datagrams may be
+        lost), otherwise only the ticks not sent yet.
+        """
+        start_tick = (self.acked_tick if all_unacked else self.sent_tick) + 1
+        if start_tick > self.tick:
+            return None
+        self.sent_tick = self.tick
+        buttons = bytes(self.local_inputs[tick] for tick in range(start_tick, self.tick + 1))
+        return self.remote_tick, self.advantage(), start_tick, buttons
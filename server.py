@@ -1,48 +1,64 @@
 import socket # For socket handling
-import pickle # For object serialization
 import threading # For thread handling
 import time # For time handling
-import json
+import itertools # For room ID generation
+import collections # For the chat log
+import sys
+
+import characters # Character table
+import protocol # Binary message format
+import simulation # Fighter rules without pygame
+import rollback # Fights simulated by the clients from each other's inputs
+from simulation import FighterSim
+from framing import HEADER, FrameReader, pack_frame
+
+class Room:
+    """One match hosted by the server: two player slots and their own game state"""
+    def __init__(self, room_id, screen_width=1300, screen_height=800, lock_factory=threading.Lock, public=True):
+        self.room_id = room_id
+        self.public = public # Players without a room ID may be put here, a named room is private
+        self.SCREEN_WIDTH = screen_width
+        self.SCREEN_HEIGHT = screen_height
 
-class GameServer:
-    def __init__(self, host='0.0.0.0', port=5555):
-        #AF-INET: IPv4, SOCK_STREAM: TCP
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # Enable reuse of the address to avoid "Address already in use" errors
-        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) 
-        self.server.bind((host, port))
-        self.server.listen(2)  # Accept only 2 connections (2 players)
-       # self.game_state = {"player_selections": [0, 0], "game_active": False}
-        print(f"Server running and listening on {host}:{port}")
-        self.SCREEN_WIDTH = 1300
-        self.SCREEN_HEIGHT = 800
-        
         # Initial player states for reset
         # Player 1 state
+        x, y, flip = simulation.start_position(1, self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
         self.initial_player1_state = {
-            "x": 100,  # Position player 1 at the bottom-left corner
-            "y": self.SCREEN_HEIGHT - 200,  # Near the bottom of the screen
+            "x": x,  # Position player 1 at the bottom-left corner
+            "y": y,  # Near the bottom of the screen
             "health": 100,
             "action": 0,
             "frame_index": 0,
-            "flip": False,
+            "flip": flip,
             "attacking": False,
-            "hit": False
+            "hit": False,
+            "vel_y": 0,
+            "jump": False,
+            "attack_cooldown": 0,
+            "attack_type": 0,
+            "attack_landed": False,
+            "update_tick": 0
         }
         # Player 2 state is flipped horizontally
         # Position player 2 at the bottom-right corner
+        x, y, flip = simulation.start_position(2, self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
         self.initial_player2_state = {
-            "x": self.SCREEN_WIDTH - 150,  # Near the bottom-right corner
-            "y": self.SCREEN_HEIGHT-300,  # Near the bottom of the screen
+            "x": x,  # Near the bottom-right corner
+            "y": y,  # Near the bottom of the screen
             "health": 100,
             "action": 0,
             "frame_index": 0,
-            "flip": True,
+            "flip": flip,
             "attacking": False,
-            "hit": False
+            "hit": False,
+            "vel_y": 0,
+            "jump": False,
+            "attack_cooldown": 0,
+            "attack_type": 0,
+            "attack_landed": False,
+            "update_tick": 0
         }
-        
+
         # Game state that matches client expectations
         self.game_state = {
             "player1": dict(self.initial_player1_state),
@@ -54,267 +70,629 @@ class GameServer:
             "game_over": False,     # Game over state
             "winner": 0,   ## Winner ID (1 or 2)
             "player_selections": [0, 0], ## Player character selections (0-3)
-            "chat_messages": []     ## List to store chat messages
+            "input_seqs": [0, 0],   # Last input applied per player, clients replay the later ones
+            "rollback": False,      # Both players asked for a rollback fight, see rollback.py
+            "checksum": [0, 0]      # Rollback fight: last fight tick simulated and simulation.checksum of the fighters
         }
-        
+
         # Thread safety
-        self.state_lock = threading.Lock() ## Lock for game state updates
-        
-        self.clients = [] # List of connected clients
+        self.state_lock = lock_factory() ## Lock for game state updates
+
+        self.clients = [] # List of connected clients in this room
         self.player_ids = {}  # Map socket to player ID
         self.ready_players = set() ## Track ready players
-        self.selections_done = set()  # Track players who have selected characters  # Track ready players
         self.selection_done = {"player1": False, "player2": False} # Track players who have selected characters
-        
-        self.round_start_time = 0
-        self.last_count_update = 0
-        self.round_over_time = 0
+
+        # Timers count simulation ticks, not wall-clock time: the same inputs give the same game
+        self.last_count_tick = 0 # Tick of the last countdown step
+        self.round_over_tick = 0 # Tick the round ended
+        self.COUNT_TICKS = simulation.TICK_RATE # Ticks per countdown step (1 second)
+        self.ROUND_OVER_TICKS = 2 * simulation.TICK_RATE # Ticks between the end of a round and the next one (2 seconds)
         self.WIN_SCORE = 3
-        
-        # Track last hit times for each player
-        self.last_hit_times = {"player1": 0, "player2": 0}
-        self.HIT_RESET_DELAY = 0.5  # Reset hit state after 0.5 seconds
-        ## Cooldown time after round over
 
+        # Server-authoritative simulation, stepped at simulation.TICK_RATE from client inputs
+        self.tick = 0 # Simulation ticks since the room was created
+        self.SNAPSHOT_INTERVAL = 2 # Ticks between two snapshots (30 per second)
+        self.MAX_INPUT_BACKLOG = 6 # Inputs queued per player, older ones are dropped to bound latency
+        self.fighters = {} # player ID -> FighterSim
+        self.input_queues = {"player1": collections.deque(), "player2": collections.deque()} # (seq, buttons) waiting for a tick
+        self.held_inputs = {"player1": 0, "player2": 0} # Buttons repeated on ticks without a new input
+        self.missed_inputs = {"player1": 0, "player2": 0} # Ticks in a row without a new input
+        self.MAX_HELD_TICKS = self.MAX_INPUT_BACKLOG # Held buttons are released after this many ticks without input (stall, loss)
+        self.last_input_seqs = {"player1": 0, "player2": 0} # Last input applied per player
 
-    def handle_client(self, client, player_id):
-        """Handle connection from a specific client"""
-        try:
-            # Send initial game state
-            with self.state_lock:
-                serialized_state = pickle.dumps(self.game_state)
-            client.send(serialized_state)  # Send initial game state to the client
-            
-            while True:  # Loop to receive data from client
-                # Receive data from client with timeout
-                client.settimeout(1.0)  # 1-second timeout for receiving data
-                try:
-                    data = client.recv(4096)
-                    if not data:
-                        print(f"No data received from {player_id}, client disconnected")
-                        break
-                except socket.timeout:
-                    # This is fine, just continue the loop
-                    continue
-                except ConnectionResetError:
-                    print(f"Connection reset by {player_id}")
-                    break
-                except Exception as e:
-                    print(f"Error receiving data from {player_id}: {e}")
-                    break
-                
-                # Decode received data
-                try:
-                    client_data = pickle.loads(data)
-                    print("data" , client_data)  # Deserialize the data
-                    
-                    # Handle selection_update
-                    if client_data.get("status") in ("selection_update", "selection_changed"):
-                        sel_index = client_data.get("selection")
-                        if player_id == "player1":
-                            self.game_state["player_selections"][0] = sel_index
-                        elif player_id == "player2":
-                            self.game_state["player_selections"][1] = sel_index
-                        print(f"{player_id} updated selection to {sel_index}")
-                        
-                        # Broadcast updated game state
-                        self.broadcast_game_state()
-                        continue
-                    
-                    # Handle chat messages
-                    if "chat" in client_data:
-                        with self.state_lock:
-                            self.game_state["chat_messages"].append(client_data["chat"])
-                            # Limit the number of messages (e.g., max 50 messages)
-                            if len(self.game_state["chat_messages"]) > 50:
-                                self.game_state["chat_messages"] = self.game_state["chat_messages"][-50:]
-                    
-                    # Process ready status
-                    elif "status" in client_data and client_data["status"] == "ready":
-                        self.ready_players.add(player_id)
-                        print(f"{player_id} is ready. Ready players: {self.ready_players}")
-                        
-                        # If both players are ready, start the game
-                        if len(self.ready_players) == 2 and not self.game_state["game_active"]:
-                            print("Both players ready, starting game!")
-                            with self.state_lock:
-                                self.game_state["game_active"] = True
-                                self.game_state["intro_count"] = 5
-                                self.game_state["round_over"] = False
-                                self.game_state["game_over"] = False
-                                # Reset player states to initial values
-                                self.game_state["player1"] = dict(self.initial_player1_state)
-                                self.game_state["player2"] = dict(self.initial_player2_state)
-                            self.round_start_time = time.time()
-                            self.last_count_update = self.round_start_time
-                    
-                    # Update player state if it's a player update
-                    elif "player_id" in client_data and client_data["player_id"] == player_id:
-                        with self.state_lock:
-                            # Update all received player attributes
-                            for key, value in client_data.items():
-                                if key != "player_id" and key in self.game_state[player_id]:
-                                    self.game_state[player_id][key] = value
-                            
-                        # Process any attack interactions
-                        self.process_attack_interactions()
-                    
-                except Exception as e:
-                    print(f"Error processing data from {player_id}: {e}")
-            
-        except Exception as e:
-            print(f"Error handling client {player_id}: {e}")
-        finally:
-            # Clean up when client disconnects
-            print(f"{player_id} has disconnected")
+        # Rollback fights: the clients exchange their inputs through the server, which follows
+        # the fight tick by tick once it has the inputs of both players
+        self.rollback_players = set() # Players whose ready message asked for a rollback fight
+        self.fight_tick = None # Last fight tick simulated, None outside of a rollback fight
+        self.fight_inputs = {"player1": {}, "player2": {}} # fight tick -> buttons not simulated yet
+        self.MAX_FIGHT_INPUTS = simulation.TICK_RATE * 2 # Fight ticks of inputs kept ahead of the simulation
+
+        # Numbered snapshots of game_state, clients get deltas against the last one they acked
+        self.snapshot_seq = 1
+        self.snapshots = {1: protocol.snapshot_groups(self.game_state)} # seq -> groups, oldest first
+        self.acked_seqs = {} # player ID -> last snapshot applied by that client (0: needs a full one)
+        self.sent_seqs = {}  # player ID -> last snapshot sent to that client
+        self.sent_ticks = {} # player ID -> tick that snapshot was last sent
+        self.SNAPSHOT_RESEND_TICKS = simulation.TICK_RATE // 4 # An unacked snapshot is sent again after 250 ms (lost datagram)
+
+        # Chat is its own event channel: each line is sent once, not with every snapshot
+        self.chat_lock = lock_factory() # Numbers and sends the lines in order, without holding state_lock
+        self.chat_seq = 0 # Sequence number of the last chat line
+        self.chat_log = collections.deque(maxlen=50) # (seq, text) of the last 50 lines, for clients catching up
+
+    def is_full(self):
+        """Check if both player slots are taken"""
+        return len(self.clients) >= 2
+
+    def add_client(self, client):
+        """Give the client a free player slot, returns the player ID or None if the room is full"""
+        with self.state_lock:
+            taken = set(self.player_ids.values())
+            for player_id in ("player1", "player2"):
+                if player_id not in taken:
+                    self.clients.append(client)
+                    self.player_ids[client] = player_id
+                    self.acked_seqs[player_id] = 0 # Joining client starts from a full snapshot
+                    self.sent_seqs[player_id] = 0
+                    self.input_queues[player_id].clear() # Input seqs restart from 0 with the new client
+                    self.last_input_seqs[player_id] = 0
+                    return player_id
+        return None
+
+    def remove_client(self, client):
+        """Free the slot of a disconnected client"""
+        with self.state_lock:
+            player_id = self.player_ids.pop(client, None)
             if client in self.clients:
                 self.clients.remove(client)
-            if client in self.player_ids:
-                del self.player_ids[client]
             if player_id in self.ready_players:
                 self.ready_players.remove(player_id)
-            
-            try:
-                client.close()
-            except:
-                pass
-                
+            self.rollback_players.discard(player_id)
+            if player_id:
+                self.selection_done[player_id] = False
+                self.acked_seqs.pop(player_id, None)
+                self.sent_seqs.pop(player_id, None)
+                self.sent_ticks.pop(player_id, None)
+
             # Update game state
+            self.game_state["game_active"] = False
+            self.fight_tick = None
+        return player_id
+
+    def handle_message(self, player_id, payload):
+        """Apply one message received from a player of this room"""
+        op = protocol.opcode(payload)
+
+        # Snapshot acknowledgements
+        if op == protocol.OP_ACK:
+            seq = protocol.decode_ack(payload)
             with self.state_lock:
-                self.game_state["game_active"] = False
-                
-            # Broadcast to remaining clients
-            self.broadcast_game_state()  # Send updated state to remaining clients
+                if seq > self.acked_seqs.get(player_id, 0):
+                    self.acked_seqs[player_id] = seq
 
-    def periodic_broadcast(self):
-        """Periodically broadcast game state to all clients"""
-        while True:
-            try:
+        # Client lost its delta base, next broadcast sends it a full snapshot
+        elif op == protocol.OP_RESYNC:
+            with self.state_lock:
+                self.acked_seqs[player_id] = 0
+                self.sent_seqs[player_id] = 0
+
+        # Handle selection_update
+        elif op == protocol.OP_SELECTION:
+            sel_index = protocol.decode_selection(payload)
+            if not 0 <= sel_index < len(characters.CHARACTERS):
+                print(f"[room {self.room_id}] {player_id} sent an unknown selection {sel_index}, ignored")
+            else:
+                if player_id == "player1":
+                    self.game_state["player_selections"][0] = sel_index
+                elif player_id == "player2":
+                    self.game_state["player_selections"][1] = sel_index
+                print(f"[room {self.room_id}] {player_id} updated selection to {sel_index}")
+
+                # Broadcast updated game state
                 self.broadcast_game_state()
-                time.sleep(0.1)  # Broadcast every 0.1 seconds
-            except Exception as e:
-                print(f"Error in periodic broadcast: {e}")
-            
-    def process_attack_interactions(self):
-        """Process attack interactions between players"""
-        current_time = time.time() # Get current time for hit reset logic
-        
+
+        # Handle chat messages
+        elif op == protocol.OP_CHAT:
+            with self.chat_lock:
+                self.chat_seq += 1
+                self.chat_log.append((self.chat_seq, protocol.decode_string(payload)))
+                # Sent under the chat lock so every client gets the lines in seq order
+                self.send_frame(list(self.clients), pack_frame(protocol.encode_chat_event(*self.chat_log[-1])))
+
+        # Client (re)joined, send the chat lines it has not seen yet
+        elif op == protocol.OP_CHAT_SYNC:
+            after_seq = protocol.decode_chat_sync(payload)
+            with self.chat_lock:
+                if after_seq > self.chat_seq:
+                    after_seq = 0 # Seq from another room or an older instance of this one
+                events = b"".join(pack_frame(protocol.encode_chat_event(seq, text))
+                                  for seq, text in self.chat_log if seq > after_seq)
+                if events:
+                    self.send_frame([client for client, sender in list(self.player_ids.items()) if sender == player_id], events)
+
+        # Process ready status
+        elif op == protocol.OP_READY:
+            _, wants_rollback = protocol.decode_ready(payload)
+            if wants_rollback:
+                self.rollback_players.add(player_id)
+            else:
+                self.rollback_players.discard(player_id)
+            self.ready_players.add(player_id)
+            self.selection_done[player_id] = True
+            print(f"[room {self.room_id}] {player_id} is ready. Ready players: {self.ready_players}")
+
+            # If both players are ready, start the game
+            if len(self.ready_players) == 2 and not self.game_state["game_active"]:
+                print(f"[room {self.room_id}] Both players ready, starting game!")
+                with self.state_lock:
+                    self.game_state["game_active"] = True
+                    self.game_state["intro_count"] = 5
+                    self.game_state["round_over"] = False
+                    self.game_state["game_over"] = False
+                    self.game_state["scores"] = [0, 0] # A new match, whoever played in this room before
+                    self.game_state["winner"] = 0
+                    self.game_state["rollback"] = len(self.rollback_players) == 2
+                    # Reset player states to initial values
+                    self.reset_fighters()
+                    self.fight_tick = None
+                    self.last_count_tick = self.tick
+
+        # Queue the buttons a player held for one tick
+        elif op == protocol.OP_INPUT:
+            seq, buttons = protocol.decode_input(payload)
+            with self.state_lock:
+                queue = self.input_queues[player_id]
+                if seq <= (queue[-1][0] if queue else self.last_input_seqs[player_id]):
+                    return # Late datagram, a newer input already arrived
+                queue.append((seq, buttons))
+                if len(queue) > self.MAX_INPUT_BACKLOG:
+                    queue.popleft()
+
+        # Rollback fight: keep the inputs for our copy of the fight and pass them on to the opponent
+        elif op == protocol.OP_INPUT_FRAMES:
+            _, _, start_tick, buttons = protocol.decode_input_frames(payload)
+            with self.state_lock:
+                if self.fight_tick is not None:
+                    inputs = self.fight_inputs[player_id]
+                    first = max(start_tick, self.fight_tick + 1)
+                    last = min(start_tick + len(buttons), self.fight_tick + 1 + self.MAX_FIGHT_INPUTS)
+                    for tick in range(first, last):
+                        inputs[tick] = buttons[tick - start_tick]
+                opponents = [client for client, sender in self.player_ids.items() if sender != player_id]
+            self.send_frame(opponents, pack_frame(payload))
+
+    def reset_fighters(self):
+        """Put fresh fighters of the selected characters at their start positions, caller must hold state_lock"""
+        for index, player_id in enumerate(("player1", "player2")):
+            initial = self.initial_player1_state if index == 0 else self.initial_player2_state
+            selection = self.game_state["player_selections"][index]
+            steps = characters.character(selection)["steps"]
+            self.fighters[player_id] = FighterSim(index + 1, initial["x"], initial["y"], initial["flip"], steps, selection)
+            self.game_state[player_id] = self.fighters[player_id].state()
+            self.input_queues[player_id].clear()
+            self.held_inputs[player_id] = 0
+            self.missed_inputs[player_id] = 0
+
+    def start_fight(self):
+        """Start following a rollback fight from fresh fighters, like the clients, caller must hold state_lock"""
+        self.reset_fighters()
+        self.fight_tick = 0
+        self.game_state["checksum"] = [0, 0] # Not the last one of the previous round
+        for inputs in self.fight_inputs.values():
+            inputs.clear()
+
+    def step(self):
+        """Advance the simulation by one fixed tick"""
         with self.state_lock:
-            if not self.game_state["game_active"] or self.game_state["round_over"]: # Check if game is active and round is not over
-                # If game is not active or round is over, skip processing
+            self.tick += 1
+
+            # One queued input per player and tick, the last buttons are held when none arrived,
+            # for a few ticks only: a client whose inputs stopped does not keep walking or attacking
+            for player_id, queue in self.input_queues.items():
+                if queue:
+                    self.last_input_seqs[player_id], self.held_inputs[player_id] = queue.popleft()
+                    self.missed_inputs[player_id] = 0
+                else:
+                    self.missed_inputs[player_id] += 1
+                    if self.missed_inputs[player_id] > self.MAX_HELD_TICKS:
+                        self.held_inputs[player_id] = 0
+            self.game_state["input_seqs"] = [self.last_input_seqs["player1"], self.last_input_seqs["player2"]]
+
+            if not self.game_state["game_active"] or len(self.fighters) < 2:
                 return
-                
-            p1 = self.game_state["player1"] ## Player 1 state
-            p2 = self.game_state["player2"] ## Player 2 state
-            
-            # Reset hit states if enough time has passed since last hit
-            if p1["hit"] and current_time - self.last_hit_times["player1"] >= self.HIT_RESET_DELAY:
-                p1["hit"] = False
-                
-            if p2["hit"] and current_time - self.last_hit_times["player2"] >= self.HIT_RESET_DELAY:
-                p2["hit"] = False
-            
-            # Check if player 1 is attacking player 2
-            if p1["attacking"] and not p2["hit"]:
-                # Simple hit detection - adjust based on your fighter implementation
-                # This is a simplified version assuming rectangular hit detection
-                p1_right = p1["x"] + 100  # Estimated attack range
-                p2_left = p2["x"] - 50     # Estimated position adjustment
-                
-                if p1_right > p2_left and p1["y"] - 50 < p2["y"] + 50 and p1["y"] + 50 > p2["y"] - 50: # Check if player 1's attack hits player 2
-                    # Hit detected
-                    p2["health"] -= 15# Damage amount
-                    p2["hit"] = True
-                    self.last_hit_times["player2"] = current_time
-                    
-                    # Check for round end
-                    if p2["health"] <= 0:
-                        p2["health"] = 0
-                        self.game_state["round_over"] = True
-                        self.game_state["scores"][0] += 1 # Increment player 1's score
-                        self.round_over_time = time.time() # Store round over time
-                    
-            # Check if player 2 is attacking player 1
-            if p2["attacking"] and not p1["hit"]:
-                # Simple hit detection
-                p2_left = p2["x"] - 100   # Estimated attack range (for player 2 attacking left)
-                p1_right = p1["x"] + 50   # Estimated position adjustment
-                
-                if p2_left < p1_right and p2["y"] - 50 < p1["y"] + 50 and p2["y"] + 50 > p1["y"] - 50:
-                    # Hit detected
-                    p1["health"] -= 5  # Damage amount
-                    p1["hit"] = True
-                    self.last_hit_times["player1"] = current_time
-                    
-                    # Check for round end
-                    if p1["health"] <= 0:
-                        p1["health"] = 0
-                        self.game_state["round_over"] = True
-                        self.game_state["scores"][1] += 1
-                        self.round_over_time = time.time()
-            
-            # Check for game over
-            if self.game_state["scores"][0] >= self.WIN_SCORE:
-                self.game_state["game_over"] = True
-                self.game_state["winner"] = 1
-            elif self.game_state["scores"][1] >= self.WIN_SCORE:
-                self.game_state["game_over"] = True
-                self.game_state["winner"] = 2
-                
+            fighter_1 = self.fighters["player1"]
+            fighter_2 = self.fighters["player2"]
+
+            if self.fight_tick is not None:
+                # Rollback fight: every fight tick whose inputs both arrived, numbered like on the clients
+                inputs_1 = self.fight_inputs["player1"]
+                inputs_2 = self.fight_inputs["player2"]
+                while self.fight_tick + 1 in inputs_1 and self.fight_tick + 1 in inputs_2:
+                    self.fight_tick += 1
+                    buttons = (inputs_1.pop(self.fight_tick), inputs_2.pop(self.fight_tick))
+                    rollback.step_fight((fighter_1, fighter_2), buttons, self.fight_tick, self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+                    self.check_defeat(fighter_1, fighter_2)
+                # The clients simulate the fight too: snapshots carry a checksum of the fighters
+                # instead of their states, until the game is over and the clients stop
+                self.game_state["checksum"] = [self.fight_tick, simulation.checksum((fighter_1.state(), fighter_2.state()))]
+                if not self.game_state["game_over"]:
+                    return
+            else:
+                #move fighters once the countdown is over and while the game is not over
+                if not self.game_state["game_over"] and self.game_state["intro_count"] <= 0:
+                    round_over = self.game_state["round_over"]
+                    fighter_1.move(self.held_inputs["player1"], self.SCREEN_WIDTH, self.SCREEN_HEIGHT, fighter_2, round_over)
+                    fighter_2.move(self.held_inputs["player2"], self.SCREEN_WIDTH, self.SCREEN_HEIGHT, fighter_1, round_over)
+
+                #update fighters
+                fighter_1.update(self.tick)
+                fighter_2.update(self.tick)
+                self.check_defeat(fighter_1, fighter_2)
+
+            self.game_state["player1"] = fighter_1.state()
+            self.game_state["player2"] = fighter_2.state()
+
+    def check_defeat(self, fighter_1, fighter_2):
+        """End the round when a fighter died, caller must hold state_lock"""
+        #check for player defeat
+        if not self.game_state["game_over"] and not self.game_state["round_over"]:
+            if fighter_1.alive == False:
+                self.end_round(1)
+            elif fighter_2.alive == False:
+                self.end_round(0)
+
+    def end_round(self, winner_index):
+        """Score the round for a player, caller must hold state_lock"""
+        self.game_state["round_over"] = True
+        self.game_state["scores"][winner_index] += 1
+        self.round_over_tick = self.tick # Store round over tick
+
+        # Check for game over
+        if self.game_state["scores"][winner_index] >= self.WIN_SCORE:
+            self.game_state["game_over"] = True
+            self.game_state["winner"] = winner_index + 1
+
     def update_game_state(self): #update game state based on time
-        """Update game state based on time"""
-        current_time = time.time()
-        
+        """Update the countdown and the round over cooldown, counted in simulation ticks"""
         with self.state_lock:
             # Update countdown
             if self.game_state["game_active"] and not self.game_state["round_over"] and self.game_state["intro_count"] > 0:
-                if current_time - self.last_count_update >= 1.0:  # 1 second interval
+                if self.tick - self.last_count_tick >= self.COUNT_TICKS:  # 1 second interval
                     self.game_state["intro_count"] -= 1
-                    self.last_count_update = current_time
-            
+                    self.last_count_tick = self.tick
+                    if self.game_state["intro_count"] == 0 and self.game_state["rollback"]:
+                        self.start_fight()
+
             # Handle round over cooldown
             if self.game_state["round_over"] and not self.game_state["game_over"]:
-                if current_time - self.round_over_time >= 2.0:  # 2 second cooldown
+                if self.tick - self.round_over_tick >= self.ROUND_OVER_TICKS:  # 2 second cooldown
                     # Reset for next round
                     self.game_state["round_over"] = False
                     self.game_state["intro_count"] = 5
-                    
-                    # Reset player states completely by assigning fresh copies of initial states
-                    self.game_state["player1"] = dict(self.initial_player1_state)
-                    self.game_state["player2"] = dict(self.initial_player2_state)
-                    
-                    self.round_start_time = current_time
-                    self.last_count_update = current_time
-                    
+
+                    # Reset player states completely with fresh fighters
+                    self.reset_fighters()
+                    self.fight_tick = None
+
+                    self.last_count_tick = self.tick
+
+    def take_snapshot(self):
+        """Number the current game state if it changed, caller must hold state_lock"""
+        groups = protocol.snapshot_groups(self.game_state)
+        if groups != self.snapshots[self.snapshot_seq]:
+            self.snapshot_seq += 1
+            self.snapshots[self.snapshot_seq] = groups
+            if len(self.snapshots) > protocol.SNAPSHOT_HISTORY:
+                del self.snapshots[next(iter(self.snapshots))] # Drop the oldest snapshot
+
+    def encode_snapshot_for(self, player_id, encoded):
+        """Framed snapshot for one client, None if it has the latest one or was just sent it
+
+        The latest snapshot is sent again every SNAPSHOT_RESEND_TICKS until the client acks
+        it: over UDP it may have been lost, and once the state stops changing no newer
+        snapshot would replace it. Clients acked on the same base share the same bytes
+        through the encoded dict.
+        """
+        seq = self.snapshot_seq
+        if self.acked_seqs.get(player_id, 0) >= seq:
+            return None
+        if self.sent_seqs.get(player_id) == seq and self.tick - self.sent_ticks.get(player_id, 0) < self.SNAPSHOT_RESEND_TICKS:
+            return None
+        base_seq = self.acked_seqs.get(player_id, 0)
+        if base_seq not in self.snapshots:
+            base_seq = 0 # Full snapshot: new client, resync, or base already dropped
+        if base_seq not in encoded:
+            encoded[base_seq] = pack_frame(protocol.encode_snapshot(seq, self.tick, self.snapshots[seq], base_seq, self.snapshots.get(base_seq)))
+        self.sent_seqs[player_id] = seq
+        self.sent_ticks[player_id] = self.tick
+        return encoded[base_seq]
+
     def broadcast_game_state(self):
-        """Send current game state to all clients"""
+        """Send the changes since each client's acked snapshot to all clients of this room"""
         with self.state_lock:
-            serialized_state = pickle.dumps(self.game_state) # Serialize the game state
-            
-        for client in self.clients[:]:  # Copy the list to avoid modification during iteration
+            self.take_snapshot()
+            encoded = {} # base seq -> framed snapshot
+            outgoing = [(client, self.encode_snapshot_for(self.player_ids[client], encoded)) for client in self.clients]
+
+        for client, serialized_state in outgoing:
+            if serialized_state is not None:
+                self.send_frame([client], serialized_state) # Send the framed snapshot to each client
+
+    def send_frame(self, clients, frame):
+        """Send already framed bytes to some clients of this room
+
+        Clients queue what they are given (TcpConnection, AsyncConnection, UdpConnection),
+        so one slow client never holds up the tick of the rooms.
+        """
+        for client in clients:
             try:
-                client.send(serialized_state) # Send the serialized game state to each client
+                client.sendall(frame)
             except Exception as e:
-                print(f"Error sending to client: {e}")
-               
-                
+                print(f"[room {self.room_id}] Error sending to client: {e}")
+
+
+class Lobby:
+    """Room tables shared by the server front-ends"""
+    def __init__(self, screen_width=1300, screen_height=800, lock_factory=threading.Lock):
+        self.SCREEN_WIDTH = screen_width
+        self.SCREEN_HEIGHT = screen_height
+        self.lock_factory = lock_factory # threading.Lock, or contextlib.nullcontext on a single-threaded event loop
+
+        # Rooms hosted by this server
+        self.rooms = {}  # Map room ID to Room
+        self.open_rooms = {}  # Numbered rooms waiting for a second player (dict keeps join order), named rooms are private
+        self.rooms_lock = lock_factory() ## Lock for the room tables
+        self.room_ids = itertools.count(1) # Generator for new room IDs
+
+    def create_room(self, room_id=None):
+        """Create a new room, caller must hold rooms_lock
+
+        A numbered room (room_id None) is open to quick joins, a named one only to
+        players who give its ID.
+        """
+        public = room_id is None
+        if public:
+            room_id = str(next(self.room_ids))
+            while room_id in self.rooms:
+                room_id = str(next(self.room_ids))
+        room = Room(room_id, self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.lock_factory, public)
+        self.rooms[room_id] = room
+        if public:
+            self.open_rooms[room_id] = room
+        print(f"Room {room_id} created. Total rooms: {len(self.rooms)}")
+        return room
+
+    def join_room(self, client, room_id=None):
+        """Put a client in a room, returns (room, player_id) or (None, error message)
+
+        room_id None joins the oldest numbered room waiting for a player or creates a
+        new one, an unknown room_id creates that (private) room.
+        """
+        with self.rooms_lock:
+            if room_id is None:
+                room = next(iter(self.open_rooms.values()), None) or self.create_room()
+            else:
+                room_id = str(room_id)
+                room = self.rooms.get(room_id) or self.create_room(room_id)
+
+            player_id = room.add_client(client)
+            if player_id is None:
+                return None, "Room is full"
+            if room.is_full():
+                self.open_rooms.pop(room.room_id, None)
+            return room, player_id
+
+    def leave_room(self, room, client):
+        """Remove a client from its room and drop the room once empty"""
+        player_id = room.remove_client(client)
+        with self.rooms_lock:
+            if not room.clients:
+                self.rooms.pop(room.room_id, None)
+                self.open_rooms.pop(room.room_id, None)
+                print(f"Room {room.room_id} closed. Total rooms: {len(self.rooms)}")
+            elif self.rooms.get(room.room_id) is room and room.public:
+                self.open_rooms[room.room_id] = room
+        return player_id
+
+    def tick(self):
+        """Advance every room by one simulation tick and broadcast the due snapshots"""
+        for room in list(self.rooms.values()):
+            # Update game state based on time
+            room.update_game_state()
+            room.step()
+
+            # Broadcast updated state to all clients
+            if room.clients and room.tick % room.SNAPSHOT_INTERVAL == 0:
+                room.broadcast_game_state()
+
+
+class TcpConnection:
+    """A client socket with its own writer thread, Room broadcasts to it without waiting
+
+    A snapshot still queued when the next one comes is dropped, the next one replaces it
+    (deltas are taken against the snapshot the client acked). A client that lets more
+    than max_buffer bytes of other messages pile up is disconnected.
+    """
+    def __init__(self, sock, max_buffer=64 * 1024):
+        self.sock = sock
+        self.max_buffer = max_buffer
+        self.queue = collections.deque() # Framed bytes waiting for the writer thread
+        self.queued_bytes = 0
+        self.closed = False
+        self.aborted = False # Closed by abort(), the socket is left to the reading thread
+        self.ready = threading.Condition()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def sendall(self, data):
+        """Queue framed bytes for the writer thread"""
+        with self.ready:
+            if self.closed:
+                raise ConnectionResetError("connection closed")
+            if protocol.opcode(data[HEADER.size:]) == protocol.OP_SNAPSHOT:
+                for queued in [queued for queued in self.queue if protocol.opcode(queued[HEADER.size:]) == protocol.OP_SNAPSHOT]:
+                    self.queue.remove(queued) # Stale, never sent
+                    self.queued_bytes -= len(queued)
+            elif self.queued_bytes + len(data) > self.max_buffer:
+                self.abort()
+                raise ConnectionResetError("client is not reading, connection closed")
+            self.queue.append(data)
+            self.queued_bytes += len(data)
+            self.ready.notify()
+        return len(data)
+
+    def write_loop(self):
+        """Send the queued frames in order, then close the socket once close() was called"""
+        while True:
+            with self.ready:
+                while not self.queue and not self.closed:
+                    self.ready.wait()
+                if not self.queue:
+                    break
+                data = self.queue.popleft()
+                self.queued_bytes -= len(data)
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.abort()
+                break
+        if not self.aborted:
+            self.sock.close()
+
+    def close(self):
+        """Close once the queued frames are sent, called by the thread reading the socket"""
+        with self.ready:
+            self.closed = True
+            self.ready.notify()
+            if self.aborted:
+                self.sock.close() # The writer is gone or failing, nothing left to send
+
+    def abort(self):
+        """Close now, what is queued is dropped and the reading thread wakes up"""
+        with self.ready:
+            self.closed = True
+            self.aborted = True
+            self.queue.clear()
+            self.queued_bytes = 0
+            self.ready.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class GameServer:
+    def __init__(self, host='0.0.0.0', port=5555, udp=False):
+        #AF-INET: IPv4, SOCK_STREAM: TCP
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Enable reuse of the address to avoid "Address already in use" errors
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.bind((host, port))
+        self.server.listen(128)  # Backlog for many rooms, each room holds 2 players
+        print(f"Server running and listening on {host}:{port}")
+        self.host = host
+        self.port = port
+        self.udp = udp # Also accept clients on a UDP socket of the same port
+        self.SCREEN_WIDTH = 1300
+        self.SCREEN_HEIGHT = 800
+
+        self.lobby = Lobby(self.SCREEN_WIDTH, self.SCREEN_HEIGHT) # Rooms hosted by this server
+        self.JOIN_TIMEOUT = 5.0 # Seconds a new client has to send its join request
+        self.TICK_INTERVAL = 1 / simulation.TICK_RATE # Seconds between two simulation ticks
+        self.MAX_LAG = 0.25 # Seconds of missed ticks caught up before they are dropped
+
+    def read_join_request(self, client, reader):
+        """Wait for the OP_JOIN frame, returns the requested room ID (None for any open room)"""
+        client.settimeout(self.JOIN_TIMEOUT)
+        try:
+            while True:
+                payload = reader.next_frame()
+                if payload is not None:
+                    if protocol.opcode(payload) != protocol.OP_JOIN:
+                        raise ValueError(f"Expected a join request, got opcode {protocol.opcode(payload)}")
+                    return protocol.decode_join(payload)
+                if not reader.recv_from(client):
+                    raise ConnectionResetError("client closed before joining")
+        except socket.timeout:
+            return None  # No request, join any open room
+
+    def handle_client(self, client, addr):
+        """Handle connection from a specific client"""
+        room = None
+        player_id = None
+        reader = FrameReader() # Reassembles the frames sent by this client
+        connection = TcpConnection(client) # Everything sent to this client goes through its writer thread
+        try:
+            room_id = self.read_join_request(client, reader)
+            room, player_id = self.lobby.join_room(connection, room_id)
+            if room is None:
+                connection.sendall(pack_frame(protocol.encode_error(player_id)))
+                return
+
+            # Send ID to client
+            connection.sendall(pack_frame(protocol.encode_welcome(player_id, room.room_id)))
+            print(f"{addr} joined room {room.room_id} as {player_id}. Players in room: {len(room.clients)}")
+
+            # Send initial game state (a full snapshot, the client has no base yet)
+            room.broadcast_game_state()
+
+            # Receive data from client, the writer thread shares the socket so it has no
+            # timeout (a send cut by a timeout would leave half a frame on the stream)
+            client.settimeout(None)
+            while True:  # Loop to receive data from client
+                try:
+                    if not reader.recv_from(client):
+                        print(f"No data received from {player_id}, client disconnected")
+                        break
+                except socket.timeout:
+                    # This is fine, just continue the loop
+                    continue
+                except ConnectionResetError:
+                    print(f"Connection reset by {player_id}")
+                    break
+                except Exception as e:
+                    print(f"Error receiving data from {player_id}: {e}")
+                    break
+
+                # Handle every complete message received so far
+                for payload in reader.frames():
+                    try:
+                        room.handle_message(player_id, payload)
+                    except Exception as e:
+                        print(f"Error processing data from {player_id}: {e}")
+
+        except Exception as e:
+            print(f"Error handling client {player_id}: {e}")
+        finally:
+            connection.close()
+
+            # Clean up when client disconnects
+            if room is not None:
+                print(f"{player_id} has disconnected from room {room.room_id}")
+                self.lobby.leave_room(room, connection)
+
+                # Broadcast to remaining clients
+                room.broadcast_game_state()  # Send updated state to remaining clients
+
     def game_loop(self):
-        """Main game loop that runs in the background"""
+        """Main game loop that ticks every room at a fixed rate in the background"""
+        next_tick = time.monotonic()
         while True:
             try:
-                # Update game state based on time
-                self.update_game_state()
-                
-                # Broadcast updated state to all clients
-                if self.clients:  #
-                    self.broadcast_game_state()
-                
-                # Sleep to prevent CPU overuse
-                time.sleep(1/30) 
-                
+                self.lobby.tick()
             except Exception as e:
                 print(f"Error in game loop: {e}")
-                
+
+            # Sleep until the next tick, late ticks run back to back to catch up
+            next_tick += self.TICK_INTERVAL
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.MAX_LAG:
+                next_tick = time.monotonic() # Too far behind, drop the missed ticks
+
     def run(self):
         """Run server and accept connections"""
         try:
@@ -322,63 +700,53 @@ class GameServer:
             game_thread = threading.Thread(target=self.game_loop)
             game_thread.daemon = True # Daemonize thread to exit when main program exits
             game_thread.start()
-            
+
+            if self.udp:
+                # UDP clients share the lobby with the TCP ones
+                from udp_server import start_udp_thread
+                start_udp_thread(self.lobby, self.host, self.port)
+
             print("Waiting for players to connect...")
             while True:
-              
+
                 self.server.settimeout(1.0)
                 try:
                     client, addr = self.server.accept()
                     print(f"Connection from {addr}")
-                    
-                    
+
                     client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) #Tắt chế độ Nagle (TCP_NODELAY), giúp giảm độ trễ khi gửi dữ liệu qua mạng.
-                    
-                   
-                    if len(self.clients) < 2:
-                        player_id = f"player{len(self.clients) + 1}"
-                        
-                       
-                        self.clients.append(client)
-                        self.player_ids[client] = player_id
-                        
-                        # Send ID to client
-                        response = {"player_id": player_id}
-                        client.send(pickle.dumps(response))
-                        
-                        # Create thread to handle this client
-                        client_thread = threading.Thread(target=self.handle_client, args=(client, player_id))
-                        client_thread.daemon = True
-                        client_thread.start()
-                        
-                        print(f"Player {player_id} connected. Total players: {len(self.clients)}")
-                    else:
-                      
-                        try:
-                            client.send(pickle.dumps({"error": "Room is full"}))
-                            client.close()
-                        except:
-                            pass
+
+                    # Create thread to handle this client, it picks the room
+                    client_thread = threading.Thread(target=self.handle_client, args=(client, addr))
+                    client_thread.daemon = True
+                    client_thread.start()
                 except socket.timeout:
-              
+
                     continue
                 except Exception as e:
                     print(f"Error accepting connection: {e}")
-                    
+
         except KeyboardInterrupt:
             print("Server shutting down...")
         except Exception as e:
             print(f"Server error: {e}")
         finally:
             # Clean up
-            for client in self.clients:
-                try:
-                    client.close()
-                except:
-                    pass
+            for room in list(self.lobby.rooms.values()):
+                for client in room.clients:
+                    try:
+                        client.close()
+                    except:
+                        pass
             self.server.close()
             print("Server closed")
 
 if __name__ == "__main__":
-    server = GameServer()
-    server.run()
\ No newline at end of file
+    udp = "--udp" in sys.argv # Clients started with --udp avoid TCP head-of-line blocking
+    if "--async" in sys.argv:
+        # One event loop for every connection instead of one thread per client
+        from async_server import AsyncGameServer
+        server = AsyncGameServer(udp=udp)
+    else:
+        server = GameServer(udp=udp)
+    server.run()
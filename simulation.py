@@ -0,0 +1,295 @@
+import struct
+import zlib
+
+import hitboxes
+
+# Fighter rules without pygame, stepped at a fixed tick rate from input bitmasks.
+# The server runs this for both players, driven by the input messages of the clients;
+# fighter.Fighter draws a FighterSim and plays its sounds (main.py, client prediction).
+# Everything is integer and counted in ticks, so the same inputs give the same states on
+# every machine, and two copies of a fight can be compared with checksum(). Hits are
+# decided by the hitbox and hurtbox tables of the animation frames (hitboxes.py).
+
+TICK_RATE = 60  # Simulation ticks per second (the game was tuned at 60 FPS)
+SPEED = 10
+GRAVITY = 2
+JUMP_VELOCITY = -30
+FLOOR_MARGIN = 110  # Distance between the floor and the bottom of the screen
+ATTACK_COOLDOWN = 20  # Ticks between two attacks
+ANIMATION_COOLDOWN = 50  # Milliseconds per animation frame
+ATTACK_DAMAGE = 10  # Health taken by an attack, once per attack
+
+# Buttons held during one tick, packed in one byte
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_ATTACK1 = 8
+INPUT_ATTACK2 = 16
+INPUT_ATTACK3 = 32
+INPUT_ATTACKS = INPUT_ATTACK1 | INPUT_ATTACK2 | INPUT_ATTACK3
+
+# Actions, same order as the rows of the sprite sheets
+IDLE = 0
+RUN = 1
+JUMP = 2
+ATTACK1 = 3
+ATTACK2 = 4
+HIT = 5
+DEATH = 6
+
+
+# x, y, vel_y, health, update_tick, action, frame_index, attack_cooldown, attack_type, flags
+CHECKSUM_FIELDS = struct.Struct("!iiiiIBBBBB")
+
+
+def checksum(states):
+    """crc32 of fighter state dicts (FighterSim.state()), in order"""
+    crc = 0
+    for state in states:
+        flags = (state["flip"] | state["jump"] << 1 | state["attacking"] << 2 | state["hit"] << 3
+                 | state["attack_landed"] << 4)
+        crc = zlib.crc32(CHECKSUM_FIELDS.pack(state["x"], state["y"], state["vel_y"], state["health"],
+                                              state["update_tick"], state["action"], state["frame_index"],
+                                              state["attack_cooldown"], state["attack_type"], flags), crc)
+    return crc
+
+
+def start_position(player, screen_width, screen_height):
+    """(x, y, flip) of fighter 1 or 2 at the start of a round"""
+    if player == 1:
+        return 100, screen_height - 200, False  # Bottom-left corner
+    return screen_width - 150, screen_height - 300, True  # Bottom-right corner, facing left
+
+
+class SimRect:
+    """The parts of pygame.Rect the rules use"""
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    @property
+    def left(self):
+        return self.x
+
+    @property
+    def right(self):
+        return self.x + self.width
+
+    @property
+    def top(self):
+        return self.y
+
+    @property
+    def bottom(self):
+        return self.y + self.height
+
+    @property
+    def centerx(self):
+        return self.x + self.width // 2
+
+
+class FighterSim:
+    """Position, velocity, action, animation frame, cooldown and health of one fighter"""
+    def __init__(self, player, x, y, flip, animation_steps, character):
+        self.player = player
+        self.flip = flip
+        self.animation_steps = animation_steps  # Frames per action, decides when attacks and hits end
+        self.character = character  # Selection index, for the hitboxes of its frames
+        self.boxes = hitboxes.character_boxes(character)
+        self.action = IDLE
+        self.frame_index = 0
+        self.update_tick = 0
+        self.rect = SimRect(x, y, 80, 180)
+        self.vel_y = 0
+        self.running = False
+        self.jump = False
+        self.attacking = False
+        self.attack_type = 0
+        self.attack_cooldown = 0
+        self.attack_landed = False  # The current attack already hit
+        self.hit = False
+        self.health = 100
+        self.alive = True
+
+    def move(self, inputs, screen_width, screen_height, target, round_over):
+        """Apply one tick of input, gravity, screen bounds, facing and cooldown"""
+        dx = 0
+        dy = 0
+        self.running = False
+        self.attack_type = 0
+
+        #can only perform other actions if not currently attacking
+        if self.attacking == False and self.alive == True and round_over == False:
+            #movement
+            if inputs & INPUT_LEFT:
+                dx = -SPEED
+                self.running = True
+            if inputs & INPUT_RIGHT:
+                dx = SPEED
+                self.running = True
+            #jump
+            if inputs & INPUT_JUMP and self.jump == False:
+                self.vel_y = JUMP_VELOCITY
+                self.jump = True
+            #attack
+            if inputs & INPUT_ATTACKS:
+                self.attack()
+                #determine which attack type was used
+                if inputs & INPUT_ATTACK1:
+                    self.attack_type = 1
+                if inputs & INPUT_ATTACK2:
+                    self.attack_type = 2
+                if inputs & INPUT_ATTACK3:
+                    self.attack_type = 3
+
+        #apply gravity
+        self.vel_y += GRAVITY
+        dy += self.vel_y
+
+        #ensure player stays on screen
+        if self.rect.left + dx < 0:
+            dx = -self.rect.left
+        if self.rect.right + dx > screen_width:
+            dx = screen_width - self.rect.right
+        if self.rect.bottom + dy > screen_height - FLOOR_MARGIN:
+            self.vel_y = 0
+            self.jump = False
+            dy = screen_height - FLOOR_MARGIN - self.rect.bottom
+
+        #ensure players face each other
+        if target.rect.centerx > self.rect.centerx:
+            self.flip = False
+        else:
+            self.flip = True
+
+        #apply attack cooldown
+        if self.attack_cooldown > 0:
+            self.attack_cooldown -= 1
+
+        #update player position
+        self.rect.x += dx
+        self.rect.y += dy
+
+        #check the frame of the attack against the target
+        self.strike(target)
+
+    def update(self, tick):
+        """Advance the animation to the given tick and end finished attacks and hits"""
+        #check what action the player is performing
+        if self.health <= 0:
+            self.health = 0
+            self.alive = False
+            self.update_action(DEATH, tick)
+        elif self.hit == True:
+            self.update_action(HIT, tick)
+        elif self.attacking == True:
+            if self.attack_type == 1:
+                self.update_action(ATTACK1, tick)
+            elif self.attack_type == 2:
+                self.update_action(ATTACK2, tick)
+            elif self.attack_type == 3:
+                self.update_action(ATTACK2, tick)#attack3 uses the attack2 animation
+        elif self.jump == True:
+            self.update_action(JUMP, tick)
+        elif self.running == True:
+            self.update_action(RUN, tick)
+        else:
+            self.update_action(IDLE, tick)
+
+        #check if enough time has passed since the last update
+        if (tick - self.update_tick) * 1000 > ANIMATION_COOLDOWN * TICK_RATE:
+            self.frame_index += 1
+            self.update_tick = tick
+        #check if the animation has finished
+        frame_count = self.animation_steps[self.action]
+        if self.frame_index >= frame_count:
+            #if the player is dead then end the animation
+            if self.alive == False:
+                self.frame_index = frame_count - 1
+            else:
+                self.frame_index = 0
+                #check if an attack was executed
+                if self.action == ATTACK1 or self.action == ATTACK2:
+                    self.attacking = False
+                    self.attack_cooldown = ATTACK_COOLDOWN
+                #check if damage was taken
+                if self.action == HIT:
+                    self.hit = False
+                    #if the player was in the middle of an attack, then the attack is stopped
+                    self.attacking = False
+                    self.attack_cooldown = ATTACK_COOLDOWN
+
+    def attack(self):
+        if self.attack_cooldown == 0:
+            #execute attack, it hits later, on the frames that reach the target
+            self.attacking = True
+            self.attack_landed = False
+
+    def hurtbox(self):
+        """(dx, dy, width, height) of the current frame that can be hit, from the rect, or None"""
+        return self.frame_boxes()[0]
+
+    def hitbox(self):
+        """(dx, dy, width, height) of the current frame that hits, from the rect, or None"""
+        return self.frame_boxes()[1]
+
+    def frame_boxes(self):
+        frames = self.boxes[self.action]
+        return frames[min(self.frame_index, len(frames) - 1)][self.flip]
+
+    def strike(self, target):
+        """Damage the target if the hitbox of the attack frame overlaps its hurtbox, once per attack"""
+        if not self.attacking or self.attack_landed or self.action not in (ATTACK1, ATTACK2):
+            return
+        if hitboxes.overlap(self.hitbox(), self.rect.x, self.rect.y, target.hurtbox(), target.rect.x, target.rect.y):
+            target.health -= ATTACK_DAMAGE
+            target.hit = True
+            self.attack_landed = True
+
+    def update_action(self, new_action, tick):
+        #check if the new action is different to the previous one
+        if new_action != self.action:
+            self.action = new_action
+            #update the animation settings
+            self.frame_index = 0
+            self.update_tick = tick
+
+    def state(self):
+        """Player state dict as stored in the server's game_state"""
+        return {
+            "x": self.rect.x,
+            "y": self.rect.y,
+            "health": self.health,
+            "action": self.action,
+            "frame_index": self.frame_index,
+            "flip": self.flip,
+            "attacking": self.attacking,
+            "hit": self.hit,
+            # Needed to replay inputs on top of this state (client-side prediction)
+            "vel_y": self.vel_y,
+            "jump": self.jump,
+            "attack_cooldown": self.attack_cooldown,
+            "attack_type": self.attack_type,
+            "attack_landed": self.attack_landed,
+            "update_tick": self.update_tick
+        }
+
+    def set_state(self, state):
+        """Continue the simulation from a state dict returned by state()"""
+        self.rect.x = state["x"]
+        self.rect.y = state["y"]
+        self.health = state["health"]
+        self.alive = state["health"] > 0
+        self.action = state["action"]
+        self.frame_index = state["frame_index"]
+        self.flip = state["flip"]
+        self.attacking = state["attacking"]
+        self.hit = state["hit"]
+        self.vel_y = state["vel_y"]
+        self.jump = state["jump"]
+        self.attack_cooldown = state["attack_cooldown"]
+        self.attack_type = state["attack_type"]
+        self.attack_landed = state["attack_landed"]
+        self.update_tick = state["update_tick"]
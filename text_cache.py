@@ -0,0 +1,44 @@
+import collections
+import io
+
+import pygame
+
+# Fonts are loaded once per (file, size) and rendered text is kept while it is reused,
+# so a label that does not change costs one blit per frame instead of a render.
+
+FONTS = {}  # (file, size) -> pygame.font.Font
+FONT_FILES = {}  # file -> its bytes, read once for all the sizes
+
+
+def get_font(path, size):
+    """Font of a file (None for pygame's default font) at a size, loaded once"""
+    font = FONTS.get((path, size))
+    if font is None:
+        source = path
+        if path is not None:
+            data = FONT_FILES.get(path)
+            if data is None:
+                with open(path, "rb") as font_file:
+                    data = FONT_FILES[path] = font_file.read()
+            source = io.BytesIO(data)
+        font = FONTS[(path, size)] = pygame.font.Font(source, size)
+    return font
+
+
+class TextCache:
+    """Least recently used cache of rendered text surfaces, keyed by (font, text, colour)"""
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.surfaces = collections.OrderedDict()
+
+    def render(self, font, text, colour):
+        """Antialiased surface of text, rendered the first time only"""
+        key = (font, text, tuple(colour))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, True, colour)
+            if len(self.surfaces) > self.max_size:
+                self.surfaces.popitem(last=False)  # Drop the least recently used text
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
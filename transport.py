@@ -0,0 +1,82 @@
+import socket
+import time
+
+from datagram import MAX_DATAGRAM_SIZE, ReliableChannel
+from framing import FrameReader, pack_frame
+
+# Client side of the two transports, both send and receive protocol messages (payloads).
+
+
+class TcpTransport:
+    """Messages framed on a TCP stream"""
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.frames = FrameReader()  # Reassembles the frames sent by the server
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def connect(self, addr):
+        self.sock.connect(addr)
+
+    def send(self, payload):
+        self.sock.sendall(pack_frame(payload))
+
+    def receive(self):
+        """Wait for data, returns the complete messages received (maybe none)
+
+        Raises socket.timeout after the timeout and ConnectionResetError when the server closed.
+        """
+        if not self.frames.recv_from(self.sock):
+            raise ConnectionResetError("Server disconnected (no data)")
+        return list(self.frames.frames())
+
+    def close(self):
+        self.sock.close()
+
+
+class UdpTransport:
+    """One message per datagram, see datagram.ReliableChannel"""
+    def __init__(self, poll_interval=0.02, server_timeout=5.0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.channel = ReliableChannel(self.send_datagram)
+        self.poll_interval = poll_interval  # Seconds between two resend checks while waiting
+        self.server_timeout = server_timeout  # Seconds without datagrams before the server is considered gone
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def connect(self, addr):
+        self.sock.connect(addr)  # Only sets the peer address, nothing is sent
+
+    def send(self, payload):
+        self.channel.send(payload)
+
+    def send_datagram(self, datagram):
+        self.sock.send(datagram)
+
+    def receive(self):
+        """Wait for data, resending lost reliable messages meanwhile, same contract as TcpTransport.receive"""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self.sock.settimeout(self.poll_interval)
+        while True:
+            self.channel.poll()
+            try:
+                payloads = self.channel.receive(self.sock.recv(MAX_DATAGRAM_SIZE))
+                if self.channel.closed:
+                    raise ConnectionResetError("Server closed the connection")
+                return payloads
+            except socket.timeout:
+                pass
+            except ConnectionRefusedError:
+                pass  # ICMP port unreachable, the server may not be up yet
+            if self.channel.idle_time() > self.server_timeout:
+                raise ConnectionResetError("Server stopped responding")
+            if deadline is not None and time.monotonic() > deadline:
+                raise socket.timeout("timed out")
+
+    def close(self):
+        self.channel.close()
+        self.sock.close()
@@ -0,0 +1,141 @@
+import asyncio # For the datagram endpoint of AsyncGameServer
+import socket # For the datagram socket of GameServer
+import threading # For the network thread of GameServer
+
+import protocol # Binary message format
+from datagram import MAX_DATAGRAM_SIZE, ReliableChannel
+from framing import iter_frames, pack_frame
+
+class UdpConnection:
+    """One UDP client, Room broadcasts to it like to a socket"""
+    def __init__(self, addr, send_to):
+        self.addr = addr
+        self.channel = ReliableChannel(lambda datagram: send_to(datagram, addr))
+        self.room = None # Room joined with OP_JOIN
+        self.player_id = None
+
+    def sendall(self, data):
+        """Send the messages of framed bytes, one datagram each"""
+        for payload in iter_frames(data):
+            self.channel.send(payload)
+        return len(data)
+
+    def close(self):
+        self.channel.close()
+
+
+class UdpPeers:
+    """UDP clients of a server, keyed by address, shared by both server front-ends"""
+    def __init__(self, lobby, send_to, timeout=5.0):
+        self.lobby = lobby
+        self.send_to = send_to # send_to(datagram, addr)
+        self.TIMEOUT = timeout # Seconds without datagrams before a client is dropped
+        self.peers = {} # addr -> UdpConnection
+
+    def datagram_received(self, data, addr):
+        """Handle one datagram from a client"""
+        peer = self.peers.get(addr)
+        if peer is None:
+            peer = self.peers[addr] = UdpConnection(addr, self.send_to)
+            print(f"Connection from {addr} (UDP)")
+        try:
+            payloads = peer.channel.receive(data)
+        except Exception as e:
+            print(f"Error reading datagram from {addr}: {e}")
+            return
+
+        for payload in payloads:
+            try:
+                if peer.room is not None:
+                    peer.room.handle_message(peer.player_id, payload)
+                elif protocol.opcode(payload) == protocol.OP_JOIN:
+                    self.join(peer, protocol.decode_join(payload))
+            except Exception as e:
+                print(f"Error processing data from {peer.player_id or addr}: {e}")
+
+        if peer.channel.closed:
+            self.drop(peer)
+
+    def join(self, peer, room_id):
+        """Put a new client in a room, same replies as the TCP handshake"""
+        room, player_id = self.lobby.join_room(peer, room_id)
+        if room is None:
+            peer.sendall(pack_frame(protocol.encode_error(player_id)))
+            return
+        peer.room = room
+        peer.player_id = player_id
+        peer.sendall(pack_frame(protocol.encode_welcome(player_id, room.room_id)))
+        print(f"{peer.addr} joined room {room.room_id} as {player_id}. Players in room: {len(room.clients)}")
+        room.broadcast_game_state() # Full snapshot for the new client
+
+    def poll(self):
+        """Resend lost reliable messages and drop silent clients, call it often"""
+        for peer in list(self.peers.values()):
+            if peer.channel.idle_time() > self.TIMEOUT:
+                print(f"{peer.player_id or peer.addr} timed out")
+                self.drop(peer)
+            else:
+                peer.channel.poll()
+
+    def drop(self, peer):
+        """Forget a client and free its room slot"""
+        self.peers.pop(peer.addr, None)
+        if peer.room is not None:
+            print(f"{peer.player_id} has disconnected from room {peer.room.room_id}")
+            self.lobby.leave_room(peer.room, peer)
+            peer.room.broadcast_game_state()
+            peer.room = None
+
+
+def serve_udp(lobby, host, port, poll_interval=0.02):
+    """Blocking UDP front-end for GameServer, run it in its own thread"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    sock.settimeout(poll_interval)
+    peers = UdpPeers(lobby, sock.sendto)
+    print(f"UDP transport listening on {host}:{port}")
+    while True:
+        try:
+            data, addr = sock.recvfrom(MAX_DATAGRAM_SIZE)
+            peers.datagram_received(data, addr)
+        except socket.timeout:
+            pass
+        except ConnectionResetError:
+            pass # ICMP port unreachable from a client that went away (Windows)
+        except Exception as e:
+            print(f"Error in UDP transport: {e}")
+        peers.poll()
+
+
+def start_udp_thread(lobby, host, port):
+    """Run serve_udp in a daemon thread"""
+    thread = threading.Thread(target=serve_udp, args=(lobby, host, port))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+class UdpProtocol(asyncio.DatagramProtocol):
+    """UDP front-end for AsyncGameServer, on the event loop"""
+    def __init__(self, lobby):
+        self.lobby = lobby
+        self.peers = None
+
+    def connection_made(self, transport):
+        self.peers = UdpPeers(self.lobby, transport.sendto)
+
+    def datagram_received(self, data, addr):
+        self.peers.datagram_received(data, addr)
+
+
+async def serve_udp_async(lobby, host, port, poll_interval=0.02):
+    """Serve UDP clients on the running event loop until cancelled"""
+    loop = asyncio.get_running_loop()
+    transport, udp = await loop.create_datagram_endpoint(lambda: UdpProtocol(lobby), local_addr=(host, port))
+    print(f"UDP transport listening on {host}:{port}")
+    try:
+        while True:
+            await asyncio.sleep(poll_interval)
+            udp.peers.poll()
+    finally:
+        transport.close()